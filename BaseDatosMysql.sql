@@ -82,14 +82,34 @@ CREATE TABLE campos_sensores (
 -- Paso 5: Tabla de registro de valores
 -- -----------------------------------------------------------
 
+-- Particionada por mes de lectura (RANGE COLUMNS): las consultas por rango de
+-- fechas solo leen los meses implicados y la retención retira meses enteros
+-- con DROP/EXCHANGE PARTITION en lugar de DELETE masivos.
+-- Restricciones de MySQL para tablas particionadas:
+--   * la PK debe incluir la columna de partición -> (id, fecha_hora_lectura)
+--   * no admite FOREIGN KEY: al borrar campos/sensores/dispositivos/proyectos
+--     la aplicación borra antes sus filas de 'valores'
+-- Solo se crea p_futuro; app/servicios/servicio_particiones.py la parte en
+-- meses (pAAAAMM) al arrancar y crea por adelantado los siguientes.
+
 CREATE TABLE valores (
-  id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  id BIGINT NOT NULL AUTO_INCREMENT,
   valor DECIMAL(15,6) NOT NULL,
   fecha_hora_lectura DATETIME NOT NULL,
   fecha_hora_registro DATETIME NULL,
   campo_id INT NOT NULL,
-  FOREIGN KEY (campo_id) REFERENCES campos_sensores(id) ON DELETE CASCADE
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+  PRIMARY KEY (id, fecha_hora_lectura)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+PARTITION BY RANGE COLUMNS (fecha_hora_lectura) (
+  PARTITION p_futuro VALUES LESS THAN (MAXVALUE)
+);
+
+-- Migración de una instalación existente (copia la tabla una vez; en horario de baja carga):
+-- ALTER TABLE valores DROP FOREIGN KEY <nombre_fk_campo_id>;
+-- ALTER TABLE valores DROP INDEX idx_valores_fecha_campo, DROP INDEX idx_valores_fecha, DROP INDEX idx_valores_campo;
+-- ALTER TABLE valores DROP PRIMARY KEY, ADD PRIMARY KEY (id, fecha_hora_lectura);
+-- ALTER TABLE valores PARTITION BY RANGE COLUMNS (fecha_hora_lectura) (PARTITION p_futuro VALUES LESS THAN (MAXVALUE));
+-- Después, POST /api/particiones/mantenimiento (o reiniciar) crea los meses.
 
 CREATE TABLE ultimo_valor_campo (
     campo_id INT PRIMARY KEY,
@@ -196,7 +216,7 @@ CREATE TABLE valores_agregados (
   campo_id INT NOT NULL,
   fecha DATE NOT NULL,
   hora TINYINT NOT NULL,
-  valor_sum DECIMAL(15,6) NULL,
+  valor_sum DECIMAL(20,6) NULL,
   valor_min DECIMAL(15,6),
   valor_max DECIMAL(15,6),
   valor_avg DECIMAL(15,6),
@@ -206,6 +226,83 @@ CREATE TABLE valores_agregados (
   FOREIGN KEY (campo_id) REFERENCES campos_sensores(id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- Marca de agua de la agregación incremental: último id de 'valores' ya
+-- fusionado en valores_agregados. cubierto_hasta = fecha de registro hasta la
+-- que todo está agregado (el planificador de resolución no usa horas posteriores).
+-- valor_sum y valor_avg se guardan para todos los campos (antes valor_sum solo
+-- para 'Movimiento'): con suma y conteo el promedio se recombina sin error.
+-- valor_sum es DECIMAL(20,6) porque ahora suma una hora de lecturas de cualquier magnitud.
+CREATE TABLE agregacion_marcas (
+  proceso VARCHAR(40) NOT NULL PRIMARY KEY,
+  ultimo_id BIGINT NOT NULL,
+  cubierto_hasta DATETIME NOT NULL,
+  actualizado_en DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Niveles pre-agregados además de la hora: 1 minuto, 15 minutos, día y mes.
+-- Misma forma en los cuatro; cubeta = inicio del periodo. Los mantiene la
+-- misma pasada incremental que valores_agregados (bajo la marca 'horaria'),
+-- cada uno con su retención (ROLLUP_RETENCION_*). primero/último sirven para
+-- contadores acumulados (energía): consumo del periodo = último - primero.
+CREATE TABLE valores_rollup_1m (
+  campo_id INT NOT NULL,
+  cubeta DATETIME NOT NULL,
+  valor_min DECIMAL(15,6) NOT NULL,
+  valor_max DECIMAL(15,6) NOT NULL,
+  valor_avg DECIMAL(15,6) NOT NULL,
+  valor_sum DECIMAL(20,6) NOT NULL,
+  total_registros INT NOT NULL,
+  valor_primero DECIMAL(15,6) NOT NULL,
+  valor_ultimo DECIMAL(15,6) NOT NULL,
+  fecha_primero DATETIME NOT NULL,
+  fecha_ultimo DATETIME NOT NULL,
+  PRIMARY KEY (campo_id, cubeta),
+  INDEX idx_rollup_1m_cubeta (cubeta),
+  FOREIGN KEY (campo_id) REFERENCES campos_sensores(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE valores_rollup_15m LIKE valores_rollup_1m;
+ALTER TABLE valores_rollup_15m
+  ADD FOREIGN KEY (campo_id) REFERENCES campos_sensores(id) ON DELETE CASCADE;
+
+CREATE TABLE valores_rollup_1d LIKE valores_rollup_1m;
+ALTER TABLE valores_rollup_1d
+  ADD FOREIGN KEY (campo_id) REFERENCES campos_sensores(id) ON DELETE CASCADE;
+
+CREATE TABLE valores_rollup_1mes LIKE valores_rollup_1m;
+ALTER TABLE valores_rollup_1mes
+  ADD FOREIGN KEY (campo_id) REFERENCES campos_sensores(id) ON DELETE CASCADE;
+
+-- Índice del archivo Parquet de lecturas frías (servicio_archivo_parquet):
+-- un día de un campo está archivado si tiene fila aquí; sus lecturas ya no
+-- están en 'valores' sino en ARCHIVO_PARQUET_DIR/<ruta>.
+CREATE TABLE valores_archivados (
+  campo_id INT NOT NULL,
+  dia DATE NOT NULL,
+  ruta VARCHAR(255) NOT NULL,
+  filas INT NOT NULL,
+  archivado_en DATETIME NOT NULL,
+  PRIMARY KEY (campo_id, dia),
+  FOREIGN KEY (campo_id) REFERENCES campos_sensores(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- -----------------------------------------------------------
+-- Paso 8.5: Paquetes recibidos (deduplicación de reintentos)
+-- -----------------------------------------------------------
+-- Un reintento del dispositivo repite id_paquete y fecha/hora de lectura.
+-- La fecha va en la clave para no descartar datos cuando el contador
+-- id_paquete se reinicia. Sin FK: un dispositivo inexistente no debe
+-- convertir el paquete en error 500.
+
+CREATE TABLE paquetes_recibidos (
+  dispositivo_id INT NOT NULL,
+  id_paquete BIGINT NOT NULL,
+  fecha_hora_lectura DATETIME NOT NULL,
+  fecha_hora_registro DATETIME NOT NULL,
+  PRIMARY KEY (dispositivo_id, id_paquete, fecha_hora_lectura),
+  INDEX idx_paquetes_registro (fecha_hora_registro)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- -----------------------------------------------------------
 -- Paso 9: Logs del sistema
 -- -----------------------------------------------------------
@@ -272,14 +369,35 @@ CREATE TABLE actividad_reciente (
 -- Paso 10: Índices críticos
 -- -----------------------------------------------------------
 
+-- 'valores' conserva un único índice secundario: todas las lecturas filtran por
+-- campo y rango de fechas. Los que empezaban por fecha los sustituye la poda
+-- de particiones, y (campo_id) solo repetía el prefijo de este.
 CREATE INDEX idx_valores_campo_fecha ON valores(campo_id, fecha_hora_lectura);
-CREATE INDEX idx_valores_fecha_campo ON valores(fecha_hora_lectura, campo_id);
-CREATE INDEX idx_valores_fecha ON valores(fecha_hora_lectura);
-CREATE INDEX idx_valores_campo ON valores(campo_id);
 CREATE INDEX idx_proyectos_usuario ON proyectos(usuario_id);
 CREATE INDEX idx_dispositivos_proyecto ON dispositivos(proyecto_id);
 CREATE INDEX idx_sensores_dispositivo ON sensores(dispositivo_id);
 
+-- -----------------------------------------------------------
+-- Paso 10.5: Índices de búsqueda (FULLTEXT con parser ngram)
+-- -----------------------------------------------------------
+-- El parser ngram (bigramas) permite buscar fragmentos dentro de una palabra,
+-- igual que el LIKE '%texto%' que sustituye, pero usando el índice.
+-- Sin stopwords: con ngram, cualquier bigrama que contenga una ("a", "i"...)
+-- no se indexaría. La variable se lee al crear el índice.
+-- MATCH() exige las mismas columnas que el índice, de ahí los índices de una sola columna.
+-- InnoDB mantiene estos índices al insertar/editar/borrar; no hay que reconstruirlos.
+
+SET SESSION innodb_ft_enable_stopword = OFF;
+
+CREATE FULLTEXT INDEX ft_dispositivos_busqueda ON dispositivos(nombre, tipo) WITH PARSER ngram;
+CREATE FULLTEXT INDEX ft_dispositivos_nombre ON dispositivos(nombre) WITH PARSER ngram;
+CREATE FULLTEXT INDEX ft_sensores_busqueda ON sensores(nombre, tipo) WITH PARSER ngram;
+CREATE FULLTEXT INDEX ft_campos_nombre ON campos_sensores(nombre) WITH PARSER ngram;
+CREATE FULLTEXT INDEX ft_proyectos_busqueda ON proyectos(nombre, descripcion) WITH PARSER ngram;
+CREATE FULLTEXT INDEX ft_proyectos_nombre ON proyectos(nombre) WITH PARSER ngram;
+
+SET SESSION innodb_ft_enable_stopword = ON;
+
 -- -----------------------------------------------------------
 -- Paso 11: Activar eventos
 -- -----------------------------------------------------------
@@ -386,6 +504,21 @@ END$$
 DELIMITER ;
 
 
+DELIMITER $$
+
+-- Los reintentos llegan en segundos/minutos: 7 días de historial sobran
+CREATE EVENT ev_purga_paquetes_recibidos
+ON SCHEDULE EVERY 1 DAY
+STARTS CURRENT_TIMESTAMP + INTERVAL 1 HOUR
+DO
+BEGIN
+    DELETE FROM paquetes_recibidos
+    WHERE fecha_hora_registro < NOW() - INTERVAL 7 DAY;
+END$$
+
+DELIMITER ;
+
+
 -- -----------------------------------------------------------
 -- Paso 13: USUARIO Y PERMISOS (Anterior Paso 11)
 -- -----------------------------------------------------------
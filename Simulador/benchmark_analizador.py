@@ -0,0 +1,100 @@
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# --- Configuración ---
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+from app.servicios.energetico.analizador_historico import AnalizadorHistorico  # noqa: E402
+
+TAMANOS = [10_000, 50_000, 100_000]   # filas de recibos sintéticos
+LOTES = 20                            # lotes distintos repartidos entre las filas
+FRACCION_ANOMALOS = 0.01              # consumos con error de escala (se corrigen x10)
+REPETICIONES = 3                      # se toma la mediana
+# ---------------------
+
+# El aviso por fila de la versión anterior no debe medir la consola
+logging.disable(logging.WARNING)
+
+
+def generar_recibos(filas: int, semilla: int = 0) -> pd.DataFrame:
+    """Recibos con la forma que devuelve la BD (periodo como texto, lote con espacios)."""
+    rng = np.random.default_rng(semilla)
+    consumo = rng.normal(45_000, 8_000, filas).clip(min=0)
+    anomalos = rng.random(filas) < FRACCION_ANOMALOS
+    consumo[anomalos] = rng.uniform(1_500, 8_000, anomalos.sum())
+    consumo[rng.random(filas) < 0.005] = 0  # meses sin consumo registrado
+    periodos = pd.date_range("2000-01-01", periods=filas // LOTES + 1, freq="MS")
+    return pd.DataFrame({
+        "periodo": np.resize(periodos.strftime("%Y-%m-%d"), filas),
+        "consumo_total_kwh": consumo.round(0),
+        "costo_total": (consumo * rng.uniform(2.5, 3.5, filas)).round(2),
+        "demanda_maxima_kw": rng.uniform(80, 200, filas).round(1),
+        "factor_potencia": rng.uniform(0.85, 0.99, filas).round(2),
+        "dias_facturados": rng.integers(28, 32, filas),
+        "kwh_punta": (consumo * 0.2).round(0),
+        "lote_nombre": [f" Lote {i % LOTES} " for i in range(filas)],
+    })
+
+
+def preparar_anterior(df: pd.DataFrame) -> pd.DataFrame:
+    """Referencia: la preparación previa (apply por fila y corrección con .loc fila a fila)."""
+    df['periodo'] = pd.to_datetime(df['periodo'], errors='coerce')
+    df['lote_nombre'] = df['lote_nombre'].astype(str).str.strip()
+    df.dropna(subset=['periodo'], inplace=True)
+    for col in AnalizadorHistorico.COLUMNAS_NUMERICAS:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df['consumo_total_kwh'] = df['consumo_total_kwh'].astype(float)
+    mediana = df['consumo_total_kwh'].median()
+    condicion = (df['consumo_total_kwh'] < mediana * 0.2) & (df['consumo_total_kwh'] < 10000) & (df['consumo_total_kwh'] > 1000)
+    for idx in df[condicion].index:
+        original = df.loc[idx, 'consumo_total_kwh']
+        logging.warning(f"{df.loc[idx, 'periodo'].strftime('%Y-%m-%d')} (lote: {df.loc[idx, 'lote_nombre']}): {original} -> {original * 10}")
+        df.loc[idx, 'consumo_total_kwh'] = original * 10
+    df = df.sort_values('periodo').reset_index(drop=True)
+    df['costo_por_kwh'] = df.apply(
+        lambda row: (row['costo_total'] / row['consumo_total_kwh']) if row['consumo_total_kwh'] and row['consumo_total_kwh'] > 0 else 0,
+        axis=1
+    ).astype(float).replace([np.inf, -np.inf], np.nan).fillna(0)
+    df['mes'] = df['periodo'].dt.month
+    df['año'] = df['periodo'].dt.year
+    return df
+
+
+def medir(funcion, df_base: pd.DataFrame):
+    tiempos, resultado = [], None
+    for _ in range(REPETICIONES):
+        df = df_base.copy()
+        inicio = time.perf_counter()
+        resultado = funcion(df)
+        tiempos.append(time.perf_counter() - inicio)
+    return float(np.median(tiempos)), resultado
+
+
+def main():
+    print(f"📊 Preparación de AnalizadorHistorico ({LOTES} lotes, {FRACCION_ANOMALOS:.0%} de consumos anómalos)")
+    for filas in TAMANOS:
+        df_base = generar_recibos(filas)
+        t_anterior, df_anterior = medir(preparar_anterior, df_base)
+        t_actual, df_actual = medir(lambda df: AnalizadorHistorico(df).df_completo, df_base)
+
+        # Mismos valores que la versión anterior (el orden de filas con igual periodo puede variar)
+        columnas = ['periodo', 'lote_nombre', 'consumo_total_kwh', 'costo_por_kwh']
+        a = df_anterior[columnas].astype({'lote_nombre': str}).sort_values(columnas).reset_index(drop=True)
+        b = df_actual[columnas].astype({'lote_nombre': str}).sort_values(columnas).reset_index(drop=True)
+        iguales = a.equals(b)
+
+        memoria_anterior = df_anterior.memory_usage(deep=True).sum() / 1e6
+        memoria_actual = df_actual.memory_usage(deep=True).sum() / 1e6
+        print(f"   {filas:>7} filas: anterior {t_anterior * 1000:8.1f} ms | vectorizado {t_actual * 1000:7.1f} ms "
+              f"| x{t_anterior / t_actual:5.1f} | memoria {memoria_anterior:5.1f} -> {memoria_actual:5.1f} MB "
+              f"| {'✅ mismos resultados' if iguales else '❌ resultados distintos'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# --- Configuración ---
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+from app.servicios.energetico.motor_ets import ajustar_ets, pronosticar_ets  # noqa: E402
+
+# Series de recibos incluidas en el repositorio (se suman por periodo)
+SERIES = {
+    "deepseek 2022-2026": sorted((RAIZ / "csv" / "data for deepseek").glob("recibos_gdmth20*DP.csv")),
+    "app/data 2021-2022": [RAIZ / "app" / "data" / "recibos" / "recibos_gdmth.csv",
+                           RAIZ / "app" / "data" / "recibos" / "recibos_gdmthIA2022.csv"],
+}
+HORIZONTE = 12      # meses reservados para validar (holdout)
+REPETICIONES = 5    # para la latencia se toma la mediana
+# ---------------------
+
+
+def cargar_serie(rutas):
+    df = pd.concat([pd.read_csv(r) for r in rutas if r.exists()], ignore_index=True)
+    df['periodo'] = pd.to_datetime(df['periodo'], errors='coerce')
+    df['consumo_total_kwh'] = pd.to_numeric(df['consumo_total_kwh'], errors='coerce')
+    df = df.dropna(subset=['periodo', 'consumo_total_kwh'])
+    # Un mes por fila, sumando lotes, igual que PredictorConsumo antes de ETS
+    return df.groupby('periodo', as_index=False)['consumo_total_kwh'].sum().sort_values('periodo').reset_index(drop=True)
+
+
+def mape(real, pred):
+    real, pred = np.asarray(real, dtype=float), np.asarray(pred, dtype=float)
+    return float(np.mean(np.abs((real - pred) / real)) * 100)
+
+
+# --- Modelos comparados: cada uno recibe (df de entrenamiento, horizonte) y devuelve el pronóstico ---
+def modelo_ets(df, h):
+    return pronosticar_ets(ajustar_ets(df['consumo_total_kwh'].to_numpy(dtype=float)), h)["media"]
+
+
+def modelo_lineal(df, h):
+    # Misma idea que PredictorConsumo._train_linear: consumo contra índice de mes
+    y = df['consumo_total_kwh'].to_numpy(dtype=float)
+    pendiente, intercepto = np.polyfit(np.arange(len(y)), y, 1)
+    return intercepto + pendiente * np.arange(len(y), len(y) + h)
+
+
+def modelo_prophet(df, h):
+    from prophet.serialize import model_from_json
+    from app.servicios.energetico.proceso_entrenamiento import ajustar_prophet
+
+    df_prophet = df[['periodo', 'consumo_total_kwh']].rename(columns={'periodo': 'ds', 'consumo_total_kwh': 'y'})
+    modelo = model_from_json(ajustar_prophet(df_prophet, len(df_prophet) >= 24))
+    futuro = modelo.make_future_dataframe(periods=h, freq='MS')
+    return modelo.predict(futuro)['yhat'].to_numpy()[-h:]
+
+
+def medir(nombre, funcion, entrenamiento, prueba):
+    tiempos = []
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        pred = funcion(entrenamiento, len(prueba))
+        tiempos.append(time.perf_counter() - inicio)
+    error = mape(prueba['consumo_total_kwh'], pred)
+    print(f"   {nombre:<10} MAPE {error:7.2f} %   ajuste+pronóstico {np.median(tiempos) * 1000:9.1f} ms")
+
+
+def main():
+    modelos = [("ets", modelo_ets), ("lineal", modelo_lineal)]
+    try:
+        import prophet  # noqa: F401
+        modelos.append(("prophet", modelo_prophet))
+    except ImportError:
+        print("⚠️ Prophet no está instalado: se compara solo ETS contra la tendencia lineal.")
+
+    for nombre_serie, rutas in SERIES.items():
+        df = cargar_serie(rutas)
+        if len(df) <= HORIZONTE + 4:
+            print(f"⚠️ {nombre_serie}: {len(df)} meses, insuficientes para un holdout de {HORIZONTE}.")
+            continue
+        entrenamiento, prueba = df.iloc[:-HORIZONTE], df.iloc[-HORIZONTE:]
+        print(f"\n📊 {nombre_serie}: {len(entrenamiento)} meses de entrenamiento, {len(prueba)} de validación")
+        for nombre, funcion in modelos:
+            try:
+                medir(nombre, funcion, entrenamiento, prueba)
+            except Exception as e:
+                print(f"   {nombre:<10} ❌ {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,11 @@ CSV_FILE = "DATOS2_2.csv"
 ID_PROYECTO_PRUEBA = "1" # Basado en tu JSON de ejemplo
 ID_D9SPOSITIVO_PRUEBA = "1" # Basado en tu JSON de ejemplo
 MAX_CONCURRENT_REQUESTS = 100 # Número de solicitudes a enviar al mismo tiempo
+
+# Modo lote: envía muchos paquetes por petición a /guardar_json/lote/
+USAR_LOTE = True
+API_URL_LOTE = "http://127.0.0.1:8001/api/guardar_json/lote/"
+PAQUETES_POR_LOTE = 1000
 # ---------------------
 
 def transformar_fila_a_json(row):
@@ -76,6 +81,23 @@ async def send_request(session, payload, semaphore):
             print(f"Error de conexión en Paquete {payload['id_paquete']}: {e}", file=sys.stderr)
             return None # Retorna None si la solicitud falla
 
+async def send_batch(session, lote, semaphore):
+    """
+    Envía un arreglo de paquetes al endpoint de lote.
+    Devuelve la cantidad de paquetes sin errores según la respuesta del servidor.
+    """
+    async with semaphore:
+        try:
+            async with session.post(API_URL_LOTE, json=lote, timeout=300) as response:
+                if response.status != 200:
+                    print(f"Error en lote (paquetes {lote[0]['id_paquete']}..{lote[-1]['id_paquete']}): HTTP {response.status}", file=sys.stderr)
+                    return 0
+                resumen = await response.json()
+                return len(lote) - resumen.get("paquetes_con_error", 0)
+        except Exception as e:
+            print(f"Error de conexión en lote desde paquete {lote[0]['id_paquete']}: {e}", file=sys.stderr)
+            return 0
+
 async def main():
     print("Iniciando carga masiva de datos...")
     
@@ -109,9 +131,14 @@ async def main():
     start_time = time.time()
     
     async with aiohttp.ClientSession() as session:
-        # Crear todas las "tareas" (una por cada solicitud)
-        for payload in payloads:
-            tasks.append(send_request(session, payload, semaphore))
+        if USAR_LOTE:
+            # Una petición por cada PAQUETES_POR_LOTE paquetes
+            for i in range(0, total_requests, PAQUETES_POR_LOTE):
+                tasks.append(send_batch(session, payloads[i:i + PAQUETES_POR_LOTE], semaphore))
+        else:
+            # Crear todas las "tareas" (una por cada solicitud)
+            for payload in payloads:
+                tasks.append(send_request(session, payload, semaphore))
         
         # Ejecutar todas las tareas concurrentemente
         results = await asyncio.gather(*tasks)
@@ -119,7 +146,10 @@ async def main():
     # --- 3. Reportar resultados ---
     end_time = time.time()
     
-    count_success = sum(1 for r in results if r in (200, 201))
+    if USAR_LOTE:
+        count_success = sum(results)
+    else:
+        count_success = sum(1 for r in results if r in (200, 201))
     count_fail = total_requests - count_success
     
     print("\n" + "="*30)
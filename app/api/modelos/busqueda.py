@@ -0,0 +1,17 @@
+# app/api/modelos/busqueda.py
+from pydantic import BaseModel
+from typing import List, Optional
+
+class ResultadoBusqueda(BaseModel):
+    tipo: str                 # 'proyecto', 'dispositivo', 'sensor' o 'campo'
+    id: int
+    nombre: str
+    proyecto_id: int
+    nombre_proyecto: str
+    padre_id: Optional[int] = None  # dispositivo -> proyecto, sensor -> dispositivo, campo -> sensor
+    relevancia: float
+
+class RespuestaBusqueda(BaseModel):
+    query: str
+    data: List[ResultadoBusqueda]
+    total: int
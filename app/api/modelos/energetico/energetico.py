@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import date, datetime # Importar date y datetime
 
 # ====================================================================
@@ -80,6 +80,11 @@ class EscenarioPayload(BaseModel):
         le=120   # ⬅️ Límite máximo de 10 años
     )
 
+    modelo: Literal["auto", "ets", "prophet", "lineal"] = Field(
+        default="auto",
+        description="Modelo de proyección: 'auto' usa ETS con series cortas y Prophet con las largas."
+    )
+
     class Config:
         json_schema_extra = {
             "example": {
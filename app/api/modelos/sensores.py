@@ -59,4 +59,8 @@ class RespuestaPaginadaSensores(BaseModel):
     total: int
     page: int
     limit: int
-    total_pages: int
\ No newline at end of file
+    total_pages: int
+    # Solo en modo cursor (after_id)
+    after_id: Optional[int] = None
+    next_after_id: Optional[int] = None
+    has_more: Optional[bool] = None
\ No newline at end of file
@@ -0,0 +1,40 @@
+# app/api/rutas/busqueda/busqueda.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+
+from app.servicios.auth_utils import get_current_user_id
+from app.servicios.servicio_busqueda import buscar_global_db, TIPOS_BUSQUEDA
+from app.api.modelos.busqueda import RespuestaBusqueda
+
+router_busqueda = APIRouter()
+
+# -----------------------------------------------------------
+# ENDPOINT: Búsqueda global (cuadro de búsqueda de la barra superior)
+# -----------------------------------------------------------
+@router_busqueda.get("/buscar", response_model=RespuestaBusqueda)
+async def buscar(
+    q: str = Query(..., min_length=1, max_length=100, description="Texto a buscar en los nombres"),
+    limit: int = Query(20, ge=1, le=100, description="Máximo de resultados"),
+    tipos: Optional[str] = Query(None, description=f"Separados por coma: {', '.join(TIPOS_BUSQUEDA)}"),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Busca proyectos, dispositivos, sensores y campos por nombre usando los
+    índices FULLTEXT (Paso 10.5 del esquema), solo dentro de los proyectos
+    del usuario (dueño o invitado). Ordena por coincidencia exacta, prefijo
+    y relevancia.
+    """
+    lista_tipos = None
+    if tipos:
+        lista_tipos = [t.strip() for t in tipos.split(",") if t.strip()]
+        invalidos = [t for t in lista_tipos if t not in TIPOS_BUSQUEDA]
+        if invalidos:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Tipos no válidos: {', '.join(invalidos)}. Use: {', '.join(TIPOS_BUSQUEDA)}"
+            )
+
+    try:
+        return await buscar_global_db(current_user_id, q, limit, lista_tipos)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en la búsqueda: {str(e)}")
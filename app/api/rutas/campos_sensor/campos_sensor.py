@@ -7,20 +7,26 @@ import pymysql
 
 from app.servicios.auth_utils import get_current_user_id
 from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import en_hilo_db
 from app.api.modelos.campos_sensores import CampoSensor, CampoSensorCrear, CampoSensorActualizar
 
 from app.servicios.servicio_permisos import (
     verificar_permiso_proyecto,
     obtener_proyecto_id_desde_sensor, # Para GET y POST (tenemos sensor_id)
      obtener_rol_usuario_en_proyecto,
-    obtener_proyecto_id_desde_campo   # Para PUT y DELETE (tenemos campo_id)
+    obtener_proyecto_id_desde_campo,   # Para PUT y DELETE (tenemos campo_id)
+    cache_permisos
 )
 
-from app.servicios.servicio_actividad import registrar_actividad_db
+from app.servicios.servicio_actividad import registrar_actividad_con
+from app.servicios.servicio_ingesta import indice_campos
+from app.servicios.servicio_detector_anomalias import detector_anomalias
+from app.servicios.servicio_ultimos_valores import cache_ultimos_valores
 router_campos = APIRouter()
 
 
-async def obtener_campos_por_sensor_db(sensor_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_campos_por_sensor_db(sensor_id: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection()
@@ -57,7 +63,8 @@ async def obtener_campos_por_sensor_db(sensor_id: int) -> List[Dict[str, Any]]:
 
         
 # POST: Crear un nuevo campo
-async def set_campo_sensor_db(datos: CampoSensorCrear, usuario_id: int) -> Dict[str, Any]:
+@en_hilo_db
+def set_campo_sensor_db(datos: CampoSensorCrear, usuario_id: int) -> Dict[str, Any]:
     conn = None
     try:
         conn = get_db_connection()
@@ -69,6 +76,7 @@ async def set_campo_sensor_db(datos: CampoSensorCrear, usuario_id: int) -> Dict[
         SELECT 
             s.id AS sensor_id, 
             s.nombre AS sensor_nombre,
+            s.dispositivo_id,
             d.proyecto_id,
             d.nombre AS dispositivo_nombre
         FROM sensores s
@@ -98,9 +106,10 @@ async def set_campo_sensor_db(datos: CampoSensorCrear, usuario_id: int) -> Dict[
         )
         id_insertado = conn.insert_id()
         conn.commit()
+        indice_campos.invalidar_dispositivo(sensor_padre['dispositivo_id'])
 
 
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=usuario_id,
             proyecto_id=proyecto_id_padre,
             tipo_evento='CAMPO_CREADO',
@@ -126,7 +135,8 @@ async def set_campo_sensor_db(datos: CampoSensorCrear, usuario_id: int) -> Dict[
 
 
 # PUT: Actualizar un campo de sensor
-async def actualizar_campo_sensor_db(
+@en_hilo_db
+def actualizar_campo_sensor_db(
     id: int, 
     datos: CampoSensorActualizar, 
     usuario_id: int 
@@ -142,6 +152,7 @@ async def actualizar_campo_sensor_db(
         SELECT 
             cs.nombre AS nombre_campo,
             s.nombre AS nombre_sensor,
+            s.dispositivo_id,
             d.proyecto_id
         FROM campos_sensores cs
         JOIN sensores s ON cs.sensor_id = s.id
@@ -180,11 +191,15 @@ async def actualizar_campo_sensor_db(
         cursor.execute(sql_update, valores)
         row_count = cursor.rowcount # Capturar filas afectadas
         conn.commit() # 👈 Transacción completada
+        indice_campos.invalidar_dispositivo(info_campo['dispositivo_id'])
+        # Nombre/tipo deciden si el detector lo trata como movimiento
+        detector_anomalias.invalidar(id)
+        cache_ultimos_valores.invalidar(id)
         
        
         nombre_para_log = datos.nombre if datos.nombre is not None else nombre_actual_campo
 
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=usuario_id,
             proyecto_id=proyecto_id_padre,
             tipo_evento='CAMPO_MODIFICADO',
@@ -209,7 +224,8 @@ async def actualizar_campo_sensor_db(
 
 
 # DELETE: Eliminar un campo de sensor
-async def eliminar_campo_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
+@en_hilo_db
+def eliminar_campo_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
     conn = None
     try:
         conn = get_db_connection()
@@ -221,6 +237,7 @@ async def eliminar_campo_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
         SELECT 
             cs.nombre AS nombre_campo,
             s.nombre AS nombre_sensor,
+            s.dispositivo_id,
             d.proyecto_id
         FROM campos_sensores cs
         JOIN sensores s ON cs.sensor_id = s.id
@@ -243,9 +260,13 @@ async def eliminar_campo_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
         cursor.execute("DELETE FROM campos_sensores WHERE id = %s", (id,))
         
         conn.commit() 
+        indice_campos.invalidar_dispositivo(info_campo['dispositivo_id'])
+        detector_anomalias.invalidar(id)
+        cache_ultimos_valores.invalidar(id)
+        cache_permisos.invalidar_ancestro("campo", id)
         
    
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=usuario_id,
             proyecto_id=proyecto_id_padre,
             tipo_evento='CAMPO_ELIMINADO',
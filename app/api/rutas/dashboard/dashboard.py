@@ -5,6 +5,7 @@ import pymysql
 
 from app.servicios.auth_utils import get_current_user_id
 from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import en_hilo_db
 from app.api.modelos.dashboard import ResumenKPIs,EstadoDispositivos,ActividadRecienteItem # Importa el nuevo modelo
 
 # Crea un nuevo router
@@ -50,7 +51,8 @@ async def get_actividad_reciente(
 # -----------------------------------------------------------
 
 
-async def obtener_actividad_reciente_db(usuario_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_actividad_reciente_db(usuario_id: int) -> List[Dict[str, Any]]:
     """
     Obtiene los 5 eventos más recientes DIRECTAMENTE de la tabla de actividad.
     """
@@ -82,7 +84,8 @@ async def obtener_actividad_reciente_db(usuario_id: int) -> List[Dict[str, Any]]
 
 # (Añadir a tu router_dashboard)
 @router_dashboard.get("/dashboard/estado-dispositivos", response_model=EstadoDispositivos)
-async def get_estado_dispositivos(
+@en_hilo_db
+def get_estado_dispositivos(
     current_user_id: int = Depends(get_current_user_id)
 ):
     conn = None
@@ -109,7 +112,8 @@ async def get_estado_dispositivos(
 # -----------------------------------------------------------
 # FUNCIÓN DE SERVICIO (Lógica de Base de Datos)
 # -----------------------------------------------------------
-async def obtener_conteo_kpis_db(usuario_id: int) -> Dict[str, Any]:
+@en_hilo_db
+def obtener_conteo_kpis_db(usuario_id: int) -> Dict[str, Any]:
     """
     Ejecuta múltiples consultas COUNT para obtener los KPIs del dashboard.
     """
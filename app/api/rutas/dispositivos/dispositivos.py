@@ -8,10 +8,12 @@ import pymysql
 from app.servicios.auth_utils import get_current_user_id 
 from app.configuracion import configuracion
 from app.servicios.servicio_simulacion import get_db_connection, simular_datos_json
+from app.db.ejecutor_db import en_hilo_db
 from app.api.modelos.dispositivos import DispositivoCrear, DispositivoActualizar,Dispositivo, Sensor, CampoSensor,DispositivoGeneral
 from app.servicios import servicio_simulacion as servicio_simulacion 
-from app.servicios.servicio_actividad import registrar_actividad_db
-from app.servicios.servicio_permisos import verificar_permiso_proyecto, obtener_proyecto_id_desde_dispositivo,obtener_rol_usuario_en_proyecto
+from app.servicios.servicio_actividad import registrar_actividad_con
+from app.servicios.servicio_ingesta import indice_campos
+from app.servicios.servicio_permisos import verificar_permiso_proyecto, obtener_proyecto_id_desde_dispositivo,obtener_rol_usuario_en_proyecto, cache_permisos
 
 # Importamos TODAS las funciones del servicio (incluyendo Resumen)
 from app.servicios.servicio_dispositivos import (
@@ -31,17 +33,20 @@ async def obtener_todos_los_dispositivos(
     page: int = Query(1, ge=1, description="Número de página"),
     limit: int = Query(10, ge=1, le=100, description="Registros por página"),
     search: str = Query("", description="Término de búsqueda"),
+    after_id: Optional[int] = Query(None, ge=0, description="Modo cursor: 0 para la primera página, luego el next_after_id recibido"),
     current_user_id: int = Depends(get_current_user_id)
 ):
     """
     Obtiene todos los dispositivos accesibles.
+    Para listas grandes usar after_id (0 y luego el next_after_id de cada
+    respuesta): cada página cuesta lo mismo sin importar la profundidad.
     OPTIMIZACIÓN: Devuelve los roles agrupados por proyecto en 'roles_context'
     para evitar repetir el dato en cada dispositivo.
     """
     try:
         # 1. Obtener datos crudos de la DB (paginados)
         resultado = await obtener_dispositivos_globales_paginado_db(
-            current_user_id, page, limit, search
+            current_user_id, page, limit, search, after_id
         )
         
         dispositivos = resultado["data"]
@@ -307,7 +312,8 @@ async def get_dispositivo_por_id(
 # 3. FUNCIONES DE BASE DE DATOS (SERVICIO DE DATOS BASE)
 # ------------------------------------------------------------------
 
-async def set_dispositivo(datos: DispositivoCrear, usuario_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def set_dispositivo(datos: DispositivoCrear, usuario_id: int) -> List[Dict[str, Any]]:
     procesado = []
     conn = None
     try:
@@ -335,7 +341,7 @@ async def set_dispositivo(datos: DispositivoCrear, usuario_id: int) -> List[Dict
         conn.commit() # 
 
         
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=usuario_id,           
             proyecto_id=datos.proyecto_id,   
             tipo_evento='DISPOSITIVO_CREADO',
@@ -356,7 +362,8 @@ async def set_dispositivo(datos: DispositivoCrear, usuario_id: int) -> List[Dict
         if conn: conn.close()
     return procesado
 
-async def actualizar_datos_dispositivo(
+@en_hilo_db
+def actualizar_datos_dispositivo(
     dispositivo_id: int, 
     datos: DispositivoActualizar, 
     usuario_id: int 
@@ -417,7 +424,7 @@ async def actualizar_datos_dispositivo(
         # Determinar qué nombre usar para el log (el nuevo o el viejo)
         nombre_para_log = datos.nombre if datos.nombre is not None else nombre_actual_dispositivo
 
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=usuario_id,
             proyecto_id=proyecto_id_padre,
             tipo_evento='DISPOSITIVO_MODIFICADO',
@@ -437,7 +444,8 @@ async def actualizar_datos_dispositivo(
     return procesado
 
 # Función de Eliminación de Dispositivo
-async def eliminar_dispositivo_db(id: Optional[int], proyecto_id: int, usuario_id: int) -> Dict:
+@en_hilo_db
+def eliminar_dispositivo_db(id: Optional[int], proyecto_id: int, usuario_id: int) -> Dict:
     conn = None
     try:
         conn = get_db_connection()
@@ -475,7 +483,8 @@ async def eliminar_dispositivo_db(id: Optional[int], proyecto_id: int, usuario_i
 
             for sensor in sensores:
                 sensor_id = sensor["id"]
-               
+                # 'valores' está particionada y no tiene FK: sus filas se borran a mano
+                cursor.execute("DELETE FROM valores WHERE campo_id IN (SELECT id FROM campos_sensores WHERE sensor_id = %s)", (sensor_id,))
                 cursor.execute("DELETE FROM campos_sensores WHERE sensor_id = %s", (sensor_id,))
             
             # 2. Eliminar Sensores
@@ -486,7 +495,10 @@ async def eliminar_dispositivo_db(id: Optional[int], proyecto_id: int, usuario_i
 
         conn.commit() 
         for dispositivo in dispositivos_a_eliminar:
-            await registrar_actividad_db(
+            indice_campos.invalidar_dispositivo(dispositivo['id'])
+            cache_permisos.invalidar_ancestro("dispositivo", dispositivo['id'])
+        for dispositivo in dispositivos_a_eliminar:
+            registrar_actividad_con(conn,
                 usuario_id=usuario_id,
                 proyecto_id=proyecto_id,
                 tipo_evento='DISPOSITIVO_ELIMINADO',
@@ -1,21 +1,29 @@
-from fastapi import APIRouter, HTTPException, Query,Body, Depends, logger
-from typing import Dict, Any,List, Optional
+import json
+from fastapi import APIRouter, HTTPException, Query,Body, Depends, Request, logger
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any,List, Optional, Literal
 
 from app.servicios.energetico.analizador_historico import AnalizadorHistorico
 from app.servicios.energetico.predictor_consumo import PredictorConsumo
 from app.servicios.energetico.generador_escenarios import GeneradorEscenarios
+from app.servicios.energetico.ejecutor_modelos import ErrorEntrenamiento
+from app.servicios.energetico.trabajos_pronostico import gestor_trabajos_pronostico, ESTADOS_FINALES
 
 from app.api.modelos.energetico.energetico import EscenarioPayload
 
 from app.servicios.energetico.dependencias import get_generador_escenarios
 from app.servicios.energetico.dependencias import get_analizador
-from app.servicios.auth_utils import get_current_user_id 
+from app.servicios.auth_utils import get_current_user_id, get_current_user_id_flujo
 from app.db.crud.recibos_crud import get_nombres_lotes_by_user_id 
+from app.db.ejecutor_db import ejecutar_db
 import logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/energetico", tags=["Predicciones Energéticas"])
 
+# Modelo de proyección por petición (ver PredictorConsumo.train)
+ModeloProyeccion = Literal["auto", "ets", "prophet", "lineal"]
+
 @router.get("/lotes_disponibles", 
             response_model=List[str], # El endpoint devolverá una lista de strings
             summary="Obtiene la lista de nombres de lotes de recibos disponibles para el usuario actual")
@@ -28,7 +36,7 @@ async def obtener_lotes_disponibles(
     """
     logger.info(f"[{user_id}] Solicitud para obtener lotes disponibles.")
     try:
-        nombres_lotes = get_nombres_lotes_by_user_id(user_id)
+        nombres_lotes = await ejecutar_db(get_nombres_lotes_by_user_id, user_id)
         if not nombres_lotes:
             logger.warning(f"[{user_id}] No se encontraron lotes para el usuario.")
             return [] # Devuelve una lista vacía si no hay lotes
@@ -72,6 +80,8 @@ async def simular_escenario_con_lotes_o_todos(
     except HTTPException as e:
         logger.error(f"[{user_id}] HTTPException en simular_escenario: {e.detail}")
         raise e
+    except ErrorEntrenamiento:
+        raise
     except Exception as e:
         import traceback
         logger.error(f"[{user_id}] Error inesperado en el endpoint simular_escenario: {traceback.format_exc()}", exc_info=True)
@@ -102,7 +112,9 @@ async def obtener_recomendaciones_optimizacion():
 @router.get("/proyecciones/mejorada")
 async def proyeccion_mejorada(
     meses: int = Query(6, description="Meses a predecir", ge=1, le=24),
-    analizador: AnalizadorHistorico = Depends(get_analizador) # 3. Inyectar el analizador
+    analizador: AnalizadorHistorico = Depends(get_analizador), # 3. Inyectar el analizador
+    user_id: int = Depends(get_current_user_id),
+    modelo: ModeloProyeccion = Query("auto", description="Modelo: auto (ETS en series cortas, Prophet en largas), ets, prophet o lineal")
 ):
     """Proyección mejorada que usa el mejor modelo disponible"""
     try:
@@ -110,21 +122,15 @@ async def proyeccion_mejorada(
         if not analizador._datos_cargados():
             raise HTTPException(status_code=400, detail="No hay datos históricos disponibles")
                
-        predictor = PredictorConsumo()
-        
-        # Si tenemos pocos datos, usar tendencia lineal (más preciso)
-        if len(analizador.df) < 18:  # Menos de 1.5 años
-            resultado = await predictor.predecir_tendencia_lineal(analizador.df, meses)
-            modelo_usado = "tendencia_lineal"
-        else:
-            # Si tenemos suficientes datos, usar Prophet
-            entrenado = await predictor.entrenar_modelo_prophet(analizador.df)
-            if entrenado:
-                resultado = await predictor.predecir_consumo(meses)
-                modelo_usado = "prophet"
-            else:
-                resultado = await predictor.predecir_tendencia_lineal(analizador.df, meses)
-                modelo_usado = "tendencia_lineal_fallback"
+        # train() elige el modelo ("auto": ETS con series cortas, Prophet con fallback
+        # lineal en otro caso). Con datos sin cambios sale del registro.
+        predictor = PredictorConsumo(user_id=user_id)
+        entrenamiento = await predictor.train(analizador.df_completo, modelo=modelo)
+        if 'error' in entrenamiento:
+            raise HTTPException(status_code=500, detail=entrenamiento['error'])
+
+        resultado = await predictor.predecir_consumo_kwh(meses)
+        modelo_usado = predictor.modelo_usado
         
         # Añadir información del modelo usado
         if 'error' not in resultado:
@@ -136,27 +142,31 @@ async def proyeccion_mejorada(
             "message": f"Proyección mejorada ({modelo_usado}) para {meses} meses generada correctamente"
         }
         
+    except ErrorEntrenamiento:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en proyección mejorada: {str(e)}")
     
 @router.get("/proyecciones/consumo")
 async def proyeccion_consumo(
     meses: int = Query(12, description="Meses a predecir", ge=1, le=36),
-    analizador: AnalizadorHistorico = Depends(get_analizador) # 3. Inyectar
+    analizador: AnalizadorHistorico = Depends(get_analizador), # 3. Inyectar
+    user_id: int = Depends(get_current_user_id),
+    modelo: ModeloProyeccion = Query("auto", description="Modelo: auto (ETS en series cortas, Prophet en largas), ets, prophet o lineal")
 ):
     """Proyección de consumo energético para los próximos meses"""
     try:
         # analizador = AnalizadorHistorico() # 4. Eliminar
         if not analizador._datos_cargados():
             raise HTTPException(status_code=400, detail="No hay datos históricos disponibles")        
-        # Entrenar modelo y predecir
-        predictor = PredictorConsumo()
-        entrenado = await predictor.entrenar_modelo_prophet(analizador.df)
+        # Entrenar modelo (o recuperarlo del registro) y predecir
+        predictor = PredictorConsumo(user_id=user_id)
+        entrenamiento = await predictor.train(analizador.df_completo, modelo=modelo)
         
-        if not entrenado:
+        if 'error' in entrenamiento:
             raise HTTPException(status_code=500, detail="Error entrenando modelo predictivo")
         
-        resultado = await predictor.predecir_consumo(meses)
+        resultado = await predictor.predecir_consumo_kwh(meses)
         
         return {
             "status": "success",
@@ -164,27 +174,29 @@ async def proyeccion_consumo(
             "message": f"Proyección de consumo para {meses} meses generada correctamente"
         }
         
+    except ErrorEntrenamiento:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en proyección: {str(e)}")
 
 @router.get("/proyecciones/costo")
 async def proyeccion_costo(
     meses: int = Query(12, description="Meses a predecir", ge=1, le=36),
-    analizador: AnalizadorHistorico = Depends(get_analizador) # 3. Inyectar
+    analizador: AnalizadorHistorico = Depends(get_analizador), # 3. Inyectar
+    user_id: int = Depends(get_current_user_id),
+    modelo: ModeloProyeccion = Query("auto", description="Modelo: auto (ETS en series cortas, Prophet en largas), ets, prophet o lineal")
 ):
     """Proyección de costos energéticos para los próximos meses"""
     try:
         # analizador = AnalizadorHistorico() # 4. Eliminar
         if not analizador._datos_cargados():
             raise HTTPException(status_code=400, detail="No hay datos históricos disponibles")      
-        # Entrenar modelo y predecir costos
-        predictor = PredictorConsumo()
-        entrenado = await predictor.entrenar_modelo_prophet(analizador.df)
-        
-        if not entrenado:
-            raise HTTPException(status_code=500, detail="Error entrenando modelo predictivo")
+        # predecir_costo entrena (o recupera del registro) antes de predecir
+        predictor = PredictorConsumo(user_id=user_id)
+        resultado = await predictor.predecir_costo(analizador.df_completo, meses, modelo=modelo)
         
-        resultado = await predictor.predecir_costo(analizador.df, meses)
+        if 'error' in resultado:
+            raise HTTPException(status_code=500, detail=resultado['error'])
         
         return {
             "status": "success",
@@ -192,28 +204,32 @@ async def proyeccion_costo(
             "message": f"Proyección de costos para {meses} meses generada correctamente"
         }
         
+    except ErrorEntrenamiento:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en proyección de costos: {str(e)}")
 
 @router.get("/proyecciones/completa")
 async def proyeccion_completa(
     meses: int = Query(12, description="Meses a predecir", ge=1, le=36),
-    analizador: AnalizadorHistorico = Depends(get_analizador) # 3. Inyectar
+    analizador: AnalizadorHistorico = Depends(get_analizador), # 3. Inyectar
+    user_id: int = Depends(get_current_user_id),
+    modelo: ModeloProyeccion = Query("auto", description="Modelo: auto (ETS en series cortas, Prophet en largas), ets, prophet o lineal")
 ):
     """Proyección completa (consumo + costo) para los próximos meses"""
     try:
         # analizador = AnalizadorHistorico() # 4. Eliminar
         if not analizador._datos_cargados():
             raise HTTPException(status_code=400, detail="No hay datos históricos disponibles")        
-        predictor = PredictorConsumo()
-        entrenado = await predictor.entrenar_modelo_prophet(analizador.df)
+        predictor = PredictorConsumo(user_id=user_id)
+        entrenamiento = await predictor.train(analizador.df_completo, modelo=modelo)
         
-        if not entrenado:
+        if 'error' in entrenamiento:
             raise HTTPException(status_code=500, detail="Error entrenando modelo predictivo")
         
-        # Obtener ambas proyecciones
-        consumo_result = await predictor.predecir_consumo(meses)
-        costo_result = await predictor.predecir_costo(analizador.df, meses)
+        # Obtener ambas proyecciones (el segundo entrenamiento sale del registro)
+        consumo_result = await predictor.predecir_consumo_kwh(meses)
+        costo_result = await predictor.predecir_costo(analizador.df_completo, meses, modelo=modelo)
         
         return {
             "status": "success",
@@ -222,13 +238,15 @@ async def proyeccion_completa(
                 "proyeccion_costo": costo_result,
                 "resumen": {
                     "meses_predichos": meses,
-                    "ultimo_periodo_historico": analizador.df['periodo'].max().strftime('%Y-%m-%d'),
-                    "total_registros_entrenamiento": len(analizador.df)
+                    "ultimo_periodo_historico": analizador.df_completo['periodo'].max().strftime('%Y-%m-%d'),
+                    "total_registros_entrenamiento": len(analizador.df_completo)
                 }
             },
             "message": f"Proyección completa para {meses} meses generada correctamente"
         }
         
+    except ErrorEntrenamiento:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en proyección completa: {str(e)}")
 
@@ -276,4 +294,126 @@ async def analisis_automatico_ia(analizador: AnalizadorHistorico = Depends(get_a
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error en análisis automático: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error en análisis automático: {str(e)}")
+
+
+### TRABAJOS ASÍNCRONOS (proyecciones y escenarios fuera de la petición) ###
+
+# tipo -> (ruta síncrona que hace el cálculo, meses máximos que admite)
+PROYECCIONES_TRABAJO = {
+    "mejorada": (proyeccion_mejorada, 24),
+    "consumo": (proyeccion_consumo, 36),
+    "costo": (proyeccion_costo, 36),
+    "completa": (proyeccion_completa, 36),
+}
+
+
+def _respuesta_envio(trabajo: Dict[str, Any], deduplicado: bool) -> Dict[str, Any]:
+    return {
+        "trabajo_id": trabajo["id"],
+        "estado": trabajo["estado"],
+        "deduplicado": deduplicado,
+        "url_estado": f"/energetico/trabajos/{trabajo['id']}",
+        "url_stream": f"/energetico/trabajos/{trabajo['id']}/stream",
+    }
+
+
+def _evento_sse(tipo: str, datos: Any) -> str:
+    return f"event: {tipo}\ndata: {json.dumps(datos, default=str)}\n\n"
+
+
+@router.post("/trabajos/proyecciones/{tipo}", status_code=202)
+async def enviar_trabajo_proyeccion(
+    tipo: str,
+    meses: int = Query(12, description="Meses a predecir", ge=1, le=36),
+    modelo: ModeloProyeccion = Query("auto", description="Modelo: auto, ets, prophet o lineal"),
+    analizador: AnalizadorHistorico = Depends(get_analizador),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Encola una proyección (mejorada, consumo, costo o completa) y responde al
+    instante con el id del trabajo. El resultado es el mismo que el de
+    GET /proyecciones/{tipo}; se consulta en /trabajos/{id} o /trabajos/{id}/stream.
+    """
+    if tipo not in PROYECCIONES_TRABAJO:
+        raise HTTPException(status_code=404, detail=f"Tipo de proyección desconocido: {tipo}")
+    ruta, max_meses = PROYECCIONES_TRABAJO[tipo]
+    if meses > max_meses:
+        raise HTTPException(status_code=422, detail=f"La proyección '{tipo}' admite como máximo {max_meses} meses")
+    if not analizador._datos_cargados():
+        raise HTTPException(status_code=400, detail="No hay datos históricos disponibles")
+
+    trabajo, deduplicado = gestor_trabajos_pronostico.enviar(
+        user_id, f"proyeccion_{tipo}", (meses, modelo),
+        lambda: ruta(meses=meses, analizador=analizador, user_id=user_id, modelo=modelo)
+    )
+    logger.info(f"[{user_id}] Trabajo de proyección '{tipo}' ({meses} meses, {modelo}): {trabajo['id']} (deduplicado={deduplicado})")
+    return _respuesta_envio(trabajo, deduplicado)
+
+
+@router.post("/trabajos/simular/escenario_personalizado", status_code=202)
+async def enviar_trabajo_escenario(
+    payload: EscenarioPayload = Body(..., description="Parámetros de inflación, crecimiento y eficiencia, incluyendo lotes y horizonte"),
+    generador_escenarios: GeneradorEscenarios = Depends(get_generador_escenarios),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Encola una simulación de escenario (mismo resultado que /simular/escenario_personalizado)."""
+    if not payload.lotes_seleccionados:
+        raise HTTPException(status_code=400, detail="Debes seleccionar al menos un lote de datos para la simulación.")
+
+    trabajo, deduplicado = gestor_trabajos_pronostico.enviar(
+        user_id, "escenario_personalizado", payload.model_dump_json(),
+        lambda: simular_escenario_con_lotes_o_todos(payload=payload, generador_escenarios=generador_escenarios, user_id=user_id)
+    )
+    logger.info(f"[{user_id}] Trabajo de escenario: {trabajo['id']} (deduplicado={deduplicado})")
+    return _respuesta_envio(trabajo, deduplicado)
+
+
+@router.get("/trabajos/{trabajo_id}")
+async def obtener_trabajo(
+    trabajo_id: str,
+    user_id: int = Depends(get_current_user_id)
+):
+    """Estado del trabajo; con estado 'completado' incluye el resultado y con 'error' el detalle."""
+    trabajo = gestor_trabajos_pronostico.obtener(trabajo_id, user_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o expirado")
+    return trabajo
+
+
+@router.get("/trabajos/{trabajo_id}/stream")
+async def stream_trabajo(
+    trabajo_id: str,
+    request: Request,
+    user_id: int = Depends(get_current_user_id_flujo)
+):
+    """
+    Server-Sent Events del trabajo: 'estado' al conectar y cada pocos segundos
+    mientras corre, y al terminar 'resultado' (o 'error') y fin del flujo.
+    Acepta el token como ?token= porque EventSource no envía cabeceras.
+    """
+    if gestor_trabajos_pronostico.obtener(trabajo_id, user_id) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o expirado")
+
+    async def generador():
+        while True:
+            trabajo = gestor_trabajos_pronostico.obtener(trabajo_id, user_id)
+            if trabajo is None:
+                yield _evento_sse("error", {"status_code": 404, "detail": "Trabajo expirado"})
+                return
+            if trabajo["estado"] in ESTADOS_FINALES:
+                if trabajo["estado"] == "completado":
+                    yield _evento_sse("resultado", trabajo)
+                else:
+                    yield _evento_sse("error", trabajo)
+                return
+            yield _evento_sse("estado", {"trabajo_id": trabajo_id, "estado": trabajo["estado"]})
+            terminado = await gestor_trabajos_pronostico.esperar(trabajo_id, timeout=15.0)
+            if not terminado and await request.is_disconnected():
+                return
+
+    return StreamingResponse(
+        generador(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -9,14 +9,15 @@ import pymysql
 from app.servicios.auth_utils import get_current_user_id, create_access_token, validate_invitation_token
 from app.configuracion import configuracion
 from app.servicios.servicio_simulacion import get_db_connection, simular_datos_json
+from app.db.ejecutor_db import en_hilo_db
 
 # Importaciones de Modelos
 from app.api.modelos.proyectos import ProyectoCrear, ProyectoActualizar, Proyecto,ProyectoConRol,RespuestaPaginadaProyectos 
 from app.api.modelos.simulacion import DatosSimulacion
 from app.servicios import servicio_simulacion as servicio_simulacion
 
-from app.servicios.servicio_actividad import registrar_actividad_db
-from app.servicios.servicio_permisos import verificar_permiso_proyecto,obtener_rol_usuario_en_proyecto
+from app.servicios.servicio_actividad import registrar_actividad_con
+from app.servicios.servicio_permisos import verificar_permiso_proyecto,obtener_rol_usuario_en_proyecto, cache_permisos
 
 
 
@@ -47,6 +48,8 @@ async def obtener_proyectos_por_usuario(
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
     search: str = Query(""),
+    # Modo cursor: 0 para la primera página, luego el next_after_id recibido
+    after_id: Optional[int] = Query(None, ge=0),
     current_user_id: int = Depends(get_current_user_id)
 ):
     if usuario_id != current_user_id:
@@ -55,7 +58,7 @@ async def obtener_proyectos_por_usuario(
     try:
         # 1. Obtener datos crudos
         resultado = await servicio_simulacion.obtener_proyectos_paginados_db(
-            usuario_id, page, limit, search
+            usuario_id, page, limit, search, after_id
         )
         
         proyectos = resultado["data"]
@@ -231,50 +234,12 @@ async def remove_project_member(
     if usuario_id_a_remover == current_user_id:
          raise HTTPException(status_code=400, detail="No puedes removerte a ti mismo.")
 
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-
-        # Obtener nombres para el log
-        cursor.execute("SELECT nombre FROM proyectos WHERE id = %s", (proyecto_id,))
-        nombre_proyecto = cursor.fetchone()['nombre']
-        
-        cursor.execute("SELECT nombre_usuario FROM usuarios WHERE id = %s", (usuario_id_a_remover,))
-        usuario_removido = cursor.fetchone()
-        nombre_usuario_removido = usuario_removido['nombre_usuario'] if usuario_removido else f"ID {usuario_id_a_remover}"
-
-        # Eliminar
-        cursor.execute(
-            "DELETE FROM proyecto_usuarios WHERE proyecto_id = %s AND usuario_id = %s",
-            (proyecto_id, usuario_id_a_remover)
-        )
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="El usuario no era miembro de este proyecto.")
-            
-        conn.commit()
-
-        #  REGISTRAR ACTIVIDAD
-        await registrar_actividad_db(
-            usuario_id=current_user_id,
-            proyecto_id=proyecto_id,
-            tipo_evento='USUARIO_REMOVIDO',
-            titulo=f"Usuario removido: {nombre_usuario_removido}",
-            fuente=f"Proyecto: {nombre_proyecto}"
-        )
-
-        return {"status": "success", "message": f"Usuario removido exitosamente."}
-
-    except Exception as e:
-        if conn: conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
-    finally:
-        if conn: conn.close()
+    return await remover_miembro_proyecto_db(proyecto_id, usuario_id_a_remover, current_user_id)
 
 # Endpoint para procesar la unión al proyecto (CORREGIDO)
 @router_proyecto.post("/join-project/{invitation_token}")
-async def process_join_project(
+@en_hilo_db
+def process_join_project(
     invitation_token: str,
     current_user_id: int = Depends(get_current_user_id), 
 ):
@@ -305,12 +270,13 @@ async def process_join_project(
             (project_id, current_user_id, rol_a_asignar) # <--- USAMOS LA VARIABLE, NO EL NÚMERO FIJO
         )
         conn.commit()
+        cache_permisos.invalidar_miembro(project_id, current_user_id)
         
         # Obtener nombre del rol para el log (Opcional, para que se vea bonito)
         nombre_rol_asignado = "Observador" if rol_a_asignar == 3 else "Colaborador"
 
         # Registrar Actividad
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=inviter_id,
             proyecto_id=project_id,
             tipo_evento='USUARIO_INVITADO',
@@ -339,6 +305,17 @@ async def get_project_members(
     #  VERIFICACIÓN DE SEGURIDAD (Cualquiera con acceso de lectura puede ver miembros)
     await verificar_permiso_proyecto(current_user_id, proyecto_id, 'VER_DATOS_IOT')
 
+    return await obtener_miembros_proyecto_db(proyecto_id)
+
+
+
+# ------------------------------------------------------------------
+# 3. FUNCIONES DE BASE DE DATOS (SERVICIO DE DATOS BASE)
+# ------------------------------------------------------------------
+
+# Miembros del proyecto (listar / remover)
+@en_hilo_db
+def obtener_miembros_proyecto_db(proyecto_id: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection()
@@ -365,15 +342,55 @@ async def get_project_members(
         if conn: conn.close()
 
 
+@en_hilo_db
+def remover_miembro_proyecto_db(proyecto_id: int, usuario_id_a_remover: int, current_user_id: int) -> Dict[str, Any]:
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
 
-# ------------------------------------------------------------------
-# 3. FUNCIONES DE BASE DE DATOS (SERVICIO DE DATOS BASE)
-# ------------------------------------------------------------------
+        # Obtener nombres para el log
+        cursor.execute("SELECT nombre FROM proyectos WHERE id = %s", (proyecto_id,))
+        nombre_proyecto = cursor.fetchone()['nombre']
+        
+        cursor.execute("SELECT nombre_usuario FROM usuarios WHERE id = %s", (usuario_id_a_remover,))
+        usuario_removido = cursor.fetchone()
+        nombre_usuario_removido = usuario_removido['nombre_usuario'] if usuario_removido else f"ID {usuario_id_a_remover}"
+
+        # Eliminar
+        cursor.execute(
+            "DELETE FROM proyecto_usuarios WHERE proyecto_id = %s AND usuario_id = %s",
+            (proyecto_id, usuario_id_a_remover)
+        )
+        
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="El usuario no era miembro de este proyecto.")
+            
+        conn.commit()
+        cache_permisos.invalidar_miembro(proyecto_id, usuario_id_a_remover)
+
+        #  REGISTRAR ACTIVIDAD
+        registrar_actividad_con(conn,
+            usuario_id=current_user_id,
+            proyecto_id=proyecto_id,
+            tipo_evento='USUARIO_REMOVIDO',
+            titulo=f"Usuario removido: {nombre_usuario_removido}",
+            fuente=f"Proyecto: {nombre_proyecto}"
+        )
+
+        return {"status": "success", "message": f"Usuario removido exitosamente."}
+
+    except Exception as e:
+        if conn: conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+    finally:
+        if conn: conn.close()
 
 # Función de Creación de Proyecto
 
 # Función para crear proyectos (set_proyecto) - CON CAMPO TIPO_INDUSTRIA AÑADIDO
-async def set_proyecto(datos: ProyectoCrear) -> List[Dict[str, Any]]:
+@en_hilo_db
+def set_proyecto(datos: ProyectoCrear) -> List[Dict[str, Any]]:
     procesado = []
     conn = None
 
@@ -407,7 +424,9 @@ async def set_proyecto(datos: ProyectoCrear) -> List[Dict[str, Any]]:
         )
 
         conn.commit()
-        await registrar_actividad_db(
+        # Un id consultado antes de existir pudo quedar cacheado como "sin acceso"
+        cache_permisos.invalidar_proyecto(proyecto_id)
+        registrar_actividad_con(conn,
             usuario_id=datos.usuario_id,    # El ID del usuario que crea
             proyecto_id=proyecto_id,        # El ID del proyecto recién creado
             tipo_evento='PROYECTO_CREADO',
@@ -433,7 +452,8 @@ async def set_proyecto(datos: ProyectoCrear) -> List[Dict[str, Any]]:
 
 
 # Función para actualizar datos del proyecto
-async def actualizar_datos_proyecto(id: int, datos: ProyectoActualizar,usuario_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def actualizar_datos_proyecto(id: int, datos: ProyectoActualizar,usuario_id: int) -> List[Dict[str, Any]]:
     procesado = []
     conn = None
     try:
@@ -499,7 +519,7 @@ async def actualizar_datos_proyecto(id: int, datos: ProyectoActualizar,usuario_i
                     "tipo_industria": datos.tipo_industria 
                 }
             })
-            await registrar_actividad_db(
+            registrar_actividad_con(conn,
                 usuario_id=usuario_id,
                 proyecto_id=id,
                 tipo_evento='PROYECTO_MODIFICADO',
@@ -518,7 +538,8 @@ async def actualizar_datos_proyecto(id: int, datos: ProyectoActualizar,usuario_i
     return procesado
 
 
-async def eliminar_proyecto_db(id: Optional[int], usuario_id: int) -> Dict:
+@en_hilo_db
+def eliminar_proyecto_db(id: Optional[int], usuario_id: int) -> Dict:
     conn = None
     nombre_proyecto_eliminado = "" # Variable para guardar el nombre
     try:
@@ -570,9 +591,9 @@ async def eliminar_proyecto_db(id: Optional[int], usuario_id: int) -> Dict:
                     cursor.execute("SELECT id FROM campos_sensores WHERE sensor_id = %s", (sensor_id,))
                     campos = cursor.fetchall()
 
-                    for campo in campos:
-                       
-                        pass
+                    # 'valores' está particionada y no tiene FK: sus filas se borran a mano
+                    if campos:
+                        cursor.execute("DELETE FROM valores WHERE campo_id IN (SELECT id FROM campos_sensores WHERE sensor_id = %s)", (sensor_id,))
 
                     # Eliminar campos del sensor
                     cursor.execute("DELETE FROM campos_sensores WHERE sensor_id = %s", (sensor_id,))
@@ -587,9 +608,10 @@ async def eliminar_proyecto_db(id: Optional[int], usuario_id: int) -> Dict:
             cursor.execute("DELETE FROM proyectos WHERE id = %s", (proyecto_id_actual,))
 
         conn.commit() 
+        cache_permisos.invalidar_proyecto(id)
         
        
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=usuario_id,
             proyecto_id=None, # El ID ya no existe en la DB
             tipo_evento='PROYECTO_ELIMINADO',
@@ -1,12 +1,16 @@
 # app/api/rutas/recepcion.py
 
-from fastapi import APIRouter, HTTPException
+import json
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import JSONResponse
-from typing import Dict, Any
+from pydantic import ValidationError
+from typing import Dict, Any, List, Tuple
 
 # Importa el modelo de Pydantic y la función de servicio
 from app.api.modelos.recepcion_datos import PayloadDispositivo
-from app.servicios.servicio_recepcion import procesar_datos_dispositivo_db
+from app.configuracion import configuracion
+from app.servicios.servicio_recepcion import procesar_datos_dispositivo_db, procesar_lote_dispositivos_db
+from app.servicios.cola_ingesta import cola_ingesta, ColaLlenaError
 
 router_recepcion = APIRouter()
 #     {
@@ -50,8 +54,28 @@ async def recibir_datos_dispositivo(datos: PayloadDispositivo) -> Dict[str, Any]
     """
     Endpoint de alta velocidad para la ingesta de datos de dispositivos IoT.
     No requiere autenticación JWT de usuario.
+    Con INGESTA_MODO = "cola" responde 202 y la escritura se hace en lote en segundo plano.
     """
 
+    if configuracion.INGESTA_MODO == "cola" and cola_ingesta.activa:
+        try:
+            encolado = cola_ingesta.encolar(datos)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except ColaLlenaError as e:
+            # Backpressure: el dispositivo debe reintentar más tarde
+            return JSONResponse(
+                status_code=503,
+                headers={"Retry-After": "1"},
+                content={"status": "busy", "paquete_id": datos.id_paquete, "detail": str(e)}
+            )
+        if not encolado:
+            return {"status": "duplicate", "paquete_id": datos.id_paquete, "registros_procesados": 0, "registros_con_error": 0}
+        return JSONResponse(
+            status_code=202,
+            content={"status": "accepted", "paquete_id": datos.id_paquete, "encolado": True}
+        )
+
     try:
         # Llama a la función de servicio que hace el trabajo pesado
         resultado = await procesar_datos_dispositivo_db(datos)
@@ -65,4 +89,67 @@ async def recibir_datos_dispositivo(datos: PayloadDispositivo) -> Dict[str, Any]
         return JSONResponse(
             status_code=500,
             content={"status": "error", "paquete_id": datos.id_paquete, "detail": str(e)}
-        )
\ No newline at end of file
+        )
+
+
+# ----------------------------------------------------------------------
+# INGESTA EN LOTE: arreglo JSON o NDJSON (un paquete por línea)
+# ----------------------------------------------------------------------
+def _leer_paquetes_crudos(cuerpo: bytes, content_type: str) -> List[Any]:
+    texto = cuerpo.decode("utf-8").strip()
+    if not texto:
+        return []
+    if "ndjson" in content_type or "jsonlines" in content_type or not texto.startswith("["):
+        return [json.loads(linea) for linea in texto.splitlines() if linea.strip()]
+    crudos = json.loads(texto)
+    if not isinstance(crudos, list):
+        raise ValueError("Se esperaba un arreglo JSON de paquetes.")
+    return crudos
+
+
+def _validar_paquetes(crudos: List[Any]) -> Tuple[List[PayloadDispositivo], List[Dict[str, Any]]]:
+    """Valida todos los paquetes en una pasada; los inválidos se reportan sin abortar el lote."""
+    validos: List[PayloadDispositivo] = []
+    rechazados: List[Dict[str, Any]] = []
+    for indice, crudo in enumerate(crudos):
+        try:
+            validos.append(PayloadDispositivo.model_validate(crudo))
+        except ValidationError as e:
+            es_dict = isinstance(crudo, dict)
+            id_paquete = crudo.get("id_paquete") if es_dict else None
+            sensores = crudo.get("sensores") if es_dict else None
+            valores = 0
+            if isinstance(sensores, list):
+                valores = sum(len(s.get("datos") or {}) for s in sensores if isinstance(s, dict))
+            errores = e.errors()
+            rechazados.append({
+                "clave": str(id_paquete) if id_paquete is not None else f"indice_{indice}",
+                "dispositivo": crudo.get("dispositivo") if es_dict else None,
+                "valores": valores,
+                "error": f"Paquete inválido: {errores[0]['msg'] if errores else str(e)}"
+            })
+    return validos, rechazados
+
+
+@router_recepcion.post("/guardar_json/lote/")
+async def recibir_lote_dispositivos(request: Request) -> Dict[str, Any]:
+    """
+    Ingesta masiva para gateways y recargas históricas.
+    Acepta un arreglo JSON de PayloadDispositivo o NDJSON (application/x-ndjson).
+    Todo el lote se guarda en una sola transacción.
+    """
+    try:
+        crudos = _leer_paquetes_crudos(await request.body(), request.headers.get("content-type", ""))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Cuerpo del lote inválido: {str(e)}")
+
+    if not crudos:
+        raise HTTPException(status_code=400, detail="El lote no contiene paquetes.")
+    if len(crudos) > configuracion.INGESTA_LOTE_MAX_PAQUETES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote excede el máximo de {configuracion.INGESTA_LOTE_MAX_PAQUETES} paquetes."
+        )
+
+    paquetes, rechazados = _validar_paquetes(crudos)
+    return await procesar_lote_dispositivos_db(paquetes, rechazados)
@@ -9,10 +9,14 @@ import pymysql
 #  Modelos y Utilidades
 from app.servicios.auth_utils import get_current_user_id # Solo autenticación
 from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import en_hilo_db
 from app.api.modelos.sensores import SensorCrear,Sensor, SensorActualizar, SensorGeneral,RespuestaPaginadaSensores
-from app.servicios.servicio_permisos import verificar_permiso_proyecto,obtener_proyecto_id_desde_dispositivo, obtener_proyecto_id_desde_sensor
+from app.servicios.servicio_permisos import verificar_permiso_proyecto,obtener_proyecto_id_desde_dispositivo, obtener_proyecto_id_desde_sensor, cache_permisos
 
-from app.servicios.servicio_actividad import registrar_actividad_db
+from app.servicios.servicio_actividad import registrar_actividad_con
+from app.servicios.servicio_ingesta import indice_campos
+from app.servicios.servicio_paginacion import cache_conteos, filtro_after_id, recortar_pagina_cursor
+from app.servicios.servicio_busqueda import condicion_busqueda
 router_sensor = APIRouter()
 
 # -----------------------------------------------------------
@@ -47,12 +51,13 @@ async def get_all_sensores_general(
     page: int = Query(1, ge=1, description="Número de página"),
     limit: int = Query(10, ge=1, le=100, description="Registros por página"),
     search: str = Query("", description="Búsqueda global"),
+    after_id: Optional[int] = Query(None, ge=0, description="Modo cursor: 0 para la primera página, luego el next_after_id recibido"),
     current_user_id: int = Depends(get_current_user_id) 
 ):
     try:
         # Esta función ya filtra por usuario (Dueño o Invitado)
         return await obtener_sensores_globales_paginado_db(
-            current_user_id, page, limit, search
+            current_user_id, page, limit, search, after_id
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener sensores globales: {str(e)}")
@@ -166,7 +171,8 @@ async def eliminar_sensor_endpoint(
 # ----------------------------------------------------------------------
 
 # POST: Insertar un nuevo sensor y sus campos asociados
-async def set_sensor(datos: SensorCrear,usuario_id: int) -> Dict[str, Any]:
+@en_hilo_db
+def set_sensor(datos: SensorCrear,usuario_id: int) -> Dict[str, Any]:
     conn = None
     
     try:
@@ -220,19 +226,21 @@ async def set_sensor(datos: SensorCrear,usuario_id: int) -> Dict[str, Any]:
                 # -------------------------------------------------
                 # 🚨 NUEVO: Registrar la actividad de CADA CAMPO CREADO
                 # -------------------------------------------------
-                await registrar_actividad_db(
+                registrar_actividad_con(conn,
                     usuario_id=usuario_id,
                     proyecto_id=proyecto_id_padre,
                     tipo_evento='CAMPO_CREADO',
                     titulo=campo.nombre, # Ej: "Temperatura"
-                    fuente=f"Sensor: {datos.nombre}" # Ej: "Sensor: DHT22"
+                    fuente=f"Sensor: {datos.nombre}", # Ej: "Sensor: DHT22"
+                    confirmar=False # Entra en la misma transacción que el campo
                 )
                 # -------------------------------------------------
                 campos_agregados_count += 1
         
         conn.commit() # 👈 Transacción completada
+        indice_campos.invalidar_dispositivo(datos.dispositivo_id)
         
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=usuario_id,
             proyecto_id=proyecto_id_padre,
             tipo_evento='SENSOR_CREADO',
@@ -256,7 +264,8 @@ async def set_sensor(datos: SensorCrear,usuario_id: int) -> Dict[str, Any]:
 
 
 # PUT: Actualizar un sensor
-async def actualizar_sensor_db(
+@en_hilo_db
+def actualizar_sensor_db(
     id: int, 
     datos: SensorActualizar, 
     usuario_id: int 
@@ -270,6 +279,7 @@ async def actualizar_sensor_db(
         sql_info = """
         SELECT 
             s.nombre AS nombre_sensor,
+            s.dispositivo_id,
             d.nombre AS nombre_dispositivo,
             d.proyecto_id
         FROM sensores s
@@ -303,11 +313,12 @@ async def actualizar_sensor_db(
         
         cursor.execute(sql_update, valores)
         conn.commit()
+        indice_campos.invalidar_dispositivo(info_sensor['dispositivo_id'])
         
   
         nombre_para_log = datos.nombre if datos.nombre is not None else nombre_actual_sensor
 
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=usuario_id,
             proyecto_id=proyecto_id_padre,
             tipo_evento='SENSOR_MODIFICADO',
@@ -330,7 +341,8 @@ async def actualizar_sensor_db(
     finally:
         if conn: conn.close()
 
-async def eliminar_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
+@en_hilo_db
+def eliminar_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
     conn = None
     try:
         conn = get_db_connection()
@@ -341,6 +353,7 @@ async def eliminar_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
         sql_info = """
         SELECT 
             s.nombre AS nombre_sensor,
+            s.dispositivo_id,
             d.nombre AS nombre_dispositivo,
             d.proyecto_id
         FROM sensores s
@@ -374,6 +387,8 @@ async def eliminar_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
         row_count = cursor.rowcount # Capturar filas afectadas por la última consulta
         
         conn.commit() # 👈 Transacción completada
+        indice_campos.invalidar_dispositivo(info_sensor['dispositivo_id'])
+        cache_permisos.invalidar_ancestro("sensor", id)
         
         if row_count == 0:
             # Esto no debería pasar si la validación del paso 4 funcionó
@@ -382,7 +397,7 @@ async def eliminar_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
         # -------------------------------------------------
         # 🚨 7. REGISTRAR LA ACTIVIDAD (Después del Commit)
         # -------------------------------------------------
-        await registrar_actividad_db(
+        registrar_actividad_con(conn,
             usuario_id=usuario_id,
             proyecto_id=proyecto_id_padre,
             tipo_evento='SENSOR_ELIMINADO',
@@ -407,7 +422,8 @@ async def eliminar_sensor_db(id: int, usuario_id: int) -> Dict[str, Any]:
 
 
 # GET: Obtener un sensor por ID
-async def obtener_sensor_por_id_db(sensor_id: int) -> Dict[str, Any] | None:
+@en_hilo_db
+def obtener_sensor_por_id_db(sensor_id: int) -> Dict[str, Any] | None:
     conn = None
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
     try:
@@ -432,7 +448,8 @@ async def obtener_sensor_por_id_db(sensor_id: int) -> Dict[str, Any] | None:
         if conn: conn.close()
 
 
-async def obtener_sensores_por_dispositivo_paginado_db(
+@en_hilo_db
+def obtener_sensores_por_dispositivo_paginado_db(
     dispositivo_id: int, 
     usuario_id: int,
     page: int = 1, 
@@ -441,7 +458,7 @@ async def obtener_sensores_por_dispositivo_paginado_db(
 ) -> Dict[str, Any]:
     
     offset = (page - 1) * limit
-    search_pattern = f"%{search}%"
+    filtro_busqueda, params_busqueda = condicion_busqueda(search, [("s.nombre", "s.tipo")], ["s.nombre", "s.tipo"])
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
     
     conn = None
@@ -476,21 +493,21 @@ async def obtener_sensores_por_dispositivo_paginado_db(
             LEFT JOIN roles r ON pu.rol_id = r.id
             
             WHERE s.dispositivo_id = %s
-              AND (s.nombre LIKE %s OR s.tipo LIKE %s)
+              {filtro_busqueda}
             
             ORDER BY s.id DESC 
             LIMIT %s OFFSET %s
         """
         
-        # Params: [user_id, user_id, dispositivo_id, search, search, limit, offset]
-        params = [usuario_id, usuario_id, dispositivo_id, search_pattern, search_pattern, limit, offset]
+        # Params: [user_id, user_id, dispositivo_id] + búsqueda + [limit, offset]
+        params = [usuario_id, usuario_id, dispositivo_id] + params_busqueda + [limit, offset]
         
         cursor.execute(sql_data, params)
         sensores = cursor.fetchall()
         
         # 3. Obtener Total (para paginación)
-        sql_count = "SELECT COUNT(*) as total FROM sensores WHERE dispositivo_id = %s AND (nombre LIKE %s OR tipo LIKE %s)"
-        cursor.execute(sql_count, [dispositivo_id, search_pattern, search_pattern])
+        sql_count = f"SELECT COUNT(*) as total FROM sensores s WHERE s.dispositivo_id = %s {filtro_busqueda}"
+        cursor.execute(sql_count, [dispositivo_id] + params_busqueda)
         total_records = cursor.fetchone()['total']
         
         # 4. Formateo
@@ -513,15 +530,19 @@ async def obtener_sensores_por_dispositivo_paginado_db(
     finally:
         if conn: conn.close()
 
-async def obtener_sensores_globales_paginado_db(
+@en_hilo_db
+def obtener_sensores_globales_paginado_db(
     current_user_id: int,
     page: int = 1,
     limit: int = 10,
-    search: str = ""
+    search: str = "",
+    after_id: Optional[int] = None
 ) -> Dict[str, Any]:
     
     offset = (page - 1) * limit
-    search_pattern = f"%{search}%"
+    filtro_busqueda, params_busqueda = condicion_busqueda(
+        search, [("s.nombre", "s.tipo"), ("d.nombre",)], ["s.nombre", "s.tipo", "d.nombre"]
+    )
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
     
     conn = None
@@ -532,12 +553,12 @@ async def obtener_sensores_globales_paginado_db(
         # 1. Definir el WHERE común (Filtros de seguridad y búsqueda)
         # El usuario debe ser el DUEÑO del proyecto (p.usuario_id) 
         # O estar invitado en el proyecto (pu.usuario_id)
-        where_clause = """
+        where_clause = f"""
             WHERE (p.usuario_id = %s OR pu.usuario_id = %s)
-              AND (s.nombre LIKE %s OR s.tipo LIKE %s OR d.nombre LIKE %s)
+              {filtro_busqueda}
         """
-        # Params para el WHERE: [user, user, search, search, search]
-        params_base = [current_user_id, current_user_id, search_pattern, search_pattern, search_pattern]
+        # Params para el WHERE: [user, user] + búsqueda (vacía si no hay texto)
+        params_base = [current_user_id, current_user_id] + params_busqueda
 
         # 2. Obtener Total (COUNT) para la paginación
         sql_count = f"""
@@ -549,10 +570,20 @@ async def obtener_sensores_globales_paginado_db(
             {where_clause}
         """
         # Necesitamos pasar current_user_id extra para el LEFT JOIN del count
-        cursor.execute(sql_count, [current_user_id] + params_base)
-        total_records = cursor.fetchone()['total']
-        
-        # 3. Obtener Datos Paginados (CON CAMPOS y ROL)
+        if after_id is not None:
+            # Modo cursor: el total es informativo y se reutiliza unos segundos
+            total_records = cache_conteos.obtener(cursor, ("sensores", current_user_id, search), sql_count, [current_user_id] + params_base)
+            filtro_cursor, params_cursor = filtro_after_id("s.id", after_id)
+            paginacion = "LIMIT %s"
+            params_paginacion = params_cursor + [limit + 1]
+        else:
+            cursor.execute(sql_count, [current_user_id] + params_base)
+            total_records = cursor.fetchone()['total']
+            filtro_cursor = ""
+            paginacion = "LIMIT %s OFFSET %s"
+            params_paginacion = [limit, offset]
+        
+        # 3. Obtener Datos Paginados (CON ROL; los campos se cuentan después, solo para esta página)
         sql_data = f"""
             SELECT DISTINCT 
                 s.*, 
@@ -560,9 +591,6 @@ async def obtener_sensores_globales_paginado_db(
                 p.nombre as nombre_proyecto, 
                 p.usuario_id as propietario_id,
                 
-          
-                (SELECT COUNT(*) FROM campos_sensores cs WHERE cs.sensor_id = s.id) as total_campos,
-                
            
                 CASE 
                     WHEN p.usuario_id = %s THEN 'Propietario'
@@ -578,20 +606,35 @@ async def obtener_sensores_globales_paginado_db(
             LEFT JOIN roles r ON pu.rol_id = r.id
             
             {where_clause}
+            {filtro_cursor}
             
             ORDER BY s.id DESC 
-            LIMIT %s OFFSET %s
+            {paginacion}
         """
         
         # Params: 
         # 1. current_user_id (para el CASE del rol)
         # 2. current_user_id (para el LEFT JOIN de proyecto_usuarios)
         # 3. params_base (para el WHERE)
-        # 4. limit, offset (para paginación)
-        params_data = [current_user_id, current_user_id] + params_base + [limit, offset]
+        # 4. cursor / limit, offset (para paginación)
+        params_data = [current_user_id, current_user_id] + params_base + params_paginacion
         
         cursor.execute(sql_data, params_data)
         sensores = cursor.fetchall()
+        if after_id is not None:
+            sensores, next_after_id, has_more = recortar_pagina_cursor(sensores, limit)
+
+        # Un solo GROUP BY para la página en vez de una subconsulta correlacionada por fila
+        if sensores:
+            ids = [s['id'] for s in sensores]
+            marcadores = ", ".join(["%s"] * len(ids))
+            cursor.execute(
+                f"SELECT sensor_id, COUNT(*) AS total FROM campos_sensores WHERE sensor_id IN ({marcadores}) GROUP BY sensor_id",
+                ids
+            )
+            campos_por_sensor = {row['sensor_id']: row['total'] for row in cursor.fetchall()}
+            for s in sensores:
+                s['total_campos'] = campos_por_sensor.get(s['id'], 0)
         
         # 4. Formateo de datos (Fechas y Booleanos)
         for s in sensores:
@@ -600,13 +643,16 @@ async def obtener_sensores_globales_paginado_db(
             if 'fecha_creacion' in s and isinstance(s['fecha_creacion'], datetime):
                 s['fecha_creacion'] = s['fecha_creacion'].strftime(DATE_FORMAT)
                 
-        return {
+        resultado = {
             "data": sensores,
             "total": total_records,
             "page": page,
             "limit": limit,
             "total_pages": (total_records + limit - 1) // limit if limit > 0 else 0
         }
+        if after_id is not None:
+            resultado.update({"after_id": after_id, "next_after_id": next_after_id, "has_more": has_more})
+        return resultado
 
     except Exception as e:
         print(f"Error DB sensores globales: {e}")
@@ -6,6 +6,7 @@ import pymysql
 # 🚨 Importaciones de Seguridad (SOLO JWT)
 from app.servicios.auth_utils import get_current_user_id 
 from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import en_hilo_db
 from app.api.modelos.unidades_medida import UnidadMedida, UnidadMedidaCrear, UnidadMedidaActualizar
 
 router_unidades = APIRouter()
@@ -15,7 +16,8 @@ router_unidades = APIRouter()
 # ----------------------------------------------------------------------
 
 # GET: Obtener todas las unidades
-async def obtener_unidades_medida() -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_unidades_medida() -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection()
@@ -29,7 +31,8 @@ async def obtener_unidades_medida() -> List[Dict[str, Any]]:
         if conn: conn.close()
 
 # POST: Crear una unidad
-async def set_unidad_medida(datos: UnidadMedidaCrear) -> Dict[str, Any]:
+@en_hilo_db
+def set_unidad_medida(datos: UnidadMedidaCrear) -> Dict[str, Any]:
     conn = None
     try:
         conn = get_db_connection()
@@ -47,7 +50,8 @@ async def set_unidad_medida(datos: UnidadMedidaCrear) -> Dict[str, Any]:
         if conn: conn.close()
    
 # POST: Crear múltiples unidades (batch)
-async def set_unidades_medida_batch(datos_lista: List[UnidadMedidaCrear]) -> Dict[str, Any]:
+@en_hilo_db
+def set_unidades_medida_batch(datos_lista: List[UnidadMedidaCrear]) -> Dict[str, Any]:
     """
     Inserta una lista de unidades de medida. 
     Usa INSERT IGNORE para evitar fallos si la unidad ya existe.
@@ -89,7 +93,8 @@ async def set_unidades_medida_batch(datos_lista: List[UnidadMedidaCrear]) -> Dic
         if conn: conn.close()
                 
 # PUT: Actualizar una unidad
-async def actualizar_unidad_medida(id: int, datos: UnidadMedidaActualizar) -> Dict[str, Any]:
+@en_hilo_db
+def actualizar_unidad_medida(id: int, datos: UnidadMedidaActualizar) -> Dict[str, Any]:
     conn = None
     try:
         conn = get_db_connection()
@@ -8,6 +8,7 @@ import bcrypt
 # Importaciones ajustadas a tu estructura:
 from app.configuracion import configuracion
 from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import en_hilo_db
 # 🚨 Ajustar la ruta si es necesario
 from app.servicios.auth_utils import create_access_token 
 
@@ -38,7 +39,8 @@ async def crear_usuario(datos: UsuarioCrear):
         )
     
 # Crear usuario
-async def set_usuario(datos: UsuarioCrear) -> List[Dict[str, Any]]:
+@en_hilo_db
+def set_usuario(datos: UsuarioCrear) -> List[Dict[str, Any]]:
     procesado = []
     conn = None
 
@@ -110,7 +112,8 @@ async def login(datos: UsuarioLogin):
 
 
 # Login de usuario (MODIFICADO para generar Token)
-async def login_usuario(datos: UsuarioLogin):
+@en_hilo_db
+def login_usuario(datos: UsuarioLogin):
     conn = None
     try:
         conn = get_db_connection()
@@ -166,7 +169,8 @@ async def login_usuario(datos: UsuarioLogin):
 
 # Obtener usuario por ID (Sin protección JWT aún)
 @router_usuario.get("/obtener_usuario/")
-async def login_usuario(datos: UsuarioLogin):
+@en_hilo_db
+def login_usuario(datos: UsuarioLogin):
     conn = None
     try:
         conn = get_db_connection()
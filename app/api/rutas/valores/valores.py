@@ -1,18 +1,32 @@
-from fastapi import APIRouter, Query, HTTPException, Depends
-from typing import List, Optional
+import asyncio
+import json
+from fastapi import APIRouter, Query, HTTPException, Depends, Response, Header, Request
+from fastapi.responses import StreamingResponse
+from typing import Any, List, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel 
 
-from app.servicios.auth_utils import get_current_user_id
+from app.servicios.auth_utils import get_current_user_id, get_current_user_id_flujo
 from app.servicios.servicio_valores import (
     obtener_ultimo_valor_db,
+    obtener_ultimos_valores_db,
+    obtener_campos_ambito_db,
     obtener_historico_campo_db,
+    obtener_historico_planificado_db,
     obtener_rango_fechas_db,
     obtener_valores_ventana_db,
     aplicar_analisis_anomalias, 
     detectar_anomalia_individual, 
 aplicar_analisis_historico
 )
+from app.servicios.servicio_submuestreo import reducir_serie, METODOS_SUBMUESTREO
+from app.servicios.servicio_resolucion import describir_plan
+from app.servicios.servicio_permisos import (
+    verificar_permiso_proyecto, obtener_proyecto_id_desde_dispositivo, obtener_proyecto_id_desde_campo
+)
+from app.servicios.servicio_ultimos_valores import cache_ultimos_valores, calcular_etag, coincide_etag
+from app.servicios.servicio_tiempo_real import central_tiempo_real
+from app.configuracion import configuracion
 
 router = APIRouter()
 
@@ -60,8 +74,10 @@ async def get_valores_ventana(
 @router.get("/valores/historico-campo/{campo_id}", response_model=List[ValorGrafico])
 async def get_valores_historicos(
     campo_id: int,
+    response: Response,
     fecha_inicio: Optional[datetime] = Query(None),
     fecha_fin: Optional[datetime] = Query(None),
+    # "auto": el servidor elige la resolución según el rango y max_points
     metodo_carga: str = Query("optimizado"), 
     incluir_analisis: bool = Query(False),
     
@@ -70,15 +86,29 @@ async def get_valores_historicos(
     temp_max: float = Query(26.0),
     hum_min: float = Query(30.0),
     hum_max: float = Query(60.0),
+
+    # Submuestreo en servidor: la gráfica no dibuja más puntos que píxeles
+    max_points: Optional[int] = Query(None, ge=3, le=20000, description="Máximo de puntos a devolver"),
+    submuestreo: str = Query("lttb", description="lttb (forma de la serie) o minmax (extremos por cubeta)"),
     
     current_user_id: int = Depends(get_current_user_id)
 ):
+    if submuestreo not in METODOS_SUBMUESTREO:
+        raise HTTPException(status_code=400, detail=f"submuestreo debe ser uno de: {', '.join(METODOS_SUBMUESTREO)}")
+
     try:
         if not fecha_fin: fecha_fin = datetime.now()
         if not fecha_inicio: fecha_inicio = fecha_fin - timedelta(days=7)
 
         # 1. Obtener datos
-        valores = await obtener_historico_campo_db(campo_id, fecha_inicio, fecha_fin, metodo_carga)
+        if metodo_carga == "auto":
+            valores, plan = await obtener_historico_planificado_db(
+                campo_id, fecha_inicio, fecha_fin, max_points or configuracion.HISTORICO_PUNTOS_OBJETIVO
+            )
+            # Qué niveles/tablas respondieron, p.ej. "hora:valores_agregados,hora:valores"
+            response.headers["X-Historico-Resolucion"] = describir_plan(plan)
+        else:
+            valores = await obtener_historico_campo_db(campo_id, fecha_inicio, fecha_fin, metodo_carga)
         
         # 2. Aplicar Análisis HISTÓRICO con CONFIGURACIÓN
         if valores and incluir_analisis:
@@ -97,6 +127,10 @@ async def get_valores_historicos(
             except Exception as analysis_error:
                 print(f"Advertencia: Falló el análisis histórico: {analysis_error}")
 
+        # 3. Reducir DESPUÉS del análisis: se analiza la serie completa y las anomalías se conservan
+        if valores and max_points:
+            valores = reducir_serie(valores, max_points, submuestreo)
+
         return valores or []
         
     except Exception as e:
@@ -159,14 +193,28 @@ async def get_valores_historicos(
 @router.get("/valores/ultimo/{campo_id}", response_model=ValorGrafico)
 async def get_ultimo_valor(
     campo_id: int,
+    response: Response,
     # 🚨 Default True: También por defecto encendido para el polling
     analisis_activo: bool = Query(True), 
+    if_none_match: Optional[str] = Header(None),
     current_user_id: int = Depends(get_current_user_id)
 ):
+    """
+    Sale de la caché del último valor (la mantiene la ingesta); solo va a BD
+    la primera vez o si la entrada caducó. Si el cliente manda el ETag de la
+    respuesta anterior y no hay dato nuevo, contesta 304 sin cuerpo.
+    """
     try:
-        valor = await obtener_ultimo_valor_db(campo_id)
-        if not valor:
-            raise HTTPException(status_code=404, detail="Sin datos.")
+        valor = cache_ultimos_valores.obtener(campo_id)
+        if valor is None:
+            valor = await obtener_ultimo_valor_db(campo_id)
+            if not valor:
+                raise HTTPException(status_code=404, detail="Sin datos.")
+            cache_ultimos_valores.guardar(valor)
+
+        etag = calcular_etag([valor], analisis_activo)
+        if coincide_etag(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
             
         # Solo analizamos si el switch está activo en el frontend
         if analisis_activo:
@@ -177,12 +225,189 @@ async def get_ultimo_valor(
             # Limpiamos flags por seguridad
             valor['anomalia'] = False
             valor['mensaje_alerta'] = None
-            
+
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
         return valor
     except HTTPException: raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ----------------------------------------------------------------------
+# 3.1 ÚLTIMOS VALORES EN LOTE (DASHBOARD EN VIVO)
+# ----------------------------------------------------------------------
+async def _validar_ambito(
+    current_user_id: int,
+    campo_ids: Optional[str],
+    dispositivo_id: Optional[int],
+    proyecto_id: Optional[int]
+) -> Optional[List[int]]:
+    """
+    Exige exactamente un ámbito y verifica VER_DATOS_IOT si es dispositivo o
+    proyecto. Devuelve los ids de campo parseados (None si el ámbito no es una
+    lista): con una lista, el permiso se verifica por proyecto tras la consulta.
+    """
+    if sum(x is not None for x in (campo_ids, dispositivo_id, proyecto_id)) != 1:
+        raise HTTPException(status_code=400, detail="Indique exactamente uno de: campo_ids, dispositivo_id o proyecto_id.")
+
+    if campo_ids is not None:
+        try:
+            ids = list(dict.fromkeys(int(x) for x in campo_ids.split(",") if x.strip()))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="campo_ids debe ser una lista de enteros separados por coma.")
+        if len(ids) > configuracion.ULTIMOS_VALORES_MAX_CAMPOS:
+            raise HTTPException(status_code=400, detail=f"Máximo {configuracion.ULTIMOS_VALORES_MAX_CAMPOS} campos por petición.")
+        return ids
+
+    if dispositivo_id is not None:
+        proyecto_dispositivo = await obtener_proyecto_id_desde_dispositivo(dispositivo_id)
+        await verificar_permiso_proyecto(current_user_id, proyecto_dispositivo, 'VER_DATOS_IOT')
+    else:
+        await verificar_permiso_proyecto(current_user_id, proyecto_id, 'VER_DATOS_IOT')
+    return None
+
+
+@router.get("/valores/ultimos", response_model=List[ValorGrafico])
+async def get_ultimos_valores(
+    response: Response,
+    campo_ids: Optional[str] = Query(None, description="Ids de campo separados por coma"),
+    dispositivo_id: Optional[int] = Query(None, description="Todos los campos del dispositivo"),
+    proyecto_id: Optional[int] = Query(None, description="Todos los campos del proyecto"),
+    analisis_activo: bool = Query(True),
+    if_none_match: Optional[str] = Header(None),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Último valor de muchos campos en una sola petición (sustituye N llamadas
+    a /valores/ultimo/{campo_id} por pantalla). Indicar uno de: campo_ids,
+    dispositivo_id o proyecto_id. Los campos sin datos no aparecen.
+    Con campo_ids, lo que está en la caché del último valor no toca MySQL.
+    Soporta If-None-Match igual que /valores/ultimo.
+    """
+    ids = await _validar_ambito(current_user_id, campo_ids, dispositivo_id, proyecto_id)
+
+    try:
+        if ids is not None:
+            encontrados, faltantes = cache_ultimos_valores.obtener_varios(ids)
+            leidos = await obtener_ultimos_valores_db(faltantes) if faltantes else []
+            valores = sorted(list(encontrados.values()) + leidos, key=lambda v: v['campo_id'])
+        else:
+            leidos = valores = await obtener_ultimos_valores_db(None, dispositivo_id, proyecto_id)
+        for v in leidos:
+            cache_ultimos_valores.guardar(v)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Con campo_ids sueltos, cada proyecto distinto se verifica una vez (caché de permisos)
+    if ids is not None:
+        proyectos = set()
+        for v in valores:
+            # Las entradas cargadas por /valores/ultimo no traen proyecto_id: sale de la caché de ancestros
+            proyectos.add(v.get('proyecto_id') or await obtener_proyecto_id_desde_campo(v['campo_id']))
+        for pid in proyectos:
+            await verificar_permiso_proyecto(current_user_id, pid, 'VER_DATOS_IOT')
+
+    etag = calcular_etag(valores, analisis_activo)
+    if coincide_etag(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    if analisis_activo:
+        # Con el detector caliente son evaluaciones en memoria; solo siembran los campos nuevos
+        resultados = await asyncio.gather(
+            *(detectar_anomalia_individual(v['campo_id'], float(v['valor'])) for v in valores)
+        )
+        for v, (es_anomalia, mensaje) in zip(valores, resultados):
+            v['anomalia'] = es_anomalia
+            v['mensaje_alerta'] = mensaje
+    else:
+        for v in valores:
+            v['anomalia'] = False
+            v['mensaje_alerta'] = None
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return valores
+
+# ----------------------------------------------------------------------
+# 3.2 FLUJO EN VIVO (SSE)
+# ----------------------------------------------------------------------
+def _evento_sse(tipo: str, datos: Any) -> str:
+    return f"event: {tipo}\ndata: {json.dumps(datos, default=str)}\n\n"
+
+
+@router.get("/valores/stream")
+async def stream_valores(
+    request: Request,
+    campo_ids: Optional[str] = Query(None, description="Ids de campo separados por coma"),
+    dispositivo_id: Optional[int] = Query(None, description="Todos los campos del dispositivo"),
+    proyecto_id: Optional[int] = Query(None, description="Todos los campos del proyecto"),
+    current_user_id: int = Depends(get_current_user_id_flujo)
+):
+    """
+    Server-Sent Events con cada valor nuevo de los campos pedidos, en cuanto
+    la ingesta lo confirma (reemplaza el polling de 5s). Acepta el token como
+    ?token= porque EventSource no envía cabeceras.
+    Eventos: 'inicial' (último valor conocido de cada campo), 'valor' (lectura
+    nueva con anomalia/mensaje_alerta) y 'cerrado' si el cliente no lee a
+    tiempo; el cliente debe reconectar.
+    """
+    ids = await _validar_ambito(current_user_id, campo_ids, dispositivo_id, proyecto_id)
+    try:
+        campos = await obtener_campos_ambito_db(ids, dispositivo_id, proyecto_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not campos:
+        raise HTTPException(status_code=404, detail="No hay campos para suscribirse.")
+
+    # Permiso por proyecto en el momento de suscribirse (caché de permisos)
+    if ids is not None:
+        for pid in {c['proyecto_id'] for c in campos}:
+            await verificar_permiso_proyecto(current_user_id, pid, 'VER_DATOS_IOT')
+    ids_campos = [c['campo_id'] for c in campos]
+
+    try:
+        suscripcion = central_tiempo_real.suscribir(ids_campos)
+    except OverflowError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def generador():
+        try:
+            # Fotografía inicial; también siembra el detector para que la ingesta lo mantenga
+            encontrados, faltantes = cache_ultimos_valores.obtener_varios(ids_campos)
+            leidos = await obtener_ultimos_valores_db(faltantes) if faltantes else []
+            for v in leidos:
+                cache_ultimos_valores.guardar(v)
+            iniciales = sorted(list(encontrados.values()) + leidos, key=lambda v: v['campo_id'])
+            resultados = await asyncio.gather(
+                *(detectar_anomalia_individual(v['campo_id'], float(v['valor'])) for v in iniciales)
+            )
+            for v, (es_anomalia, mensaje) in zip(iniciales, resultados):
+                v.pop('proyecto_id', None)
+                v['anomalia'] = es_anomalia
+                v['mensaje_alerta'] = mensaje
+            yield _evento_sse("inicial", iniciales)
+
+            while True:
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), timeout=configuracion.TIEMPO_REAL_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if evento is None:
+                    yield _evento_sse("cerrado", {"motivo": suscripcion.motivo_cierre})
+                    break
+                yield _evento_sse("valor", evento)
+        finally:
+            central_tiempo_real.cancelar(suscripcion)
+
+    return StreamingResponse(
+        generador(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ----------------------------------------------------------------------
 # 4. METADATOS
 # ----------------------------------------------------------------------
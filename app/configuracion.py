@@ -93,6 +93,17 @@ class ConfiguracionSimulacion(BaseSettings):
     DB_NAME: str
     DB_PORT: int = 3306 # Valor por defecto seguro
 
+    # --- Pool de conexiones ---
+    DB_POOL_MIN: int = 2              # Conexiones abiertas al arrancar
+    DB_POOL_MAX: int = 10             # Tope de conexiones simultáneas
+    DB_POOL_TIMEOUT: float = 10.0     # Segundos máximos esperando una conexión libre
+    DB_POOL_RECICLAJE: float = 300.0  # Inactividad (s) tras la cual se hace ping / se poda
+    DB_POOL_VIDA_MAX: float = 3600.0  # Vida máxima (s) de una conexión antes de reciclarla
+
+    # --- Ejecutor de BD (consultas fuera del event loop) ---
+    DB_EJECUTOR_HILOS: int = 0        # Hilos para consultas bloqueantes (0 = DB_POOL_MAX - 2, deja conexiones libres fuera del ejecutor)
+    DB_TIMEOUT_CONSULTA: float = 30.0 # Segundos máximos por operación antes de KILL QUERY (0 = sin límite)
+
     # --- Seguridad (Requeridos) ---
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
@@ -109,6 +120,94 @@ class ConfiguracionSimulacion(BaseSettings):
     CAMPO_TEMPERATURA_ID: int = 2
     CAMPO_HUMEDAD_ID: int = 3
 
+    # --- Ingesta en lote ---
+    INGESTA_LOTE_MAX_PAQUETES: int = 5000   # Paquetes máximos por petición a /guardar_json/lote/
+    INGESTA_LOTE_TAMANO_CHUNK: int = 1000   # Filas por INSERT multi-fila
+
+    # --- Cola de ingesta (escritura diferida) ---
+    INGESTA_MODO: str = "directo"           # "directo" (commit por paquete) o "cola" (202 + escritura en lote)
+    INGESTA_COLA_CAPACIDAD: int = 10000     # Paquetes en memoria antes de responder 503
+    INGESTA_COLA_LOTE_MAX: int = 500        # Paquetes por commit
+    INGESTA_COLA_INTERVALO_MS: int = 200    # Espera máxima para juntar un lote
+    INGESTA_COLA_REINTENTOS: int = 5        # Intentos de escritura antes de descartar un lote
+
+    # --- Deduplicación de paquetes (dispositivo, id_paquete) ---
+    INGESTA_DEDUP: bool = True              # Rechazar reintentos de paquetes ya guardados
+    INGESTA_DEDUP_CACHE_MAX: int = 100000   # Paquetes recientes recordados en memoria
+    INGESTA_DEDUP_TTL: float = 3600.0       # Segundos que un paquete permanece en la caché
+
+    # --- Detector de anomalías incremental (estado por campo en memoria) ---
+    DETECTOR_MAX_CAMPOS: int = 5000            # Campos con estado en memoria (LRU)
+    DETECTOR_TTL_SIN_INGESTA: float = 30.0     # Re-sembrar desde BD si este proceso no vio datos nuevos en N s
+    DETECTOR_TTL_MAX: float = 600.0            # Re-sembrar siempre tras N s (corrige deriva y datos de otros workers)
+
+    # --- Agregación horaria incremental (marca de agua) ---
+    AGREGACION_INTERVALO_MIN: int = 5           # Cada cuántos minutos corre la pasada incremental
+    AGREGACION_MARGEN_S: int = 60               # Solo filas registradas hace más de N s (transacciones de ingesta en curso)
+    AGREGACION_TRAMO_IDS: int = 200000          # Ids de 'valores' por transacción
+    AGREGACION_DIAS_INICIALES: int = 30         # Días recalculados la primera vez (sin marca todavía)
+
+    # --- Niveles pre-agregados (retención en días por nivel, 0 = sin límite) ---
+    ROLLUP_RETENCION_1M_DIAS: int = 14          # valores_rollup_1m
+    ROLLUP_RETENCION_15M_DIAS: int = 180        # valores_rollup_15m
+    AGREGADOS_RETENCION_HORA_DIAS: int = 0      # valores_agregados
+    ROLLUP_RETENCION_1D_DIAS: int = 0           # valores_rollup_1d
+    ROLLUP_RETENCION_1MES_DIAS: int = 0         # valores_rollup_1mes
+
+    # --- Particiones mensuales de 'valores' ---
+    VALORES_PARTICIONES_ADELANTE: int = 3       # Meses futuros con partición ya creada
+    VALORES_RETENCION_MESES: int = 0            # Meses de lecturas crudas a conservar (0 = sin límite)
+    VALORES_RETENCION_MODO: str = "archivar"    # "archivar" (tabla valores_archivo_AAAAMM) o "eliminar"
+    VALORES_MANTENIMIENTO_HORAS: int = 24       # Cada cuántas horas corre el mantenimiento
+
+    # --- Archivo Parquet de lecturas frías ---
+    ARCHIVO_PARQUET_DIR: str = "datos/archivo_valores"  # proyecto=P/campo=C/dia=AAAA-MM-DD.parquet
+    ARCHIVO_PARQUET_DIAS: int = 0               # Lecturas más antiguas que N días salen de MySQL (0 = desactivado)
+
+    # --- Histórico: selección automática de resolución (metodo_carga="auto") ---
+    HISTORICO_PUNTOS_OBJETIVO: int = 1500      # Puntos por gráfica cuando no se envía max_points
+    HISTORICO_INTERVALO_NOMINAL_S: float = 5.0 # Periodo de muestreo supuesto si no hay agregados para estimar
+
+    # --- Caché de permisos (decisiones por usuario/proyecto y ancestros) ---
+    PERMISOS_CACHE_TTL: float = 60.0        # Segundos que vale una decisión (cubre cambios hechos por SQL)
+    PERMISOS_CACHE_MAX: int = 50000         # Entradas máximas por tabla (LRU)
+
+    # --- Paginación por cursor (after_id) ---
+    PAGINACION_CONTEO_TTL: float = 30.0     # Segundos que se reutiliza el total de un listado en modo cursor
+
+    # --- Últimos valores en lote (/valores/ultimos) ---
+    ULTIMOS_VALORES_MAX_CAMPOS: int = 500   # Campos máximos por petición
+
+    # --- Caché del último valor (alimentada por la ingesta) ---
+    ULTIMOS_VALORES_MAX_CACHE: int = 20000          # Campos en memoria (LRU)
+    ULTIMOS_VALORES_TTL_SIN_INGESTA: float = 5.0    # Recargar de BD si este proceso no vio ingesta del campo en N s
+    ULTIMOS_VALORES_TTL_MAX: float = 300.0          # Recargar siempre tras N s (nombre/unidad del campo)
+
+    # --- Tiempo real (SSE /valores/stream) ---
+    TIEMPO_REAL_MAX_SUSCRIPCIONES: int = 1000   # Conexiones abiertas por proceso
+    TIEMPO_REAL_MAX_PENDIENTES: int = 1000      # Eventos sin leer por cliente antes de cortarlo
+    TIEMPO_REAL_KEEPALIVE_S: float = 15.0       # Comentario SSE para que proxies no cierren la conexión
+
+    # --- Registro de modelos de proyección energética (app/modelos_ml/registro) ---
+    REGISTRO_MODELOS_MAX_MEMORIA: int = 64      # Modelos entrenados en memoria (LRU)
+    REGISTRO_MODELOS_MAX_DISCO: int = 512       # Ficheros en disco (LRU por fecha de uso; 0 = solo memoria)
+
+    # --- Selección de modelo de proyección (modelo="auto") ---
+    PRONOSTICO_ETS_MAX_REGISTROS: int = 36      # Series con menos meses usan ETS (NumPy); el resto, Prophet
+
+    # --- Entrenamiento de modelos en procesos aparte (Prophet fuera del event loop) ---
+    MODELOS_PROCESOS: int = 2                   # Entrenamientos simultáneos
+    MODELOS_COLA_MAX: int = 8                   # Entrenamientos en espera antes de responder 503
+    MODELOS_TIMEOUT_S: float = 120.0            # Tiempo máximo por entrenamiento (cola incluida)
+    MODELOS_HISTORIAL_TRABAJOS: int = 200       # Trabajos recordados para /api/modelos/entrenamientos
+
+    # --- Trabajos de pronóstico asíncronos (/energetico/trabajos) ---
+    TRABAJOS_PRONOSTICO_CONCURRENTES: int = 4       # Proyecciones/escenarios calculándose a la vez
+    TRABAJOS_PRONOSTICO_TTL_S: float = 600.0        # Segundos que se guarda un resultado tras terminar
+    TRABAJOS_PRONOSTICO_MAX_RESULTADOS: int = 1000  # Trabajos guardados como máximo (LRU de los terminados)
+    TRABAJOS_PRONOSTICO_MAX_PENDIENTES: int = 64    # En cola + en curso de todos los usuarios (más -> 503)
+    TRABAJOS_PRONOSTICO_MAX_POR_USUARIO: int = 8    # En cola + en curso de un mismo usuario (más -> 429)
+
     # --- Configuración IA ---
     OPENROUTER_API_KEY: str
     IA_PROVIDER: str = "openrouter"
@@ -131,6 +230,7 @@ class ConfiguracionSimulacion(BaseSettings):
         """Mostrar resumen seguro al iniciar"""
         print("🔐 Configuración Cargada:")
         print(f"   📊 BD: {self.DB_USER}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}")
+        print(f"   🔌 Pool BD: {self.DB_POOL_MIN}-{self.DB_POOL_MAX} conexiones")
         print(f"   🌐 Frontend: {self.FRONTEND_URL}")
         print(f"   🎯 JWT Expira: {self.ACCESS_TOKEN_EXPIRE_MINUTES} min")
         print(f"   🤖 IA Provider: {self.IA_PROVIDER}")
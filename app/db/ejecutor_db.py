@@ -0,0 +1,179 @@
+# app/db/ejecutor_db.py
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set
+
+from app.configuracion import configuracion
+from app.db.pool_conexiones import rastrear_conexiones, _crear_conexion_mysql
+
+
+class ConsultaExcedioTiempoError(TimeoutError):
+    """La operación de BD superó su tiempo máximo y su consulta fue cancelada."""
+
+
+# Valor centinela: "usar DB_TIMEOUT_CONSULTA"
+_TIMEOUT_POR_DEFECTO = object()
+
+
+# -----------------------------------------------------------------------------
+# 1. EJECUTOR DEDICADO
+# -----------------------------------------------------------------------------
+class EjecutorDB:
+    """
+    Corre las funciones bloqueantes de PyMySQL en un pool de hilos propio, para
+    que una consulta lenta no congele el event loop de uvicorn.
+    Por defecto hay dos hilos menos que conexiones en el pool: más hilos solo
+    harían cola dentro del pool, y las conexiones sobrantes quedan para quien
+    las pide fuera del ejecutor (tareas de fondo, escritores en lote).
+    """
+
+    def __init__(self, hilos: int, timeout_defecto: Optional[float]):
+        self.hilos = max(1, hilos)
+        self.timeout_defecto = timeout_defecto
+        self._ejecutor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        # Métricas (solo se tocan desde el event loop)
+        self._en_curso = 0
+        self._ejecutadas = 0
+        self._timeouts = 0
+        self._canceladas = 0
+        self._consultas_abortadas = 0
+
+    def _obtener_ejecutor(self) -> ThreadPoolExecutor:
+        if self._ejecutor is None:
+            with self._lock:
+                if self._ejecutor is None:
+                    self._ejecutor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="db")
+        return self._ejecutor
+
+    async def ejecutar(self, funcion: Callable, *args, timeout: Any = _TIMEOUT_POR_DEFECTO, **kwargs) -> Any:
+        """
+        Ejecuta `funcion(*args, **kwargs)` en un hilo del ejecutor.
+        El tiempo cuenta desde que se encola: si todos los hilos están ocupados,
+        la espera por uno libre también consume el presupuesto.
+        timeout=None desactiva el límite (tareas largas como la agregación).
+        """
+        if timeout is _TIMEOUT_POR_DEFECTO:
+            timeout = self.timeout_defecto
+
+        registro: Set[Any] = set()
+
+        def _tarea():
+            with rastrear_conexiones(registro):
+                return funcion(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        futuro = loop.run_in_executor(self._obtener_ejecutor(), _tarea)
+        self._en_curso += 1
+        try:
+            return await asyncio.wait_for(futuro, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            self._abortar_consultas(registro)
+            raise ConsultaExcedioTiempoError(
+                f"La operación '{getattr(funcion, '__name__', 'db')}' excedió {timeout:.1f}s y fue cancelada."
+            )
+        except asyncio.CancelledError:
+            # El cliente se desconectó o el servidor se está apagando
+            self._canceladas += 1
+            self._abortar_consultas(registro)
+            raise
+        finally:
+            self._en_curso -= 1
+            self._ejecutadas += 1
+
+    def _abortar_consultas(self, registro: Set[Any]):
+        """
+        El hilo no se puede interrumpir, pero su consulta sí: KILL QUERY desde
+        otra conexión hace que PyMySQL lance un error y el hilo quede libre.
+        """
+        ids = []
+        for _ in range(3):
+            try:
+                ids = [conexion.thread_id() for conexion in list(registro)]
+                break
+            except RuntimeError:
+                # El hilo de trabajo soltó una conexión mientras leíamos el registro
+                continue
+        if not ids:
+            return
+        self._consultas_abortadas += len(ids)
+        threading.Thread(target=_matar_consultas, args=(ids,), daemon=True).start()
+
+    def cerrar(self):
+        with self._lock:
+            if self._ejecutor is not None:
+                self._ejecutor.shutdown(wait=False, cancel_futures=True)
+                self._ejecutor = None
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "hilos": self.hilos,
+            "timeout_defecto_s": self.timeout_defecto,
+            "en_curso": self._en_curso,
+            "ejecutadas": self._ejecutadas,
+            "timeouts": self._timeouts,
+            "canceladas": self._canceladas,
+            "consultas_abortadas": self._consultas_abortadas,
+        }
+
+
+def _matar_consultas(ids):
+    conn = None
+    try:
+        # Conexión aparte del pool: si el pool está agotado, justo entonces hace falta
+        conn = _crear_conexion_mysql()
+        with conn.cursor() as cursor:
+            for thread_id in ids:
+                try:
+                    cursor.execute("KILL QUERY %s", (thread_id,))
+                except Exception as e:
+                    # La consulta pudo terminar entre el timeout y el KILL
+                    print(f"⚠️ [Ejecutor BD] No se pudo cancelar la consulta {thread_id}: {e}")
+    except Exception as e:
+        print(f"❌ [Ejecutor BD] Error cancelando consultas {ids}: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+# -----------------------------------------------------------------------------
+# 2. INSTANCIA GLOBAL Y API DE USO
+# -----------------------------------------------------------------------------
+ejecutor_db = EjecutorDB(
+    hilos=configuracion.DB_EJECUTOR_HILOS or max(1, configuracion.DB_POOL_MAX - 2),
+    timeout_defecto=configuracion.DB_TIMEOUT_CONSULTA or None
+)
+
+
+async def ejecutar_db(funcion: Callable, *args, timeout: Any = _TIMEOUT_POR_DEFECTO, **kwargs) -> Any:
+    return await ejecutor_db.ejecutar(funcion, *args, timeout=timeout, **kwargs)
+
+
+def en_hilo_db(funcion: Optional[Callable] = None, *, timeout: Any = _TIMEOUT_POR_DEFECTO):
+    """
+    Convierte una función síncrona de BD en una corrutina que corre en el ejecutor:
+
+        @en_hilo_db
+        def obtener_algo_db(id): ...          # se sigue usando con: await obtener_algo_db(id)
+
+        @en_hilo_db(timeout=None)
+        def tarea_larga_db(): ...
+
+    La función original queda accesible como `.sync` para llamarla desde
+    código que ya corre en un hilo del ejecutor.
+    """
+    def decorador(f: Callable):
+        @functools.wraps(f)
+        async def envoltura(*args, **kwargs):
+            return await ejecutor_db.ejecutar(f, *args, timeout=timeout, **kwargs)
+        envoltura.sync = f
+        return envoltura
+
+    if funcion is not None:
+        return decorador(funcion)
+    return decorador
@@ -0,0 +1,373 @@
+# app/db/pool_conexiones.py
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Set
+
+import pymysql
+import pymysql.cursors
+
+from app.configuracion import configuracion
+
+
+# -----------------------------------------------------------------------------
+# 1. CONEXIÓN PRESTADA POR EL POOL
+# -----------------------------------------------------------------------------
+class ConexionAgrupada:
+    """
+    Envoltura de una conexión PyMySQL prestada por el pool.
+    Se comporta igual que la conexión original, pero close() la devuelve
+    al pool en lugar de cerrar el socket.
+    """
+
+    def __init__(self, pool: "PoolConexiones", conexion: pymysql.connections.Connection, creada_en: float):
+        self._pool = pool
+        self._conexion = conexion
+        self._creada_en = creada_en
+        self._devuelta = False
+
+    def close(self):
+        if self._devuelta:
+            return
+        self._devuelta = True
+        _dejar_de_rastrear(self._conexion)
+        self._pool._liberar(self._conexion, self._creada_en)
+
+    def descartar(self):
+        """Devuelve la conexión marcándola como inservible (se cierra de verdad)."""
+        if self._devuelta:
+            return
+        self._devuelta = True
+        _dejar_de_rastrear(self._conexion)
+        self._pool._liberar(self._conexion, self._creada_en, descartar=True)
+
+    def __getattr__(self, nombre: str) -> Any:
+        return getattr(self._conexion, nombre)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Red de seguridad: si alguien olvidó cerrar, el hueco vuelve al pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+# -----------------------------------------------------------------------------
+# 1.1 RASTREO POR HILO (para poder cancelar la consulta en curso)
+# -----------------------------------------------------------------------------
+_hilo_actual = threading.local()
+
+
+@contextmanager
+def rastrear_conexiones(registro: Set[Any]):
+    """
+    Mientras dure el bloque, las conexiones que este hilo tome del pool se
+    anotan en `registro`. El ejecutor de BD lo usa para hacer KILL QUERY
+    sobre ellas si la petición excede su tiempo o es cancelada.
+    """
+    anterior = getattr(_hilo_actual, "registro", None)
+    _hilo_actual.registro = registro
+    try:
+        yield registro
+    finally:
+        _hilo_actual.registro = anterior
+
+
+def _rastrear(conexion):
+    registro = getattr(_hilo_actual, "registro", None)
+    if registro is not None:
+        registro.add(conexion)
+
+
+def _dejar_de_rastrear(conexion):
+    registro = getattr(_hilo_actual, "registro", None)
+    if registro is not None:
+        registro.discard(conexion)
+
+
+# -----------------------------------------------------------------------------
+# 2. POOL ACOTADO CON VERIFICACIÓN DE SALUD
+# -----------------------------------------------------------------------------
+class PoolConexiones:
+    """
+    Pool de conexiones MySQL acotado (mínimo/máximo) y seguro entre hilos.
+    - Reutiliza conexiones en lugar de abrir TCP + autenticación por consulta.
+    - Hace ping a las conexiones que estuvieron inactivas demasiado tiempo.
+    - Recicla conexiones que superan su vida máxima.
+    - Lleva métricas de tiempo de espera para diagnóstico.
+    """
+
+    def __init__(
+        self,
+        crear_conexion: Callable[[], pymysql.connections.Connection],
+        minimo: int = 2,
+        maximo: int = 10,
+        timeout_espera: float = 10.0,
+        reciclaje_inactiva: float = 300.0,
+        vida_maxima: float = 3600.0,
+    ):
+        if maximo < 1:
+            raise ValueError("El tamaño máximo del pool debe ser al menos 1.")
+        self._crear_conexion = crear_conexion
+        self.minimo = max(0, min(minimo, maximo))
+        self.maximo = maximo
+        self.timeout_espera = timeout_espera
+        self.reciclaje_inactiva = reciclaje_inactiva
+        self.vida_maxima = vida_maxima
+
+        # Cada entrada libre: (conexion, creada_en, liberada_en)
+        self._libres: deque = deque()
+        self._total = 0
+        self._en_uso = 0
+        self._cerrado = False
+        self._condicion = threading.Condition()
+
+        # Métricas
+        self._solicitudes = 0
+        self._esperas = 0
+        self._timeouts = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._creadas = 0
+        self._recicladas = 0
+        self._descartadas = 0
+
+    # --- Ciclo de vida ---------------------------------------------------------
+    def precalentar(self) -> int:
+        """Abre las conexiones mínimas por adelantado. Devuelve cuántas abrió."""
+        abiertas = 0
+        while True:
+            with self._condicion:
+                if self._cerrado or self._total >= self.minimo:
+                    return abiertas
+                self._total += 1
+            try:
+                conexion = self._abrir()
+            except Exception:
+                with self._condicion:
+                    self._total -= 1
+                raise
+            ahora = time.monotonic()
+            with self._condicion:
+                self._libres.append((conexion, ahora, ahora))
+                self._condicion.notify()
+            abiertas += 1
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres y rechaza nuevos préstamos."""
+        with self._condicion:
+            self._cerrado = True
+            libres = list(self._libres)
+            self._libres.clear()
+            self._total -= len(libres)
+            self._condicion.notify_all()
+        for conexion, _, _ in libres:
+            self._cerrar_silencioso(conexion)
+
+    # --- Préstamo / devolución -------------------------------------------------
+    def obtener(self, timeout: Optional[float] = None) -> ConexionAgrupada:
+        espera_max = self.timeout_espera if timeout is None else timeout
+        inicio = time.monotonic()
+        limite = inicio + espera_max
+        entrada = None
+        espero = False
+
+        with self._condicion:
+            self._solicitudes += 1
+            while True:
+                if self._cerrado:
+                    raise ConnectionError("El pool de conexiones está cerrado.")
+                if self._libres:
+                    # LIFO: la conexión más reciente es la que menos riesgo tiene de estar muerta
+                    entrada = self._libres.pop()
+                    break
+                if self._total < self.maximo:
+                    self._total += 1
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise ConnectionError(
+                        f"Pool de conexiones agotado: {self.maximo} en uso tras esperar {espera_max:.1f}s."
+                    )
+                espero = True
+                self._condicion.wait(restante)
+
+            self._en_uso += 1
+            espera = time.monotonic() - inicio
+            if espero:
+                self._esperas += 1
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+
+        try:
+            if entrada is None:
+                conexion, creada_en = self._abrir(), time.monotonic()
+            else:
+                conexion, creada_en = self._validar(*entrada)
+        except Exception:
+            with self._condicion:
+                self._total -= 1
+                self._en_uso -= 1
+                self._condicion.notify()
+            raise
+
+        _rastrear(conexion)
+        return ConexionAgrupada(self, conexion, creada_en)
+
+    def _liberar(self, conexion, creada_en: float, descartar: bool = False):
+        if not descartar:
+            try:
+                # Termina cualquier transacción abierta (lecturas sin commit incluidas)
+                # para que el siguiente usuario no vea una instantánea vieja.
+                conexion.rollback()
+            except Exception:
+                descartar = True
+
+        ahora = time.monotonic()
+        a_cerrar = []
+        with self._condicion:
+            self._en_uso -= 1
+            if descartar or self._cerrado or (ahora - creada_en) > self.vida_maxima:
+                self._total -= 1
+                self._descartadas += 1
+                a_cerrar.append(conexion)
+            else:
+                self._libres.append((conexion, creada_en, ahora))
+
+            # Podar conexiones inactivas por encima del mínimo (las más viejas están a la izquierda)
+            while (
+                self._libres
+                and self._total > self.minimo
+                and (ahora - self._libres[0][2]) > self.reciclaje_inactiva
+            ):
+                vieja, _, _ = self._libres.popleft()
+                self._total -= 1
+                self._recicladas += 1
+                a_cerrar.append(vieja)
+
+            self._condicion.notify()
+
+        for c in a_cerrar:
+            self._cerrar_silencioso(c)
+
+    # --- Internos --------------------------------------------------------------
+    def _abrir(self):
+        conexion = self._crear_conexion()
+        with self._condicion:
+            self._creadas += 1
+        return conexion
+
+    def _validar(self, conexion, creada_en: float, liberada_en: float):
+        """Comprueba una conexión libre antes de prestarla; si no sirve la reemplaza."""
+        ahora = time.monotonic()
+        if (ahora - creada_en) > self.vida_maxima:
+            self._cerrar_silencioso(conexion)
+            with self._condicion:
+                self._recicladas += 1
+            return self._abrir(), time.monotonic()
+
+        if (ahora - liberada_en) > self.reciclaje_inactiva:
+            try:
+                conexion.ping(reconnect=False)
+            except Exception:
+                self._cerrar_silencioso(conexion)
+                with self._condicion:
+                    self._descartadas += 1
+                return self._abrir(), time.monotonic()
+
+        return conexion, creada_en
+
+    @staticmethod
+    def _cerrar_silencioso(conexion):
+        try:
+            conexion.close()
+        except Exception:
+            pass
+
+    # --- Métricas --------------------------------------------------------------
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._condicion:
+            return {
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "total": self._total,
+                "en_uso": self._en_uso,
+                "libres": len(self._libres),
+                "solicitudes": self._solicitudes,
+                "esperas": self._esperas,
+                "timeouts": self._timeouts,
+                "espera_promedio_ms": round(self._espera_total / self._solicitudes * 1000, 3) if self._solicitudes else 0.0,
+                "espera_max_ms": round(self._espera_max * 1000, 3),
+                "creadas": self._creadas,
+                "recicladas": self._recicladas,
+                "descartadas": self._descartadas,
+                "cerrado": self._cerrado,
+            }
+
+
+# -----------------------------------------------------------------------------
+# 3. INSTANCIA GLOBAL Y API DE USO
+# -----------------------------------------------------------------------------
+def _crear_conexion_mysql() -> pymysql.connections.Connection:
+    return pymysql.connect(
+        host=configuracion.DB_HOST,
+        user=configuracion.DB_USER,
+        password=configuracion.DB_PASSWORD,
+        database=configuracion.DB_NAME,
+        port=configuracion.DB_PORT,
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+_pool: Optional[PoolConexiones] = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool() -> PoolConexiones:
+    """Devuelve el pool global, creándolo la primera vez con la configuración del .env"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexiones(
+                    _crear_conexion_mysql,
+                    minimo=configuracion.DB_POOL_MIN,
+                    maximo=configuracion.DB_POOL_MAX,
+                    timeout_espera=configuracion.DB_POOL_TIMEOUT,
+                    reciclaje_inactiva=configuracion.DB_POOL_RECICLAJE,
+                    vida_maxima=configuracion.DB_POOL_VIDA_MAX,
+                )
+    return _pool
+
+
+def cerrar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.cerrar()
+            _pool = None
+
+
+@contextmanager
+def conexion_db():
+    """
+    Uso recomendado:
+        with conexion_db() as conn:
+            cursor = conn.cursor()
+            ...
+    La conexión vuelve al pool al salir del bloque (con rollback de lo no confirmado).
+    """
+    conn = obtener_pool().obtener()
+    try:
+        yield conn
+    finally:
+        conn.close()
@@ -1,8 +1,8 @@
 # app/principal.py (CÓDIGO CORREGIDO)
 
 from datetime import datetime, timedelta
-from fastapi import FastAPI, UploadFile, File, Form 
-from fastapi.responses import HTMLResponse 
+from fastapi import FastAPI, UploadFile, File, Form, Request, Depends
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles 
 from fastapi.middleware.cors import CORSMiddleware 
 from dotenv import load_dotenv 
@@ -11,6 +11,22 @@ from contextlib import asynccontextmanager
 import pymysql
 
 from app.servicios.servicio_simulacion import get_db_connection
+from app.db.pool_conexiones import obtener_pool, cerrar_pool
+from app.db.ejecutor_db import ejecutor_db, ConsultaExcedioTiempoError
+from app.configuracion import configuracion
+from app.servicios.cola_ingesta import cola_ingesta
+from app.servicios.servicio_ingesta import paquetes_recientes
+from app.servicios.servicio_detector_anomalias import detector_anomalias
+from app.servicios.servicio_permisos import cache_permisos
+from app.servicios.servicio_paginacion import cache_conteos
+from app.servicios.servicio_ultimos_valores import cache_ultimos_valores
+from app.servicios.servicio_tiempo_real import central_tiempo_real
+from app.servicios.energetico.registro_modelos import registro_modelos
+from app.servicios.auth_utils import get_current_user_id
+from app.servicios.energetico.trabajos_pronostico import gestor_trabajos_pronostico, TrabajoPronosticoRechazadoError
+from app.servicios.energetico.ejecutor_modelos import (
+    ejecutor_modelos, EntrenamientoRechazadoError, EntrenamientoExcedioTiempoError, EntrenamientoCanceladoError
+)
 
 # 🚨 Cargar variables de entorno una vez
 load_dotenv() 
@@ -23,6 +39,8 @@ from apscheduler.triggers.interval import IntervalTrigger
 import asyncio
 
 from app.servicios.servicio_agregacion import ejecutar_agregacion_horaria
+from app.servicios.servicio_particiones import mantener_particiones_valores
+from app.servicios.servicio_archivo_parquet import archivar_valores_frios
 
 # Importación de Routers
 from app.api.rutas.valores.valores import router as valores_router
@@ -39,6 +57,7 @@ from app.api.rutas.energetico.analisis import router as energetico_analisis_rout
 from app.api.rutas.energetico.proyecciones import router as energetico_proyecciones_router
 from app.api.rutas.energetico.gestion_datos import router as energetico_gestion_datos_router
 from app.api.rutas.dashboard.dashboard import router_dashboard as router_dashboard
+from app.api.rutas.busqueda.busqueda import router_busqueda as router_busqueda
 # Se importa el threading para doble ejecución de servicios sin detener uno
 import threading
 import socket
@@ -116,6 +135,17 @@ async def lifespan(app: FastAPI):
     startup_time = datetime.now()
     log_con_timestamp("🚀 INICIANDO SISTEMA IoT", "🚀")
     
+    log_con_timestamp("Abriendo pool de conexiones MySQL...", "🔌")
+    try:
+        abiertas = obtener_pool().precalentar()
+        log_con_timestamp(f"Pool listo: {abiertas} conexiones precalentadas", "✅")
+    except Exception as e:
+        log_con_timestamp(f"No se pudo precalentar el pool (se abrirán bajo demanda): {e}", "⚠️")
+    
+    if configuracion.INGESTA_MODO == "cola":
+        cola_ingesta.iniciar()
+        log_con_timestamp(f"Cola de ingesta activa (capacidad {cola_ingesta.capacidad}, lote {cola_ingesta.lote_max})", "📥")
+    
     log_con_timestamp("Iniciando servicio UDP Discovery...", "📡")
     threading.Thread(target=udp_discovery, daemon=True).start()
     
@@ -123,22 +153,44 @@ async def lifespan(app: FastAPI):
     
     scheduler = AsyncIOScheduler()
     
-    # EJECUCIÓN INICIAL DE AGREGACIÓN HISTÓRICA
-    log_con_timestamp("Ejecutando agregación histórica inicial...", "📅")
+    # PASADA INICIAL: solo lo que llegó desde la última marca (ya no se reprocesan 30 días)
+    log_con_timestamp("Ejecutando agregación incremental inicial...", "📅")
     try:
-        resultado_historico = await ejecutar_agregacion_horaria(procesar_historico=True, dias_historia=30)
-        log_con_timestamp(f"Agregación histórica completada: {resultado_historico['affected_rows']} registros", "✅")
+        resultado_inicial = await ejecutar_agregacion_horaria()
+        log_con_timestamp(f"Agregación inicial completada: {resultado_inicial['affected_rows']} registros", "✅")
     except Exception as e:
-        log_con_timestamp(f"Error en agregación histórica: {e}", "❌")
+        log_con_timestamp(f"Error en agregación inicial: {e}", "❌")
     
-    #  PROGRAMAR EJECUCIONES FUTURAS (cada hora)
+    # Particiones de 'valores': el mes siguiente tiene que existir antes de que llegue
+    log_con_timestamp("Revisando particiones de valores...", "🗂️")
+    try:
+        resultado_particiones = await mantener_particiones_valores()
+        log_con_timestamp(f"Particiones: {resultado_particiones['status']}", "✅")
+    except Exception as e:
+        log_con_timestamp(f"Error en mantenimiento de particiones: {e}", "❌")
+    
+    #  PROGRAMAR EJECUCIONES FUTURAS (incrementales, baratas: cada pocos minutos)
     scheduler.add_job(
         ejecutar_agregacion_horaria,  
-        trigger=IntervalTrigger(hours=1),
+        trigger=IntervalTrigger(minutes=configuracion.AGREGACION_INTERVALO_MIN),
         id="trabajo_agregacion_horaria",
         name="Agregación Horaria de Datos IoT",
         replace_existing=True
     )
+    scheduler.add_job(
+        mantener_particiones_valores,
+        trigger=IntervalTrigger(hours=configuracion.VALORES_MANTENIMIENTO_HORAS),
+        id="trabajo_particiones_valores",
+        name="Particiones y retención de valores",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        archivar_valores_frios,
+        trigger=IntervalTrigger(hours=configuracion.VALORES_MANTENIMIENTO_HORAS),
+        id="trabajo_archivo_parquet",
+        name="Archivo Parquet de lecturas frías",
+        replace_existing=True
+    )
     
     scheduler.start()
     
@@ -158,6 +210,14 @@ async def lifespan(app: FastAPI):
     if hasattr(app.state, 'scheduler'):
         app.state.scheduler.shutdown()
         log_con_timestamp("Scheduler detenido correctamente", "✅")
+    # La cola se vacía antes de cerrar el pool: sus escrituras lo necesitan
+    await cola_ingesta.detener()
+    log_con_timestamp("Cola de ingesta vaciada", "✅")
+    gestor_trabajos_pronostico.cerrar()
+    ejecutor_modelos.cerrar()
+    ejecutor_db.cerrar()
+    cerrar_pool()
+    log_con_timestamp("Pool de conexiones cerrado", "✅")
 # -----------------------------------------------------
 # 🚨 3. CREACIÓN DE FASTAPI CON LIFESPAN
 # -----------------------------------------------------
@@ -168,6 +228,30 @@ aplicacion = FastAPI(
     lifespan=lifespan  # 👈 ESTO ES CLAVE
 )
 
+# Una consulta cancelada por timeout es un 504, no un error interno
+@aplicacion.exception_handler(ConsultaExcedioTiempoError)
+async def manejar_timeout_consulta(request: Request, exc: ConsultaExcedioTiempoError):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+# Entrenamientos de modelos: cola llena -> 503, timeout -> 504, cancelado -> 409
+@aplicacion.exception_handler(EntrenamientoRechazadoError)
+async def manejar_entrenamiento_rechazado(request: Request, exc: EntrenamientoRechazadoError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "10"})
+
+@aplicacion.exception_handler(EntrenamientoExcedioTiempoError)
+async def manejar_timeout_entrenamiento(request: Request, exc: EntrenamientoExcedioTiempoError):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+@aplicacion.exception_handler(EntrenamientoCanceladoError)
+async def manejar_entrenamiento_cancelado(request: Request, exc: EntrenamientoCanceladoError):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+# Trabajos de pronóstico sin cupo: 429 si es el límite del usuario, 503 si es el global
+@aplicacion.exception_handler(TrabajoPronosticoRechazadoError)
+async def manejar_trabajo_pronostico_rechazado(request: Request, exc: TrabajoPronosticoRechazadoError):
+    return JSONResponse(status_code=429 if exc.por_usuario else 503, content={"detail": str(exc)},
+                        headers={"Retry-After": "10"})
+
 # Configuración de CORS
 aplicacion.add_middleware(
     CORSMiddleware,
@@ -205,6 +289,7 @@ aplicacion.include_router(energetico_analisis_router, prefix="/api")
 aplicacion.include_router(energetico_proyecciones_router, prefix="/api")
 aplicacion.include_router(energetico_gestion_datos_router, prefix="/api")
 aplicacion.include_router(router_dashboard, prefix="/api")
+aplicacion.include_router(router_busqueda, prefix="/api")
 
 
 # Ruta principal
@@ -221,6 +306,18 @@ async def health_check():
     return {
         "status": "healthy", 
         "scheduler": scheduler_status,
+        "pool_db": obtener_pool().estadisticas(),
+        "ejecutor_db": ejecutor_db.estadisticas(),
+        "cola_ingesta": cola_ingesta.estadisticas(),
+        "dedup_paquetes": paquetes_recientes.estadisticas(),
+        "detector_anomalias": detector_anomalias.estadisticas(),
+        "cache_permisos": cache_permisos.estadisticas(),
+        "cache_conteos": cache_conteos.estadisticas(),
+        "cache_ultimos_valores": cache_ultimos_valores.estadisticas(),
+        "tiempo_real": central_tiempo_real.estadisticas(),
+        "registro_modelos": registro_modelos.estadisticas(),
+        "ejecutor_modelos": ejecutor_modelos.estadisticas(),
+        "trabajos_pronostico": gestor_trabajos_pronostico.estadisticas(),
         "timestamp": datetime.now().isoformat()
     }
 # En principal.py - DESPUÉS de crear la aplicación y ANTES de mount
@@ -276,14 +373,44 @@ async def health_check():
 
 @aplicacion.post("/api/agregacion/reciente")
 async def ejecutar_agregacion_reciente():
-    """Ejecutar agregación solo para datos recientes (últimas 2 horas)"""
+    """Ejecutar la pasada incremental (filas nuevas desde la marca de agua)"""
     return await ejecutar_agregacion_horaria(procesar_historico=False)
 
 @aplicacion.post("/api/agregacion/historica")
 async def ejecutar_agregacion_historica(dias: int = 30):
-    """Ejecutar agregación para datos históricos"""
+    """Recalcular desde cero las horas de los últimos N días"""
     return await ejecutar_agregacion_horaria(procesar_historico=True, dias_historia=dias)
 
+@aplicacion.post("/api/particiones/mantenimiento")
+async def ejecutar_mantenimiento_particiones():
+    """Crear particiones futuras de 'valores' y retirar las que exceden la retención"""
+    return await mantener_particiones_valores()
+
+@aplicacion.post("/api/archivo/parquet")
+async def ejecutar_archivo_parquet():
+    """Mover a Parquet las lecturas crudas más antiguas que ARCHIVO_PARQUET_DIAS"""
+    return await archivar_valores_frios()
+
+@aplicacion.get("/api/modelos/entrenamientos")
+async def listar_entrenamientos(user_id: int = Depends(get_current_user_id)):
+    """Entrenamientos recientes y en curso del usuario (estado, duración, error)"""
+    return {"ejecutor": ejecutor_modelos.estadisticas(), "trabajos": ejecutor_modelos.listar(user_id)}
+
+@aplicacion.get("/api/modelos/entrenamientos/{trabajo_id}")
+async def obtener_entrenamiento(trabajo_id: str, user_id: int = Depends(get_current_user_id)):
+    """Estado de un entrenamiento del usuario"""
+    trabajo = ejecutor_modelos.obtener(trabajo_id, user_id)
+    if trabajo is None:
+        return JSONResponse(status_code=404, content={"detail": "Entrenamiento no encontrado"})
+    return trabajo
+
+@aplicacion.post("/api/modelos/entrenamientos/{trabajo_id}/cancelar")
+async def cancelar_entrenamiento(trabajo_id: str, user_id: int = Depends(get_current_user_id)):
+    """Cancelar un entrenamiento propio en cola o en curso (su proceso se termina)"""
+    if not ejecutor_modelos.cancelar(trabajo_id, user_id):
+        return JSONResponse(status_code=404, content={"detail": "Entrenamiento no activo"})
+    return {"status": "success", "trabajo_id": trabajo_id}
+
 # # @aplicacion.post("/api/agregacion/completa")
 # # async def ejecutar_agregacion_completa():
 #     """Forzar agregación completa (sin filtro de existencia)"""
@@ -2,7 +2,7 @@
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import BaseModel
@@ -83,6 +83,24 @@ async def get_current_user_id(user: UserPayload = Depends(get_current_user)) ->
     """
     return user.id
 
+# Para EventSource (SSE): el navegador no permite cabeceras propias, así que
+# el token también se acepta como ?token=. La cabecera tiene prioridad.
+oauth2_scheme_opcional = OAuth2PasswordBearer(tokenUrl="/login", auto_error=False)
+
+async def get_current_user_id_flujo(
+    token_cabecera: Optional[str] = Depends(oauth2_scheme_opcional),
+    token: Optional[str] = Query(None)
+) -> int:
+    token_final = token_cabecera or token
+    if not token_final:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await get_current_user(token_final)
+    return user.id
+
 # ----------------------------------------------------------------------
 # 4. CLASE PARA PERMISOS (REQUERIR PERMISO)
 # ----------------------------------------------------------------------
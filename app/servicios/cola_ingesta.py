@@ -0,0 +1,219 @@
+# app/servicios/cola_ingesta.py
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.api.modelos.recepcion_datos import PayloadDispositivo
+from app.configuracion import configuracion
+from app.db.ejecutor_db import ejecutar_db
+from app.servicios.servicio_ingesta import clave_paquete, paquetes_recientes, es_error_transitorio
+from app.servicios.servicio_recepcion import validar_paquete, guardar_paquetes_validados
+
+
+class ColaLlenaError(Exception):
+    """La cola de ingesta alcanzó su capacidad: el cliente debe reintentar."""
+
+
+# -----------------------------------------------------------------------------
+# COLA DE INGESTA CON ESCRITURA DIFERIDA (write-behind + group commit)
+# -----------------------------------------------------------------------------
+class ColaIngesta:
+    """
+    El endpoint valida el paquete, lo encola y responde de inmediato.
+    Una tarea de fondo vacía la cola y escribe lotes en 'valores' con un solo
+    commit por lote, cuando se junta `lote_max` paquetes o pasa `intervalo_s`.
+    Si MySQL va lento la cola crece; al llenarse, se rechaza con 503.
+    """
+
+    def __init__(
+        self,
+        capacidad: int = 10000,
+        lote_max: int = 500,
+        intervalo_s: float = 0.2,
+        reintentos: int = 5
+    ):
+        self.capacidad = capacidad
+        self.lote_max = max(1, lote_max)
+        self.intervalo_s = intervalo_s
+        self.reintentos = reintentos
+
+        self._cola: Optional[asyncio.Queue] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._aceptando = False
+
+        # Métricas
+        self._encolados = 0
+        self._rechazados_llena = 0
+        self._duplicados = 0
+        self._paquetes_escritos = 0
+        self._registros_escritos = 0
+        self._lotes_escritos = 0
+        self._errores_escritura = 0
+        self._descartados = 0
+        self._ultimo_lote = 0
+        self._lag_ultimo = 0.0
+        self._lag_max = 0.0
+        self._ultima_escritura: Optional[str] = None
+
+    # --- Ciclo de vida ---------------------------------------------------------
+    def iniciar(self):
+        if self._tarea is not None:
+            return
+        self._cola = asyncio.Queue(maxsize=self.capacidad)
+        self._aceptando = True
+        self._tarea = asyncio.create_task(self._escritor(), name="escritor_cola_ingesta")
+
+    async def detener(self, timeout: float = 30.0):
+        """Deja de aceptar paquetes y espera a que se escriba lo pendiente."""
+        if self._tarea is None:
+            return
+        self._aceptando = False
+        try:
+            await asyncio.wait_for(self._cola.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ [Cola Ingesta] Cierre con {self._cola.qsize()} paquetes sin escribir (timeout {timeout}s)")
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+
+    @property
+    def activa(self) -> bool:
+        return self._tarea is not None and self._aceptando
+
+    # --- Entrada ---------------------------------------------------------------
+    def encolar(self, datos: PayloadDispositivo) -> bool:
+        """
+        Valida y encola un paquete. Devuelve False si es un reintento ya guardado.
+        Lanza ValueError si el paquete es inválido y ColaLlenaError si no hay espacio.
+        """
+        if not self.activa:
+            raise ColaLlenaError("La cola de ingesta no está aceptando paquetes.")
+
+        dispositivo_id, fecha_hora_lectura = validar_paquete(datos)
+        if configuracion.INGESTA_DEDUP and paquetes_recientes.contiene(clave_paquete(datos, dispositivo_id, fecha_hora_lectura)):
+            self._duplicados += 1
+            return False
+
+        item = (datos, dispositivo_id, fecha_hora_lectura, datetime.utcnow(), time.monotonic())
+        try:
+            self._cola.put_nowait(item)
+        except asyncio.QueueFull:
+            self._rechazados_llena += 1
+            raise ColaLlenaError(f"Cola de ingesta llena ({self.capacidad} paquetes).")
+        self._encolados += 1
+        return True
+
+    # --- Escritor de fondo -----------------------------------------------------
+    async def _juntar_lote(self) -> List[Tuple]:
+        # Espera el primer paquete sin límite y luego junta más hasta lote_max o intervalo_s
+        lote = [await self._cola.get()]
+        limite = time.monotonic() + self.intervalo_s
+        while len(lote) < self.lote_max:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(await asyncio.wait_for(self._cola.get(), timeout=restante))
+            except asyncio.TimeoutError:
+                break
+        return lote
+
+    async def _escritor(self):
+        while True:
+            lote = await self._juntar_lote()
+            try:
+                await self._escribir_con_reintentos(lote)
+            finally:
+                for _ in lote:
+                    self._cola.task_done()
+
+    async def _escribir_con_reintentos(self, lote: List[Tuple]):
+        """
+        Reintenta con espera exponencial solo los errores transitorios. Un error
+        propio de los datos (FK, DECIMAL fuera de rango, partición inexistente)
+        no se arregla reintentando: el lote se parte en dos hasta aislar el
+        paquete culpable, y solo ese se descarta.
+        """
+        validos = [item[:4] for item in lote]
+        espera = 0.5
+        for intento in range(1, self.reintentos + 1):
+            try:
+                # La escritura es bloqueante (PyMySQL): se hace en el ejecutor de BD
+                conteos = await ejecutar_db(guardar_paquetes_validados, validos)
+            except Exception as e:
+                self._errores_escritura += 1
+                if not es_error_transitorio(e):
+                    await self._aislar_fallo(lote, e)
+                    return
+                print(f"❌ [Cola Ingesta] Error escribiendo lote de {len(lote)} (intento {intento}/{self.reintentos}): {e}")
+                if intento == self.reintentos:
+                    self._descartados += len(lote)
+                    print(f"🚨 [Cola Ingesta] Se descartan {len(lote)} paquetes tras {self.reintentos} intentos")
+                    return
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, 30.0)
+                continue
+
+            self._registrar_escritura(lote, conteos)
+            return
+
+    async def _aislar_fallo(self, lote: List[Tuple], error: Exception):
+        """Bisección del lote fallido: cada mitad se escribe (y reintenta) por separado."""
+        if len(lote) == 1:
+            datos, dispositivo_id, fecha_hora_lectura = lote[0][:3]
+            self._descartados += 1
+            print(f"🚨 [Cola Ingesta] Se descarta el paquete {datos.id_paquete} del dispositivo {dispositivo_id} "
+                  f"({fecha_hora_lectura}): {error}")
+            return
+        print(f"⚠️ [Cola Ingesta] Error no transitorio en lote de {len(lote)}, se divide para aislarlo: {error}")
+        mitad = len(lote) // 2
+        await self._escribir_con_reintentos(lote[:mitad])
+        await self._escribir_con_reintentos(lote[mitad:])
+
+    def _registrar_escritura(self, lote: List[Tuple], conteos: List[Tuple]):
+        lag = time.monotonic() - min(item[4] for item in lote)
+        self._lotes_escritos += 1
+        self._paquetes_escritos += len(lote)
+        self._registros_escritos += sum(aceptados for _, aceptados, _, _ in conteos)
+        # Reintentos que llegaron mientras el original seguía en la cola
+        self._duplicados += sum(1 for _, _, _, duplicado in conteos if duplicado)
+        self._ultimo_lote = len(lote)
+        self._lag_ultimo = lag
+        self._lag_max = max(self._lag_max, lag)
+        self._ultima_escritura = datetime.now().isoformat()
+
+    # --- Métricas --------------------------------------------------------------
+    def estadisticas(self) -> Dict[str, Any]:
+        profundidad = self._cola.qsize() if self._cola is not None else 0
+        return {
+            "activa": self.activa,
+            "profundidad": profundidad,
+            "capacidad": self.capacidad,
+            "ocupacion_pct": round(profundidad / self.capacidad * 100, 2) if self.capacidad else 0.0,
+            "encolados": self._encolados,
+            "rechazados_cola_llena": self._rechazados_llena,
+            "duplicados": self._duplicados,
+            "paquetes_escritos": self._paquetes_escritos,
+            "registros_escritos": self._registros_escritos,
+            "lotes_escritos": self._lotes_escritos,
+            "ultimo_lote": self._ultimo_lote,
+            "lag_ultimo_ms": round(self._lag_ultimo * 1000, 1),
+            "lag_max_ms": round(self._lag_max * 1000, 1),
+            "errores_escritura": self._errores_escritura,
+            "descartados": self._descartados,
+            "ultima_escritura": self._ultima_escritura,
+        }
+
+
+# Instancia global (se inicia en el lifespan de principal.py si INGESTA_MODO = "cola")
+cola_ingesta = ColaIngesta(
+    capacidad=configuracion.INGESTA_COLA_CAPACIDAD,
+    lote_max=configuracion.INGESTA_COLA_LOTE_MAX,
+    intervalo_s=configuracion.INGESTA_COLA_INTERVALO_MS / 1000.0,
+    reintentos=configuracion.INGESTA_COLA_REINTENTOS
+)
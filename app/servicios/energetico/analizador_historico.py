@@ -17,6 +17,12 @@ class AnalizadorHistorico:
     
     # Columnas críticas que deben existir para que los métodos de análisis funcionen
     REQUIRED_COLS = ['periodo', 'consumo_total_kwh', 'costo_total', 'demanda_maxima_kw', COLUMNA_LOTE]
+
+    # Columnas numéricas del recibo: se convierten de una vez a float64 (NaN -> 0)
+    COLUMNAS_NUMERICAS = ['consumo_total_kwh', 'costo_total', 'demanda_maxima_kw', 'factor_potencia', 'dias_facturados', 'kwh_punta']
+
+    # Máximo de correcciones detalladas en el log (el resto solo se cuenta)
+    MAX_CORRECCIONES_LOG = 5
     
     def __init__(self, df_completo: Optional[pd.DataFrame] = None):
         """
@@ -51,7 +57,8 @@ class AnalizadorHistorico:
             
         # 2. Conversión y Limpieza
         self._df_completo['periodo'] = pd.to_datetime(self._df_completo['periodo'], errors='coerce')
-        self._df_completo[self.COLUMNA_LOTE] = self._df_completo[self.COLUMNA_LOTE].astype(str).str.strip()
+        # Pocos lotes repetidos en muchas filas: categórica (menos memoria, isin más rápido)
+        self._df_completo[self.COLUMNA_LOTE] = self._df_completo[self.COLUMNA_LOTE].astype(str).str.strip().astype('category')
         self._df_completo.dropna(subset=['periodo'], inplace=True) 
 
         if self._df_completo.empty:
@@ -64,11 +71,9 @@ class AnalizadorHistorico:
         # 4. Ordenar y Calcular Métricas Derivadas
         self._df_completo = self._df_completo.sort_values('periodo').reset_index(drop=True)
         
-        # Cálculo de costo_por_kwh
-        self._df_completo['costo_por_kwh'] = self._df_completo.apply(
-            lambda row: (row['costo_total'] / row['consumo_total_kwh']) if row['consumo_total_kwh'] and row['consumo_total_kwh'] > 0 else 0,
-            axis=1
-        ).astype(float).replace([np.inf, -np.inf], np.nan).fillna(0)
+        # Cálculo de costo_por_kwh (0 si no hay consumo positivo)
+        consumo = self._df_completo['consumo_total_kwh']
+        self._df_completo['costo_por_kwh'] = (self._df_completo['costo_total'] / consumo.where(consumo > 0)).fillna(0.0)
         
         # Cálculo de mes y año
         self._df_completo['mes'] = self._df_completo['periodo'].dt.month
@@ -84,9 +89,9 @@ class AnalizadorHistorico:
             return
 
         # Conversión y llenado de NaNs a 0
-        for col in ['consumo_total_kwh', 'costo_total', 'demanda_maxima_kw', 'factor_potencia', 'dias_facturados', 'kwh_punta']:
+        for col in self.COLUMNAS_NUMERICAS:
             if col in df_target.columns:
-                df_target[col] = pd.to_numeric(df_target[col], errors='coerce').fillna(0)
+                df_target[col] = pd.to_numeric(df_target[col], errors='coerce').fillna(0).astype('float64')
 
         consumo_median = df_target['consumo_total_kwh'].median()
         if pd.isna(consumo_median) or consumo_median == 0:
@@ -100,12 +105,17 @@ class AnalizadorHistorico:
                                (df_target['consumo_total_kwh'] > 1000)
         
         if condicion_correccion.any():
-            indices_a_corregir = df_target[condicion_correccion].index
-            for idx in indices_a_corregir:
-                consumo_original = df_target.loc[idx, 'consumo_total_kwh']
-                correccion = consumo_original * 10
-                logger.warning(f"⚠️ Posible error en {df_target.loc[idx, 'periodo'].strftime('%Y-%m-%d')} (lote: {df_target.loc[idx, self.COLUMNA_LOTE] if self.COLUMNA_LOTE in df_target.columns else 'N/A'}): Corrigiendo {consumo_original} a {correccion}")
-                df_target.loc[idx, 'consumo_total_kwh'] = correccion
+            originales = df_target.loc[condicion_correccion, 'consumo_total_kwh']
+            df_target.loc[condicion_correccion, 'consumo_total_kwh'] = originales * 10
+
+            # Un solo aviso con las primeras correcciones (un log por fila dominaba el tiempo)
+            muestra = df_target.loc[originales.index[:self.MAX_CORRECCIONES_LOG]]
+            lotes = muestra[self.COLUMNA_LOTE] if self.COLUMNA_LOTE in muestra.columns else pd.Series('N/A', index=muestra.index)
+            detalle = "; ".join(
+                f"{fecha} (lote: {lote}): {original} -> {original * 10}"
+                for fecha, lote, original in zip(muestra['periodo'].dt.strftime('%Y-%m-%d'), lotes, originales.iloc[:self.MAX_CORRECCIONES_LOG])
+            )
+            logger.warning(f"⚠️ {len(originales)} consumos con posible error de escala corregidos (x10): {detalle}")
     
     def get_filtered_df_by_lotes(self, nombres_lotes: Optional[List[str]]) -> pd.DataFrame:
         """
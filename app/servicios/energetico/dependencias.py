@@ -9,10 +9,12 @@ from datetime import datetime, timedelta # <-- Añadir estas importaciones
 
 # 🎯 Importa la función de acceso a datos de PyMySQL
 from app.db.crud.recibos_crud import get_all_recibos_by_lotes 
+from app.db.ejecutor_db import ejecutar_db
 
 from app.servicios.energetico.analizador_historico import AnalizadorHistorico
 from app.servicios.energetico.predictor_consumo import PredictorConsumo
 from app.servicios.energetico.generador_escenarios import GeneradorEscenarios
+from app.servicios.energetico.registro_modelos import registro_modelos
 
 # 🎯 Importa el ID de usuario para la carga inicial del Analizador
 from app.servicios.auth_utils import get_current_user_id 
@@ -57,6 +59,8 @@ def invalidate_user_dataframe_cache(user_id: int):
     if user_id in generador_instances:
         del generador_instances[user_id]
         logger.info(f"DEBUG: Instancia de GeneradorEscenarios eliminada para user_id: {user_id}.")
+    # Modelos entrenados con los datos anteriores (memoria y disco)
+    registro_modelos.invalidar_usuario(user_id)
 
 
 async def get_analizador(user_id: int = Depends(get_current_user_id)) -> AnalizadorHistorico:
@@ -82,7 +86,7 @@ async def get_analizador(user_id: int = Depends(get_current_user_id)) -> Analiza
     
     try:
         # Cargar los datos del usuario desde la DB (sin filtrar lotes inicialmente)
-        datos_db_raw = get_all_recibos_by_lotes(user_id=user_id, lotes=None)
+        datos_db_raw = await ejecutar_db(get_all_recibos_by_lotes, user_id=user_id, lotes=None)
         
         if not datos_db_raw:
             logger.warning(f"No se encontraron recibos de energía para el user_id: {user_id}. Inicializando Analizador con DF vacío.")
@@ -113,7 +117,7 @@ async def get_predictor(user_id: int = Depends(get_current_user_id)) -> Predicto
     """
     if user_id not in predictor_instances:
         logger.info(f"Iniciando instancia Singleton de PredictorConsumo para user_id: {user_id}...")
-        predictor_instances[user_id] = PredictorConsumo()
+        predictor_instances[user_id] = PredictorConsumo(user_id=user_id)
     return predictor_instances[user_id]
 
 
@@ -0,0 +1,260 @@
+# app/servicios/energetico/ejecutor_modelos.py
+
+import asyncio
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from app.configuracion import configuracion
+from app.servicios.energetico.proceso_entrenamiento import ejecutar_trabajo
+
+# Valor centinela: "usar MODELOS_TIMEOUT_S"
+_TIMEOUT_POR_DEFECTO = object()
+
+_MODULO_TRABAJOS = "app.servicios.energetico.proceso_entrenamiento"
+
+
+class ErrorEntrenamiento(RuntimeError):
+    """Base de los fallos del ejecutor de modelos (no del ajuste en sí)."""
+
+
+class EntrenamientoRechazadoError(ErrorEntrenamiento):
+    """Cola de entrenamientos llena: el cliente debe reintentar más tarde."""
+
+
+class EntrenamientoExcedioTiempoError(ErrorEntrenamiento, TimeoutError):
+    """El entrenamiento superó su tiempo máximo y su proceso fue terminado."""
+
+
+class EntrenamientoCanceladoError(ErrorEntrenamiento):
+    """El entrenamiento se canceló desde /api/modelos/entrenamientos."""
+
+
+def _recibir(receptor):
+    try:
+        return receptor.recv()
+    except EOFError:
+        # El proceso murió (terminado por timeout/cancelación o por el sistema)
+        return ("error", "el proceso de entrenamiento terminó sin respuesta")
+    finally:
+        receptor.close()
+
+
+# -----------------------------------------------------------------------------
+# 1. EJECUTOR EN PROCESOS
+# -----------------------------------------------------------------------------
+class EjecutorModelos:
+    """
+    Corre los ajustes pesados (Prophet/Stan) en procesos aparte para que no
+    bloqueen el event loop ni compitan por el GIL con la ingesta.
+    Un proceso por trabajo, nacido del servidor 'forkserver' que ya tiene
+    Prophet importado (el proceso principal no lo necesita para encolar): arrancar cuesta milisegundos y un trabajo colgado se
+    puede terminar sin afectar a los demás (un ProcessPoolExecutor no permite
+    matar una tarea en curso).
+    Como mucho `procesos` trabajos a la vez y `max_cola` esperando; el
+    siguiente se rechaza con EntrenamientoRechazadoError.
+    """
+
+    def __init__(self, procesos: int, max_cola: int, timeout_defecto: Optional[float], historial: int = 200):
+        self.procesos = max(1, procesos)
+        self.max_cola = max(0, max_cola)
+        self.timeout_defecto = timeout_defecto
+        self.historial = max(1, historial)
+        self._contexto = None
+        self._semaforo: Optional[asyncio.Semaphore] = None
+
+        # Estado (solo se toca desde el event loop)
+        self._trabajos: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._procesos: Dict[str, Any] = {}
+        self._tareas: Dict[str, asyncio.Task] = {}
+        self._pendientes = 0   # en cola + en curso
+        self._en_curso = 0
+        self._completados = 0
+        self._errores = 0
+        self._timeouts = 0
+        self._cancelados = 0
+        self._rechazados = 0
+
+    def _obtener_contexto(self):
+        if self._contexto is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                self._contexto = multiprocessing.get_context("forkserver")
+                self._contexto.set_forkserver_preload([_MODULO_TRABAJOS, "prophet", "prophet.serialize"])
+            else:
+                self._contexto = multiprocessing.get_context("spawn")
+        return self._contexto
+
+    def _obtener_semaforo(self) -> asyncio.Semaphore:
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.procesos)
+        return self._semaforo
+
+    def _registrar(self, descripcion: str, user_id: Optional[int]) -> Dict[str, Any]:
+        trabajo = {
+            "id": uuid.uuid4().hex[:12],
+            "_user_id": user_id,
+            "descripcion": descripcion,
+            "estado": "en_cola",
+            "encolado_en": datetime.now().isoformat(),
+            "iniciado_en": None,
+            "terminado_en": None,
+            "duracion_s": None,
+            "pid": None,
+            "error": None,
+        }
+        self._trabajos[trabajo["id"]] = trabajo
+        # Solo se olvidan trabajos ya terminados
+        while len(self._trabajos) > self.historial:
+            viejo = next((t for t in self._trabajos.values() if t["terminado_en"]), None)
+            if viejo is None:
+                break
+            del self._trabajos[viejo["id"]]
+        return trabajo
+
+    def _terminar(self, trabajo: Dict[str, Any], estado: str, inicio: float, error: Optional[str] = None):
+        trabajo["estado"] = estado
+        trabajo["terminado_en"] = datetime.now().isoformat()
+        trabajo["duracion_s"] = round(time.monotonic() - inicio, 3)
+        trabajo["error"] = error
+
+    async def _correr(self, trabajo: Dict[str, Any], funcion: Callable, args: tuple) -> Any:
+        await self._obtener_semaforo().acquire()
+
+        proceso = None
+        self._en_curso += 1
+        try:
+            contexto = self._obtener_contexto()
+            receptor, emisor = contexto.Pipe(duplex=False)
+            nuevo = contexto.Process(target=ejecutar_trabajo, args=(emisor, funcion, args), daemon=True)
+            nuevo.start()
+            proceso = nuevo
+            emisor.close()
+            self._procesos[trabajo["id"]] = proceso
+            trabajo["estado"] = "ejecutando"
+            trabajo["iniciado_en"] = datetime.now().isoformat()
+            trabajo["pid"] = proceso.pid
+
+            resultado, valor = await asyncio.get_running_loop().run_in_executor(None, _recibir, receptor)
+            if resultado != "ok":
+                raise ErrorEntrenamiento(valor)
+            return valor
+        finally:
+            self._en_curso -= 1
+            self._procesos.pop(trabajo["id"], None)
+            if proceso is not None and proceso.is_alive():
+                # Timeout o cancelación: el hilo que espera en recv() sale con EOF
+                proceso.terminate()
+            if proceso is not None:
+                threading.Thread(target=proceso.join, daemon=True).start()
+            self._obtener_semaforo().release()
+
+    async def ejecutar(self, funcion: Callable, *args, descripcion: str = "", user_id: Optional[int] = None,
+                       timeout: Any = _TIMEOUT_POR_DEFECTO) -> Any:
+        """
+        Ejecuta `funcion(*args)` en un proceso de entrenamiento. `funcion` y
+        sus argumentos viajan por pickle: la función debe ser de nivel de
+        módulo (ver proceso_entrenamiento).
+        `user_id` es el dueño: solo él ve y cancela el trabajo por la API.
+        El tiempo cuenta desde que se encola, como en EjecutorDB.
+        """
+        if timeout is _TIMEOUT_POR_DEFECTO:
+            timeout = self.timeout_defecto
+        if self._pendientes >= self.procesos + self.max_cola:
+            self._rechazados += 1
+            raise EntrenamientoRechazadoError(
+                f"Cola de entrenamientos llena ({self._pendientes - self._en_curso} en espera, "
+                f"{self._en_curso} en curso). Reintente más tarde."
+            )
+
+        trabajo = self._registrar(descripcion, user_id)
+        self._pendientes += 1
+        inicio = time.monotonic()
+        tarea = asyncio.ensure_future(self._correr(trabajo, funcion, args))
+        self._tareas[trabajo["id"]] = tarea
+        try:
+            valor = await asyncio.wait_for(tarea, timeout=timeout)
+            self._completados += 1
+            self._terminar(trabajo, "completado", inicio)
+            return valor
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            self._terminar(trabajo, "timeout", inicio, f"excedió {timeout:.1f}s")
+            raise EntrenamientoExcedioTiempoError(
+                f"El entrenamiento '{descripcion or trabajo['id']}' excedió {timeout:.1f}s y fue cancelado."
+            )
+        except asyncio.CancelledError:
+            self._cancelados += 1
+            cancelado_por_api = trabajo["estado"] == "cancelando"
+            self._terminar(trabajo, "cancelado", inicio)
+            # Si lo canceló cancelar() (y no la desconexión del cliente) se informa como error propio
+            if cancelado_por_api and not asyncio.current_task().cancelling():
+                raise EntrenamientoCanceladoError(f"Entrenamiento {trabajo['id']} cancelado.")
+            raise
+        except ErrorEntrenamiento as e:
+            self._errores += 1
+            self._terminar(trabajo, "error", inicio, str(e))
+            raise
+        finally:
+            self._pendientes -= 1
+            self._tareas.pop(trabajo["id"], None)
+
+    def _del_usuario(self, trabajo_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is None or trabajo["_user_id"] != user_id:
+            return None
+        return trabajo
+
+    @staticmethod
+    def _publico(trabajo: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in trabajo.items() if not k.startswith("_")}
+
+    def cancelar(self, trabajo_id: str, user_id: int) -> bool:
+        """Cancela un trabajo del usuario en cola o en curso (su proceso se termina). False si no está activo o no es suyo."""
+        tarea = self._tareas.get(trabajo_id)
+        if tarea is None or tarea.done() or self._del_usuario(trabajo_id, user_id) is None:
+            return False
+        self._trabajos[trabajo_id]["estado"] = "cancelando"
+        tarea.cancel()
+        return True
+
+    def obtener(self, trabajo_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        """El trabajo si existe y es del usuario."""
+        trabajo = self._del_usuario(trabajo_id, user_id)
+        return self._publico(trabajo) if trabajo else None
+
+    def listar(self, user_id: int) -> List[Dict[str, Any]]:
+        return [self._publico(t) for t in reversed(self._trabajos.values()) if t["_user_id"] == user_id]
+
+    def cerrar(self):
+        for proceso in list(self._procesos.values()):
+            if proceso.is_alive():
+                proceso.terminate()
+        for tarea in list(self._tareas.values()):
+            tarea.cancel()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "procesos": self.procesos,
+            "max_cola": self.max_cola,
+            "timeout_defecto_s": self.timeout_defecto,
+            "en_cola": self._pendientes - self._en_curso,
+            "en_curso": self._en_curso,
+            "completados": self._completados,
+            "errores": self._errores,
+            "timeouts": self._timeouts,
+            "cancelados": self._cancelados,
+            "rechazados": self._rechazados,
+        }
+
+
+# Instancia global: todos los PredictorConsumo comparten el límite de procesos
+ejecutor_modelos = EjecutorModelos(
+    procesos=configuracion.MODELOS_PROCESOS,
+    max_cola=configuracion.MODELOS_COLA_MAX,
+    timeout_defecto=configuracion.MODELOS_TIMEOUT_S,
+    historial=configuracion.MODELOS_HISTORIAL_TRABAJOS,
+)
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 
 from app.servicios.energetico.analizador_historico import AnalizadorHistorico
 from app.servicios.energetico.predictor_consumo import PredictorConsumo
+from app.servicios.energetico.ejecutor_modelos import ErrorEntrenamiento
 from app.api.modelos.energetico.energetico import EscenarioPayload 
 
 logger = logging.getLogger(__name__)
@@ -73,19 +74,22 @@ class GeneradorEscenarios:
             # Usamos 'records' para obtener una lista de diccionarios (ideal para Vue/JS)
             datos_historicos_json = df_historico_filtrado.to_dict('records')
             
-            # 2. Entrenar el predictor con el DataFrame filtrado
-            entrenamiento_result = await self.predictor.train(df_historico_filtrado)
+            # 2. Entrenar un predictor propio de esta simulación: el compartido del usuario
+            #    se pisaría entre peticiones concurrentes (train de una, predict de otra).
+            #    El registro de modelos evita reentrenar si los datos no cambiaron.
+            predictor = PredictorConsumo(user_id=self.predictor.user_id)
+            entrenamiento_result = await predictor.train(df_historico_filtrado, modelo=payload.modelo)
             
             if "error" in entrenamiento_result:
                 logger.error(f"GeneradorEscenarios: El predictor falló al entrenar. Detalle: {entrenamiento_result['error']}")
                 return {"error": f"El modelo predictivo no está listo o falló al entrenar: {entrenamiento_result['error']}"}
 
-            if not self.predictor._is_trained():
+            if not predictor._is_trained():
                     logger.error("GeneradorEscenarios: El modelo predictor no se entrenó exitosamente.")
                     return {"error": "El modelo predictivo no está listo o falló al entrenar."}
 
             # 3. Predecir consumo futuro base
-            predicciones_consumo_base = await self.predictor.predecir_consumo_kwh(payload.meses_a_predecir)
+            predicciones_consumo_base = await predictor.predecir_consumo_kwh(payload.meses_a_predecir)
 
             if 'error' in predicciones_consumo_base:
                 logger.error(f"GeneradorEscenarios: Error al generar predicciones de consumo base: {predicciones_consumo_base['error']}")
@@ -94,7 +98,7 @@ class GeneradorEscenarios:
             # 4. Obtener costo base y predicción de costo
             costo_kwh_base = self._get_base_costo_kwh(df_historico_filtrado)
             
-            predicciones_costo_base = await self.predictor.predecir_costo(df_historico_filtrado, payload.meses_a_predecir)
+            predicciones_costo_base = await predictor.predecir_costo(df_historico_filtrado, payload.meses_a_predecir, modelo=payload.modelo)
             
             if 'error' in predicciones_costo_base:
                 logger.error(f"GeneradorEscenarios: Error al generar predicciones de costo base: {predicciones_costo_base['error']}")
@@ -147,7 +151,7 @@ class GeneradorEscenarios:
             porcentaje_ahorro_costo = (ahorro_costo_mxn / total_costo_base * 100) if total_costo_base > 0 else 0
 
             # Obtener métricas del modelo (para la respuesta)
-            metricas_modelo_base_result = await self.predictor.predecir_consumo_kwh(1)
+            metricas_modelo_base_result = await predictor.predecir_consumo_kwh(1)
             metricas_modelo_base = metricas_modelo_base_result.get('metricas_modelo', {})
 
             # --- Estructura de retorno para el frontend ---
@@ -163,13 +167,16 @@ class GeneradorEscenarios:
                         "tasa_crecimiento_consumo": payload.tasa_crecimiento_consumo,
                         "mejora_eficiencia_consumo": payload.mejora_eficiencia_consumo
                     },
-                    "lotes_simulados": self.predictor.lotes_del_entrenamiento
+                    "lotes_simulados": predictor.lotes_del_entrenamiento
                 },
                 "predicciones_escenario": resultados_escenario,
                 # 👈 NUEVO CAMPO SOLICITADO
                 "datos_historicos_usados": datos_historicos_json, 
             }
 
+        except ErrorEntrenamiento:
+            # Saturación/timeout del ejecutor de modelos: lo traduce a 503/504 el manejador global
+            raise
         except Exception as e:
             logger.error(f"Error generando escenario personalizado: {str(e)}", exc_info=True)
             return {"error": f"Error interno al generar el escenario: {str(e)}"}
\ No newline at end of file
@@ -11,6 +11,7 @@ import logging
 from app.api.modelos.energetico.energetico import ReciboEnergiaCrear
 from app.db.crud import recibos_crud # Importamos el módulo CRUD para la inserción
 from app.servicios.servicio_simulacion import get_db_connection # Asumo que este es el que usas para la DB
+from app.db.ejecutor_db import en_hilo_db
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +28,8 @@ ALL_CSV_COLUMNS = [
     'tarifa', 'kwh_punta'
 ]
 
-async def procesar_y_guardar_csv_recibos(
+@en_hilo_db(timeout=None)
+def procesar_y_guardar_csv_recibos(
     file_contents: bytes, 
     lote_nombre: str, 
     user_id: int
@@ -0,0 +1,122 @@
+# app/servicios/energetico/motor_ets.py
+
+# Holt-Winters aditivo con tendencia amortiguada, ETS(A,Ad,A), en NumPy puro.
+# Pensado para series mensuales de recibos (decenas de puntos): ajusta en
+# milisegundos y no importa Prophet ni sklearn. Sin dependencias de 'app'.
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+PERIODO_ESTACIONAL = 12
+Z_95 = 1.96
+
+# Rejilla de parámetros. Todas las combinaciones se filtran a la vez: cada
+# estado es un vector con una posición por combinación y solo se itera en el
+# tiempo. beta se expresa relativa a alfa (0 < beta < alfa, región admisible).
+_ALFAS = np.linspace(0.05, 0.95, 10)
+_BETAS_RELATIVAS = np.array([0.01, 0.05, 0.1, 0.2, 0.4, 0.7])
+_GAMMAS = np.array([0.0, 0.05, 0.1, 0.2, 0.35, 0.5])
+_FIS = np.array([0.8, 0.85, 0.9, 0.95, 0.98, 1.0])
+
+# Mínimos de la serie: tendencia desde 4 puntos, estacionalidad con dos ciclos completos
+MIN_PUNTOS = 4
+
+
+def _rejilla(estacional: bool):
+    gammas = _GAMMAS if estacional else np.array([0.0])
+    a, br, g, f = np.meshgrid(_ALFAS, _BETAS_RELATIVAS, gammas, _FIS, indexing="ij")
+    a, br, g, f = a.ravel(), br.ravel(), g.ravel(), f.ravel()
+    validas = g <= 1.0 - a
+    return a[validas], (a * br)[validas], g[validas], f[validas]
+
+
+def _estados_iniciales(y: np.ndarray, estacional: bool):
+    m = PERIODO_ESTACIONAL
+    if estacional:
+        primer_ciclo = y[:m].mean()
+        nivel = primer_ciclo
+        tendencia = (y[m:2 * m].mean() - primer_ciclo) / m
+        estacion = y[:m] - primer_ciclo
+    else:
+        nivel = y[0]
+        tendencia = np.diff(y[:MIN_PUNTOS]).mean()
+        estacion = np.zeros(m)
+    return nivel, tendencia, estacion
+
+
+def _filtrar(y: np.ndarray, alfa, beta, gamma, fi, nivel0: float, tendencia0: float, estacion0: np.ndarray):
+    """Recorre la serie para todas las combinaciones; devuelve SSE y estados finales por combinación."""
+    m = PERIODO_ESTACIONAL
+    combinaciones = alfa.shape[0]
+    nivel = np.full(combinaciones, nivel0, dtype=float)
+    tendencia = np.full(combinaciones, tendencia0, dtype=float)
+    estacion = np.tile(estacion0.astype(float), (combinaciones, 1))
+    sse = np.zeros(combinaciones)
+
+    for t, valor in enumerate(y):
+        i = t % m
+        base = nivel + fi * tendencia
+        error = valor - (base + estacion[:, i])
+        sse += error * error
+        nivel = base + alfa * error
+        tendencia = fi * tendencia + beta * error
+        estacion[:, i] += gamma * error
+    return sse, nivel, tendencia, estacion
+
+
+def ajustar_ets(serie) -> Optional[Dict[str, Any]]:
+    """
+    Ajusta ETS(A,Ad,A) por mínimos cuadrados sobre la rejilla de parámetros.
+    Sin dos ciclos completos (24 meses) la estacionalidad no es estimable y se
+    ajusta ETS(A,Ad,N). None si la serie es demasiado corta o no es finita.
+    """
+    y = np.asarray(serie, dtype=float)
+    if y.size < MIN_PUNTOS or not np.all(np.isfinite(y)):
+        return None
+
+    estacional = y.size >= 2 * PERIODO_ESTACIONAL
+    alfa, beta, gamma, fi = _rejilla(estacional)
+    nivel0, tendencia0, estacion0 = _estados_iniciales(y, estacional)
+    sse, nivel, tendencia, estacion = _filtrar(y, alfa, beta, gamma, fi, nivel0, tendencia0, estacion0)
+
+    mejor = int(np.argmin(sse))
+    parametros_libres = 4 if estacional else 3
+    return {
+        "alfa": float(alfa[mejor]),
+        "beta": float(beta[mejor]),
+        "gamma": float(gamma[mejor]),
+        "fi": float(fi[mejor]),
+        "nivel": float(nivel[mejor]),
+        "tendencia": float(tendencia[mejor]),
+        "estacion": estacion[mejor].copy(),
+        "estacional": estacional,
+        "sigma2": float(sse[mejor] / max(1, y.size - parametros_libres)),
+        "n": int(y.size),
+    }
+
+
+def pronosticar_ets(modelo: Dict[str, Any], horizonte: int, z: float = Z_95) -> Dict[str, np.ndarray]:
+    """
+    Pronóstico a `horizonte` pasos con intervalos analíticos (Hyndman et al.,
+    modelos ETS de clase 1): var_h = sigma2 * (1 + sum_{j<h} c_j^2), con
+    c_j = alfa + beta * (fi + ... + fi^j) + gamma * [j múltiplo de 12].
+    """
+    m = PERIODO_ESTACIONAL
+    j = np.arange(1, horizonte + 1)
+    fi_acumulado = np.cumsum(modelo["fi"] ** j)
+    tendencia = modelo["nivel"] + fi_acumulado * modelo["tendencia"]
+    estacion = modelo["estacion"][(modelo["n"] + j - 1) % m] if modelo["estacional"] else 0.0
+    media = tendencia + estacion
+
+    c = modelo["alfa"] + modelo["beta"] * fi_acumulado + modelo["gamma"] * (j % m == 0)
+    # Para h=1 la suma es vacía: se desplaza un paso la suma acumulada de c_j^2
+    suma_c2 = np.concatenate(([0.0], np.cumsum(c[:-1] ** 2)))
+    desviacion = np.sqrt(modelo["sigma2"] * (1.0 + suma_c2))
+
+    return {
+        "media": media,
+        "inferior": media - z * desviacion,
+        "superior": media + z * desviacion,
+        "tendencia": tendencia,
+    }
@@ -1,23 +1,38 @@
+import asyncio
 import pandas as pd
 import numpy as np
-from prophet import Prophet
 from typing import Dict, Any, List, Optional
 import logging
-from sklearn.linear_model import LinearRegression 
 from datetime import datetime, timedelta
 
+# Prophet y sklearn se importan al usarse: son lo más lento del arranque y con
+# series cortas el motor ETS (NumPy) los evita por completo
+from app.configuracion import configuracion
+from app.servicios.energetico.motor_ets import ajustar_ets, pronosticar_ets
+from app.servicios.energetico.registro_modelos import registro_modelos, huella_datos, clave_modelo
+from app.servicios.energetico.ejecutor_modelos import (
+    ejecutor_modelos, EntrenamientoRechazadoError, EntrenamientoExcedioTiempoError, EntrenamientoCanceladoError
+)
+from app.servicios.energetico.proceso_entrenamiento import ajustar_prophet
+
 logger = logging.getLogger(__name__)
 
+# Modelos seleccionables por petición ("auto": ETS en series cortas, Prophet en las largas)
+MODELOS_DISPONIBLES = ("auto", "ets", "prophet", "lineal")
+
 class PredictorConsumo:
     """
-    Clase para predecir el consumo energético (Prophet/Lineal).
+    Clase para predecir el consumo energético (Prophet/ETS/Lineal).
     Opera sobre un DataFrame de datos filtrados pasado en el método train().
+    Con user_id, los modelos entrenados y sus pronósticos se reutilizan a
+    través del registro de modelos mientras los datos no cambien.
     """
     
-    def __init__(self):
-        self.modelo_prophet: Optional[Prophet] = None
-        self.modelo_lineal: Optional[LinearRegression] = None
+    def __init__(self, user_id: Optional[int] = None):
+        self.modelo_prophet: Optional[Any] = None   # prophet.Prophet
+        self.modelo_lineal: Optional[Any] = None    # sklearn LinearRegression
         self.std_error_lineal: float = 0.0
+        self.modelo_ets: Optional[Dict[str, Any]] = None
         
         # Estado interno del entrenamiento
         self.df_entrenado: Optional[pd.DataFrame] = None
@@ -25,6 +40,10 @@ class PredictorConsumo:
         self.rango_fechas_entrenamiento: Dict[str, str] = {}
         self.ultimo_valor_real: float = 0.0
         self.lotes_del_entrenamiento: Optional[List[str]] = None # Almacenará los lotes usados
+
+        # Registro de modelos (solo si se conoce el usuario)
+        self.user_id: Optional[int] = user_id
+        self._clave_registro: Optional[str] = None
         
         logger.debug("PredictorConsumo inicializado.")
 
@@ -40,14 +59,35 @@ class PredictorConsumo:
 
     def _is_trained(self) -> bool:
         """Verifica si algún modelo fue entrenado exitosamente."""
-        return self.modelo_prophet is not None or self.modelo_lineal is not None
+        return self.modelo_prophet is not None or self.modelo_lineal is not None or self.modelo_ets is not None
     
+    def _exportar_estado(self) -> Dict[str, Any]:
+        """Estado entrenado que se guarda en el registro de modelos."""
+        return {
+            "modelo_prophet": self.modelo_prophet,
+            "modelo_lineal": self.modelo_lineal,
+            "std_error_lineal": self.std_error_lineal,
+            "modelo_ets": self.modelo_ets,
+            "df_entrenado": self.df_entrenado,
+            "modelo_usado": self.modelo_usado,
+            "rango_fechas_entrenamiento": self.rango_fechas_entrenamiento,
+            "ultimo_valor_real": self.ultimo_valor_real,
+            "lotes_del_entrenamiento": self.lotes_del_entrenamiento,
+        }
+
+    def _cargar_estado(self, estado: Dict[str, Any]):
+        for atributo, valor in estado.items():
+            setattr(self, atributo, valor)
+
     # ----------------------------------------------------
     # MÉTODOS DE ENTRENAMIENTO (PRIVADOS)
     # ----------------------------------------------------
     
     async def _train_prophet(self, df: pd.DataFrame) -> bool:
-        """Lógica de entrenamiento de Prophet."""
+        """
+        Lógica de entrenamiento de Prophet. El ajuste (Stan) corre en un proceso
+        del ejecutor de modelos; aquí solo se espera sin bloquear el event loop.
+        """
         try:
             df_prophet = df[['periodo', 'consumo_total_kwh']].copy()
             df_prophet.columns = ['ds', 'y']
@@ -57,17 +97,21 @@ class PredictorConsumo:
                 self.modelo_prophet = None
                 return False
 
-            self.modelo_prophet = Prophet(yearly_seasonality=True, weekly_seasonality=False,
-                                          daily_seasonality=False, changepoint_prior_scale=0.05,
-                                          seasonality_prior_scale=10.0)
-            if len(df_prophet['ds'].dt.to_period('M').unique()) > 1:
-                self.modelo_prophet.add_seasonality(name='monthly', period=30.5, fourier_order=5)
-            
-            self.modelo_prophet.fit(df_prophet)
+            estacionalidad_mensual = len(df_prophet['ds'].dt.to_period('M').unique()) > 1
+            modelo_json = await ejecutor_modelos.ejecutar(
+                ajustar_prophet, df_prophet, estacionalidad_mensual,
+                descripcion=f"prophet registros={len(df_prophet)}", user_id=self.user_id
+            )
+            from prophet.serialize import model_from_json
+            self.modelo_prophet = await asyncio.to_thread(model_from_json, modelo_json)
             self.df_entrenado = df_prophet 
             self.ultimo_valor_real = float(self.df_entrenado['y'].iloc[-1])
             logger.info("Modelo Prophet entrenado exitosamente.")
             return True
+        except (EntrenamientoRechazadoError, EntrenamientoExcedioTiempoError, EntrenamientoCanceladoError):
+            # Saturación, timeout o cancelación: no es un fallo del modelo, no hay fallback lineal
+            self.modelo_prophet = None
+            raise
         except Exception as e:
             logger.error(f"Error entrenando Prophet: {e}", exc_info=True)
             self.modelo_prophet = None
@@ -84,6 +128,8 @@ class PredictorConsumo:
                 self.std_error_lineal = 0.0
                 return False
 
+            from sklearn.linear_model import LinearRegression
+
             df_temp['mes_num'] = range(len(df_temp))
             
             X = df_temp[['mes_num']].values
@@ -105,17 +151,49 @@ class PredictorConsumo:
             self.std_error_lineal = 0.0
             return False
 
-    async def train(self, df_historico: pd.DataFrame):
+    async def _train_ets(self, df: pd.DataFrame) -> bool:
+        """Holt-Winters con tendencia amortiguada (motor_ets): milisegundos, sin proceso aparte."""
+        try:
+            # ETS trata cada fila como un mes: con varios lotes el mismo periodo se repite,
+            # así que se ajusta sobre el consumo total de cada mes
+            df_temp = df.groupby('periodo', as_index=False)['consumo_total_kwh'].sum()
+            df_temp = df_temp.sort_values('periodo')
+
+            self.modelo_ets = ajustar_ets(df_temp['consumo_total_kwh'].to_numpy(dtype=float))
+            if self.modelo_ets is None:
+                return False
+
+            self.df_entrenado = df_temp
+            self.ultimo_valor_real = float(df_temp['consumo_total_kwh'].iloc[-1])
+            logger.info(f"Modelo ETS entrenado exitosamente (estacional={self.modelo_ets['estacional']}, fi={self.modelo_ets['fi']}).")
+            return True
+        except Exception as e:
+            logger.error(f"Error entrenando ETS: {e}", exc_info=True)
+            self.modelo_ets = None
+            return False
+
+    def _elegir_modelo(self, modelo: str, meses: int) -> str:
+        if modelo in ("ets", "prophet", "lineal"):
+            return modelo
+        return "ets" if meses < configuracion.PRONOSTICO_ETS_MAX_REGISTROS else "prophet"
+
+    async def train(self, df_historico: pd.DataFrame, modelo: str = "auto"):
         """
         Método principal de entrenamiento. Decide qué modelo usar basado en el DF filtrado.
+        `modelo` fuerza uno de MODELOS_DISPONIBLES; "auto" usa ETS por debajo de
+        PRONOSTICO_ETS_MAX_REGISTROS meses distintos y Prophet por encima (con
+        varios lotes hay más filas que meses).
         """
+        if modelo not in MODELOS_DISPONIBLES:
+            return {"error": f"Modelo desconocido '{modelo}'. Opciones: {', '.join(MODELOS_DISPONIBLES)}."}
         if not isinstance(df_historico, pd.DataFrame) or df_historico.empty:
             logger.error("No se proporcionaron datos válidos para el entrenamiento.")
             return {"error": "No se proporcionaron datos válidos para el entrenamiento."}
 
         # Reiniciar modelos y estado antes de cada entrenamiento
-        self.modelo_prophet = None; self.modelo_lineal = None; self.std_error_lineal = 0.0
+        self.modelo_prophet = None; self.modelo_lineal = None; self.std_error_lineal = 0.0; self.modelo_ets = None
         self.df_entrenado = None; self.modelo_usado = "ninguno"; self.ultimo_valor_real = 0.0
+        self._clave_registro = None
         
         # Almacenar los lotes del DF actual
         if 'lote_nombre' in df_historico.columns and not df_historico['lote_nombre'].empty:
@@ -131,13 +209,36 @@ class PredictorConsumo:
             "fin": df_historico['periodo'].max().strftime('%Y-%m-%d')
         }
 
-        # Decisión de modelo: Menos de 18 meses -> Usar Lineal
-        if len(df_historico) < 18:
-            logger.warning(f"Pocos datos ({len(df_historico)} registros). Usando Regresión Lineal.")
+        meses_historia = df_historico['periodo'].nunique()
+        tipo_modelo = self._elegir_modelo(modelo, meses_historia)
+
+        # Registro: mismos datos, lotes y tipo -> modelo ya entrenado
+        if self.user_id is not None:
+            clave = clave_modelo(self.user_id, self.lotes_del_entrenamiento, huella_datos(df_historico), tipo_modelo)
+            # El registro puede leer y deserializar de disco: fuera del event loop
+            estado = await asyncio.to_thread(registro_modelos.obtener, self.user_id, clave)
+            if estado is not None:
+                self._cargar_estado(estado)
+                self._clave_registro = clave
+                logger.info(f"Modelo '{self.modelo_usado}' recuperado del registro para user_id {self.user_id}.")
+                return {"status": "success", "modelo_entrenado": self.modelo_usado, "desde_registro": True}
+
+        if tipo_modelo == "lineal":
+            logger.info(f"Regresión Lineal solicitada ({len(df_historico)} registros).")
             exito = await self._train_linear(df_historico)
             if exito: self.modelo_usado = "tendencia_lineal"
+        elif tipo_modelo == "ets":
+            logger.info(f"{meses_historia} meses ({len(df_historico)} registros). Usando ETS (Holt-Winters amortiguado).")
+            if await self._train_ets(df_historico):
+                self.modelo_usado = "ets"
+            else:
+                logger.warning("ETS no aplicable (serie demasiado corta). Usando Regresión Lineal como fallback.")
+                if await self._train_linear(df_historico):
+                    self.modelo_usado = "tendencia_lineal_fallback"
+                else:
+                    self.modelo_usado = "fallido"
         else:
-            logger.info(f"Suficientes datos ({len(df_historico)} registros). Intentando Prophet.")
+            logger.info(f"Suficientes datos ({meses_historia} meses, {len(df_historico)} registros). Intentando Prophet.")
             exito_prophet = await self._train_prophet(df_historico)
             if exito_prophet:
                 self.modelo_usado = "prophet"
@@ -152,8 +253,13 @@ class PredictorConsumo:
         
         if self.modelo_usado == "fallido":
             return {"error": "No se pudo entrenar ningún modelo con los datos proporcionados."}
-        else:
-            return {"status": "success", "modelo_entrenado": self.modelo_usado}
+
+        # Un fallback lineal no se guarda: quedaría bajo la clave del modelo pedido
+        # y taparía a Prophet/ETS (p. ej. tras un proceso muerto) hasta que cambien los datos
+        if self.user_id is not None and self._is_trained() and not self.modelo_usado.endswith("_fallback"):
+            await asyncio.to_thread(registro_modelos.guardar, self.user_id, clave, self._exportar_estado())
+            self._clave_registro = clave
+        return {"status": "success", "modelo_entrenado": self.modelo_usado}
 
     # ----------------------------------------------------
     # MÉTODOS DE PREDICCIÓN (PÚBLICOS)
@@ -161,12 +267,17 @@ class PredictorConsumo:
 
     async def predecir_consumo_kwh(self, meses: int = 12) -> Dict[str, Any]:
         """
-        Predice el consumo usando el modelo que se haya entrenado (Prophet o Lineal).
+        Predice el consumo usando el modelo que se haya entrenado (Prophet, ETS o Lineal).
         """
         if not self._is_trained():
             logger.warning("Predicción de consumo: El modelo predictivo no está entrenado.")
             return {"error": "El modelo predictivo no está entrenado. Por favor, entrene primero."}
 
+        if self._clave_registro is not None:
+            cacheado = registro_modelos.pronostico(self.user_id, self._clave_registro, meses)
+            if cacheado is not None:
+                return cacheado
+
         predicciones_lista = []
         
         try:
@@ -174,7 +285,8 @@ class PredictorConsumo:
             if self.modelo_usado == "prophet" and self.modelo_prophet and self.df_entrenado is not None:
                 if not self.df_entrenado.empty:
                     futuro = self.modelo_prophet.make_future_dataframe(periods=meses, freq='MS', include_history=False)
-                    forecast = self.modelo_prophet.predict(futuro)
+                    # predict muestrea la incertidumbre (cientos de trayectorias): en un hilo
+                    forecast = await asyncio.to_thread(self.modelo_prophet.predict, futuro)
                     for _, row in forecast.iterrows():
                         predicciones_lista.append({
                             'periodo': self._convertir_a_python(row['ds'].strftime('%Y-%m-%d')),
@@ -186,6 +298,19 @@ class PredictorConsumo:
                 else:
                     return {"error": "No hay datos de entrenamiento válidos para Prophet."}
 
+            elif self.modelo_usado == "ets" and self.modelo_ets is not None and self.df_entrenado is not None:
+                pronostico = pronosticar_ets(self.modelo_ets, meses)
+                fecha_base = self.df_entrenado['periodo'].max()
+                for i in range(meses):
+                    fecha_pred = fecha_base + pd.DateOffset(months=i + 1)
+                    predicciones_lista.append({
+                        'periodo': self._convertir_a_python(fecha_pred.strftime('%Y-%m-%d')),
+                        'consumo_predicho_kwh': self._convertir_a_python(max(0, round(float(pronostico['media'][i]), 2))),
+                        'limite_inferior': self._convertir_a_python(max(0, round(float(pronostico['inferior'][i]), 2))),
+                        'limite_superior': self._convertir_a_python(max(0, round(float(pronostico['superior'][i]), 2))),
+                        'tendencia': self._convertir_a_python(round(float(pronostico['tendencia'][i]), 2))
+                    })
+
             elif self.modelo_usado.startswith("tendencia_lineal") and self.modelo_lineal and self.df_entrenado is not None:
                 if not self.df_entrenado.empty:
                     ultimo_mes_num = self.df_entrenado['mes_num'].max()
@@ -212,7 +337,7 @@ class PredictorConsumo:
             # --- Métricas Comunes de Salida ---
             primera_prediccion = predicciones_lista[0]['consumo_predicho_kwh'] if predicciones_lista else 0
             
-            return {
+            resultado = {
                 "predicciones": predicciones_lista,
                 "metricas_modelo": {
                     "modelo_usado": self.modelo_usado,
@@ -227,12 +352,15 @@ class PredictorConsumo:
                     "lotes_considerados": self.lotes_del_entrenamiento
                 }
             }
+            if self._clave_registro is not None:
+                await asyncio.to_thread(registro_modelos.guardar_pronostico, self.user_id, self._clave_registro, meses, resultado)
+            return resultado
             
         except Exception as e:
             logger.error(f"Error en predicción de consumo ({self.modelo_usado}): {str(e)}", exc_info=True)
             return {"error": f"Error en predicción de consumo: {str(e)}"}
 
-    async def predecir_costo(self, df_historico: pd.DataFrame, meses: int = 12) -> Dict[str, Any]:
+    async def predecir_costo(self, df_historico: pd.DataFrame, meses: int = 12, modelo: str = "auto") -> Dict[str, Any]:
         """
         Predecir costos basado en la relación consumo-costo.
         DF Histórico se pasa para el cálculo del costo.
@@ -260,7 +388,7 @@ class PredictorConsumo:
                 logger.error(error_msg)
                 return {"error": error_msg}
 
-            entrenamiento_result = await self.train(df_historico)
+            entrenamiento_result = await self.train(df_historico, modelo=modelo)
             if 'error' in entrenamiento_result:
                 return entrenamiento_result
 
@@ -288,6 +416,8 @@ class PredictorConsumo:
                 "lotes_considerados": self.lotes_del_entrenamiento
             }
             
+        except (EntrenamientoRechazadoError, EntrenamientoExcedioTiempoError, EntrenamientoCanceladoError):
+            raise
         except Exception as e:
             logger.error(f"Error prediciendo costos: {str(e)}", exc_info=True)
             return {"error": f"Error prediciendo costos: {str(e)}"}
\ No newline at end of file
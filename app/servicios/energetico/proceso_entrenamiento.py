@@ -0,0 +1,32 @@
+# app/servicios/energetico/proceso_entrenamiento.py
+
+# Código que corre DENTRO de los procesos de entrenamiento (ver ejecutor_modelos).
+# No importa nada de 'app' con efectos al cargar (configuración, pool de BD).
+# Prophet se importa dentro de la función: el proceso principal solo necesita
+# este módulo para referenciarla, y el servidor de procesos ya lo precarga.
+
+import pandas as pd
+
+
+def ajustar_prophet(df_prophet: pd.DataFrame, estacionalidad_mensual: bool) -> str:
+    """Ajusta Prophet sobre (ds, y) y devuelve el modelo serializado en JSON."""
+    from prophet import Prophet
+    from prophet.serialize import model_to_json
+
+    modelo = Prophet(yearly_seasonality=True, weekly_seasonality=False,
+                     daily_seasonality=False, changepoint_prior_scale=0.05,
+                     seasonality_prior_scale=10.0)
+    if estacionalidad_mensual:
+        modelo.add_seasonality(name='monthly', period=30.5, fourier_order=5)
+    modelo.fit(df_prophet)
+    return model_to_json(modelo)
+
+
+def ejecutar_trabajo(emisor, funcion, args):
+    """Punto de entrada del proceso: manda ("ok", resultado) o ("error", mensaje) por la tubería."""
+    try:
+        emisor.send(("ok", funcion(*args)))
+    except BaseException as e:
+        emisor.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        emisor.close()
@@ -0,0 +1,197 @@
+# app/servicios/energetico/registro_modelos.py
+
+import copy
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+
+from app.configuracion import configuracion, ConfigEnergetico
+
+logger = logging.getLogger(__name__)
+
+# Columnas que determinan el ajuste: si no cambian, el modelo entrenado sirve
+COLUMNAS_HUELLA = ['periodo', 'consumo_total_kwh']
+
+
+def huella_datos(df: pd.DataFrame) -> str:
+    """Hash del contenido de entrenamiento (independiente del índice y del orden de carga)."""
+    columnas = [c for c in COLUMNAS_HUELLA if c in df.columns]
+    datos = df[columnas].sort_values(columnas).reset_index(drop=True)
+    resumen = pd.util.hash_pandas_object(datos, index=False).values
+    return hashlib.sha256(resumen.tobytes()).hexdigest()[:32]
+
+
+def clave_modelo(user_id: int, lotes: Optional[Iterable[str]], huella: str, tipo_modelo: str) -> str:
+    """Clave (usuario, lotes seleccionados, huella de datos, tipo de modelo) apta como nombre de fichero."""
+    lotes_ordenados = "|".join(sorted(str(l) for l in (lotes or [])))
+    texto = f"{user_id}\n{lotes_ordenados}\n{huella}\n{tipo_modelo}"
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:40]
+
+
+class RegistroModelos:
+    """
+    Modelos ya entrenados de PredictorConsumo y sus pronósticos por horizonte.
+    LRU en memoria y copia en disco (RUTA_MODELOS/registro/u<user_id>/<clave>.pkl)
+    para sobrevivir reinicios; el disco también se poda por LRU (fecha de uso).
+    Prophet se guarda con su serializador JSON oficial, no con pickle.
+    Un cambio de datos genera otra huella, así que nunca se sirve un modelo
+    viejo; invalidar_usuario solo libera el espacio de inmediato.
+    obtener, guardar y guardar_pronostico pueden tocar disco: desde código
+    async se llaman con asyncio.to_thread. El lock solo cubre la memoria; la
+    serialización y la escritura van fuera de él.
+    """
+
+    def __init__(self, directorio: Path, max_memoria: int = 64, max_disco: int = 512):
+        self.directorio = Path(directorio)
+        self.max_memoria = max(1, max_memoria)
+        self.max_disco = max(0, max_disco)
+        self._entradas: "OrderedDict[Tuple[int, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos_memoria = 0
+        self._aciertos_disco = 0
+        self._fallos = 0
+        self._pronosticos_servidos = 0
+
+    # --- Ficheros ---
+    def _ruta(self, user_id: int, clave: str) -> Path:
+        return self.directorio / f"u{user_id}" / f"{clave}.pkl"
+
+    def _escribir(self, user_id: int, clave: str, entrada: Dict[str, Any]):
+        """Sin el lock: `entrada` es una instantánea (ver _instantanea)."""
+        if self.max_disco <= 0:
+            return
+        estado = dict(entrada["estado"])
+        if estado.get("modelo_prophet") is not None:
+            from prophet.serialize import model_to_json
+            estado["modelo_prophet"] = model_to_json(estado["modelo_prophet"])
+        ruta = self._ruta(user_id, clave)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        # Temporal propio por hilo: dos escrituras de la misma clave no se pisan
+        temporal = ruta.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporal, "wb") as f:
+            pickle.dump({"estado": estado, "pronosticos": entrada["pronosticos"]}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+        self._podar_disco()
+
+    @staticmethod
+    def _instantanea(entrada: Dict[str, Any]) -> Dict[str, Any]:
+        return {"estado": entrada["estado"], "pronosticos": dict(entrada["pronosticos"])}
+
+    def _leer(self, user_id: int, clave: str) -> Optional[Dict[str, Any]]:
+        ruta = self._ruta(user_id, clave)
+        if self.max_disco <= 0 or not ruta.exists():
+            return None
+        try:
+            with open(ruta, "rb") as f:
+                entrada = pickle.load(f)
+            if entrada["estado"].get("modelo_prophet") is not None:
+                from prophet.serialize import model_from_json
+                entrada["estado"]["modelo_prophet"] = model_from_json(entrada["estado"]["modelo_prophet"])
+            os.utime(ruta)  # marca de uso para la poda LRU
+            return entrada
+        except Exception as e:
+            logger.warning(f"Registro de modelos: no se pudo leer {ruta} ({e}); se descarta.")
+            ruta.unlink(missing_ok=True)
+            return None
+
+    def _podar_disco(self):
+        ficheros = []
+        for ruta in self.directorio.glob("u*/*.pkl"):
+            try:
+                ficheros.append((ruta.stat().st_mtime, ruta))
+            except FileNotFoundError:
+                continue  # otro hilo lo podó o lo invalidó
+        ficheros.sort()
+        for _, ruta in ficheros[:max(0, len(ficheros) - self.max_disco)]:
+            ruta.unlink(missing_ok=True)
+
+    def _recordar(self, user_id: int, clave: str, entrada: Dict[str, Any]):
+        self._entradas[(user_id, clave)] = entrada
+        self._entradas.move_to_end((user_id, clave))
+        while len(self._entradas) > self.max_memoria:
+            self._entradas.popitem(last=False)
+
+    # --- API ---
+    def obtener(self, user_id: int, clave: str) -> Optional[Dict[str, Any]]:
+        """Estado entrenado (ver PredictorConsumo._exportar_estado) o None."""
+        with self._lock:
+            entrada = self._entradas.get((user_id, clave))
+            if entrada is not None:
+                self._entradas.move_to_end((user_id, clave))
+                self._aciertos_memoria += 1
+                return entrada["estado"]
+
+        entrada = self._leer(user_id, clave)
+        with self._lock:
+            if entrada is None:
+                self._fallos += 1
+                return None
+            self._aciertos_disco += 1
+            # Si otro hilo la cargó mientras tanto, se queda la suya
+            entrada = self._entradas.get((user_id, clave)) or entrada
+            self._recordar(user_id, clave, entrada)
+            return entrada["estado"]
+
+    def guardar(self, user_id: int, clave: str, estado: Dict[str, Any]):
+        entrada = {"estado": estado, "pronosticos": {}}
+        with self._lock:
+            self._recordar(user_id, clave, entrada)
+            instantanea = self._instantanea(entrada)
+        try:
+            self._escribir(user_id, clave, instantanea)
+        except Exception as e:
+            logger.warning(f"Registro de modelos: no se pudo persistir el modelo de user_id {user_id}: {e}")
+
+    def pronostico(self, user_id: int, clave: str, meses: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entrada = self._entradas.get((user_id, clave))
+            if entrada is None or meses not in entrada["pronosticos"]:
+                return None
+            self._pronosticos_servidos += 1
+            # Copia: los llamadores añaden claves al resultado
+            return copy.deepcopy(entrada["pronosticos"][meses])
+
+    def guardar_pronostico(self, user_id: int, clave: str, meses: int, resultado: Dict[str, Any]):
+        with self._lock:
+            entrada = self._entradas.get((user_id, clave))
+            if entrada is None:
+                return
+            entrada["pronosticos"][meses] = copy.deepcopy(resultado)
+            instantanea = self._instantanea(entrada)
+        try:
+            self._escribir(user_id, clave, instantanea)
+        except Exception as e:
+            logger.warning(f"Registro de modelos: no se pudo persistir el pronóstico de user_id {user_id}: {e}")
+
+    def invalidar_usuario(self, user_id: int):
+        with self._lock:
+            for llave in [k for k in self._entradas if k[0] == user_id]:
+                del self._entradas[llave]
+            shutil.rmtree(self.directorio / f"u{user_id}", ignore_errors=True)
+        logger.info(f"Registro de modelos invalidado para user_id: {user_id}.")
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "modelos_en_memoria": len(self._entradas),
+                "aciertos_memoria": self._aciertos_memoria,
+                "aciertos_disco": self._aciertos_disco,
+                "fallos": self._fallos,
+                "pronosticos_servidos": self._pronosticos_servidos,
+            }
+
+
+# Instancia global compartida por todos los PredictorConsumo
+registro_modelos = RegistroModelos(
+    ConfigEnergetico.RUTA_MODELOS / "registro",
+    max_memoria=configuracion.REGISTRO_MODELOS_MAX_MEMORIA,
+    max_disco=configuracion.REGISTRO_MODELOS_MAX_DISCO,
+)
@@ -0,0 +1,235 @@
+# app/servicios/energetico/trabajos_pronostico.py
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.configuracion import configuracion
+from app.servicios.energetico.ejecutor_modelos import (
+    EntrenamientoRechazadoError, EntrenamientoExcedioTiempoError, EntrenamientoCanceladoError
+)
+
+ESTADOS_FINALES = ("completado", "error")
+
+
+class TrabajoPronosticoRechazadoError(Exception):
+    """Demasiados trabajos pendientes: 429 si es el cupo del usuario, 503 si es el global."""
+
+    def __init__(self, mensaje: str, por_usuario: bool):
+        super().__init__(mensaje)
+        self.por_usuario = por_usuario
+
+
+def _codigo_error(e: Exception) -> int:
+    """Mismo código HTTP que daría la ruta síncrona (ver manejadores en principal.py)."""
+    if isinstance(e, EntrenamientoRechazadoError):
+        return 503
+    if isinstance(e, EntrenamientoExcedioTiempoError):
+        return 504
+    if isinstance(e, EntrenamientoCanceladoError):
+        return 409
+    return 500
+
+
+# -----------------------------------------------------------------------------
+# 1. GESTOR DE TRABAJOS (proyecciones y escenarios fuera de la petición HTTP)
+# -----------------------------------------------------------------------------
+class GestorTrabajosPronostico:
+    """
+    Trabajos de pronóstico enviados por los clientes: la petición devuelve un
+    id al instante y el cálculo corre como tarea del event loop (el ajuste
+    pesado ya va al ejecutor de modelos). Como mucho `concurrentes` a la vez.
+    Dos envíos idénticos del mismo usuario mientras el primero sigue en vuelo
+    comparten trabajo. Los resultados se guardan `ttl_segundos` tras terminar
+    (y como mucho `max_resultados`, LRU). Solo se toca desde el event loop.
+    Los pendientes (en cola + en curso) se limitan a `max_pendientes` en total
+    y `max_por_usuario` por usuario; el siguiente envío se rechaza, como en
+    EjecutorModelos.max_cola.
+    """
+
+    def __init__(self, concurrentes: int = 4, ttl_segundos: float = 600.0, max_resultados: int = 1000,
+                 max_pendientes: int = 64, max_por_usuario: int = 8):
+        self.concurrentes = max(1, concurrentes)
+        self.ttl_segundos = ttl_segundos
+        self.max_resultados = max(1, max_resultados)
+        self.max_pendientes = max(1, max_pendientes)
+        self.max_por_usuario = max(1, max_por_usuario)
+        self._semaforo: Optional[asyncio.Semaphore] = None
+        self._trabajos: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._en_vuelo: Dict[Tuple, str] = {}
+        self._pendientes_usuario: Dict[int, int] = {}
+        self._tareas: Dict[str, asyncio.Task] = {}
+        self._terminados_evento: Dict[str, asyncio.Event] = {}
+        self._enviados = 0
+        self._deduplicados = 0
+        self._completados = 0
+        self._errores = 0
+        self._expirados = 0
+        self._rechazados = 0
+
+    def _obtener_semaforo(self) -> asyncio.Semaphore:
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.concurrentes)
+        return self._semaforo
+
+    def _purgar(self):
+        """Quita resultados vencidos y, si sobran, los terminados más antiguos."""
+        ahora = time.monotonic()
+        for trabajo_id in [t_id for t_id, t in self._trabajos.items()
+                           if t["_vence"] is not None and t["_vence"] <= ahora]:
+            self._olvidar(trabajo_id)
+            self._expirados += 1
+        while len(self._trabajos) > self.max_resultados:
+            viejo = next((t_id for t_id, t in self._trabajos.items() if t["estado"] in ESTADOS_FINALES), None)
+            if viejo is None:
+                break
+            self._olvidar(viejo)
+
+    def _olvidar(self, trabajo_id: str):
+        self._trabajos.pop(trabajo_id, None)
+        self._terminados_evento.pop(trabajo_id, None)
+
+    async def _correr(self, trabajo: Dict[str, Any], clave: Tuple, calcular: Callable[[], Awaitable[Any]]):
+        try:
+            async with self._obtener_semaforo():
+                trabajo["estado"] = "ejecutando"
+                trabajo["iniciado_en"] = datetime.now().isoformat()
+                trabajo["resultado"] = await calcular()
+                trabajo["estado"] = "completado"
+                self._completados += 1
+        except asyncio.CancelledError:
+            trabajo["estado"] = "error"
+            trabajo["error"] = {"status_code": 503, "detail": "El servidor se está deteniendo."}
+            self._errores += 1
+            raise
+        except HTTPException as e:
+            trabajo["estado"] = "error"
+            trabajo["error"] = {"status_code": e.status_code, "detail": e.detail}
+            self._errores += 1
+        except Exception as e:
+            trabajo["estado"] = "error"
+            trabajo["error"] = {"status_code": _codigo_error(e), "detail": str(e)}
+            self._errores += 1
+        finally:
+            trabajo["terminado_en"] = datetime.now().isoformat()
+            trabajo["_vence"] = time.monotonic() + self.ttl_segundos
+            if self._en_vuelo.get(clave) == trabajo["id"]:
+                del self._en_vuelo[clave]
+            restantes = self._pendientes_usuario.get(trabajo["user_id"], 1) - 1
+            if restantes > 0:
+                self._pendientes_usuario[trabajo["user_id"]] = restantes
+            else:
+                self._pendientes_usuario.pop(trabajo["user_id"], None)
+            self._tareas.pop(trabajo["id"], None)
+            evento = self._terminados_evento.get(trabajo["id"])
+            if evento is not None:
+                evento.set()
+
+    def enviar(self, user_id: int, tipo: str, parametros: Hashable,
+               calcular: Callable[[], Awaitable[Any]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Encola `calcular()` y devuelve (trabajo, deduplicado). `parametros`
+        debe identificar el cálculo: con la misma (usuario, tipo, parametros)
+        en vuelo se devuelve ese trabajo y `calcular` no se ejecuta.
+        Lanza TrabajoPronosticoRechazadoError si no hay cupo.
+        """
+        self._purgar()
+        clave = (user_id, tipo, parametros)
+        existente = self._en_vuelo.get(clave)
+        if existente is not None and existente in self._trabajos:
+            self._deduplicados += 1
+            return self.publico(self._trabajos[existente]), True
+
+        del_usuario = self._pendientes_usuario.get(user_id, 0)
+        if del_usuario >= self.max_por_usuario:
+            self._rechazados += 1
+            raise TrabajoPronosticoRechazadoError(
+                f"Ya tienes {del_usuario} trabajos de pronóstico pendientes (máximo {self.max_por_usuario}). "
+                f"Espera a que terminen.", por_usuario=True
+            )
+        if len(self._tareas) >= self.max_pendientes:
+            self._rechazados += 1
+            raise TrabajoPronosticoRechazadoError(
+                f"Cola de trabajos de pronóstico llena ({len(self._tareas)} pendientes). Reintente más tarde.",
+                por_usuario=False
+            )
+
+        trabajo = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "tipo": tipo,
+            "estado": "en_cola",
+            "enviado_en": datetime.now().isoformat(),
+            "iniciado_en": None,
+            "terminado_en": None,
+            "resultado": None,
+            "error": None,
+            "_vence": None,
+        }
+        self._trabajos[trabajo["id"]] = trabajo
+        self._en_vuelo[clave] = trabajo["id"]
+        self._terminados_evento[trabajo["id"]] = asyncio.Event()
+        self._pendientes_usuario[user_id] = del_usuario + 1
+        self._tareas[trabajo["id"]] = asyncio.create_task(self._correr(trabajo, clave, calcular))
+        self._enviados += 1
+        return self.publico(trabajo), False
+
+    def obtener(self, trabajo_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        """El trabajo (vista pública) si existe, no venció y es del usuario."""
+        self._purgar()
+        trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is None or trabajo["user_id"] != user_id:
+            return None
+        return self.publico(trabajo)
+
+    async def esperar(self, trabajo_id: str, timeout: float) -> bool:
+        """True si el trabajo terminó (o ya no existe) antes de `timeout` segundos."""
+        evento = self._terminados_evento.get(trabajo_id)
+        if evento is None:
+            return True
+        try:
+            await asyncio.wait_for(evento.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @staticmethod
+    def publico(trabajo: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in trabajo.items() if not k.startswith("_") and k != "user_id"}
+
+    def cerrar(self):
+        for tarea in list(self._tareas.values()):
+            tarea.cancel()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        en_curso = sum(1 for t in self._trabajos.values() if t["estado"] == "ejecutando")
+        return {
+            "concurrentes": self.concurrentes,
+            "en_vuelo": len(self._en_vuelo),
+            "pendientes": len(self._tareas),
+            "max_pendientes": self.max_pendientes,
+            "max_por_usuario": self.max_por_usuario,
+            "ejecutando": en_curso,
+            "guardados": len(self._trabajos),
+            "enviados": self._enviados,
+            "deduplicados": self._deduplicados,
+            "completados": self._completados,
+            "errores": self._errores,
+            "expirados": self._expirados,
+            "rechazados": self._rechazados,
+        }
+
+
+# Instancia global compartida por las rutas de /energetico/trabajos
+gestor_trabajos_pronostico = GestorTrabajosPronostico(
+    concurrentes=configuracion.TRABAJOS_PRONOSTICO_CONCURRENTES,
+    ttl_segundos=configuracion.TRABAJOS_PRONOSTICO_TTL_S,
+    max_resultados=configuracion.TRABAJOS_PRONOSTICO_MAX_RESULTADOS,
+    max_pendientes=configuracion.TRABAJOS_PRONOSTICO_MAX_PENDIENTES,
+    max_por_usuario=configuracion.TRABAJOS_PRONOSTICO_MAX_POR_USUARIO,
+)
@@ -1,8 +1,45 @@
 import pymysql
 from typing import Optional
 from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import en_hilo_db
 
-async def registrar_actividad_db(
+_SQL_INSERTAR_ACTIVIDAD = """
+INSERT INTO actividad_reciente
+    (usuario_id, proyecto_id, tipo_evento, titulo, fuente, fecha)
+VALUES
+    (%s, %s, %s, %s, %s, NOW())
+"""
+
+
+def registrar_actividad_con(
+    conn,
+    usuario_id: int,
+    tipo_evento: str,
+    titulo: str,
+    fuente: str,
+    proyecto_id: Optional[int] = None,
+    confirmar: bool = True
+):
+    """
+    Registra la actividad con la conexión que ya tiene abierta el llamador
+    (las funciones @en_hilo_db no deben pedir una segunda conexión al pool:
+    con todos los hilos ocupados esperarían unas a otras hasta DB_POOL_TIMEOUT).
+    Con confirmar=False la fila entra en la transacción en curso del llamador.
+    Un fallo del log nunca hace fallar la operación principal.
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(_SQL_INSERTAR_ACTIVIDAD, (usuario_id, proyecto_id, tipo_evento, titulo, fuente))
+        if confirmar:
+            conn.commit()
+    except Exception as e:
+        print(f"Error al registrar actividad (usuario: {usuario_id}, evento: {tipo_evento}): {e}")
+        if confirmar:
+            conn.rollback()
+
+
+@en_hilo_db
+def registrar_actividad_db(
     usuario_id: int,
     tipo_evento: str,
     titulo: str,
@@ -16,13 +53,7 @@ async def registrar_actividad_db(
     try:
         conn = get_db_connection()
         with conn.cursor() as cursor:
-            sql = """
-            INSERT INTO actividad_reciente 
-                (usuario_id, proyecto_id, tipo_evento, titulo, fuente, fecha)
-            VALUES 
-                (%s, %s, %s, %s, %s, NOW())
-            """
-            cursor.execute(sql, (usuario_id, proyecto_id, tipo_evento, titulo, fuente))
+            cursor.execute(_SQL_INSERTAR_ACTIVIDAD, (usuario_id, proyecto_id, tipo_evento, titulo, fuente))
         conn.commit()
         
     except Exception as e:
@@ -1,15 +1,201 @@
 import pymysql
 import time
 from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
 from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import en_hilo_db
+from app.configuracion import configuracion
+from app.servicios import servicio_rollups
 
-async def ejecutar_agregacion_horaria(procesar_historico=False, dias_historia=30):
+# Fila de agregacion_marcas que usa la agregación horaria
+PROCESO_HORARIO = "horaria"
+
+# -----------------------------------------------------------------------------
+# SQL
+# -----------------------------------------------------------------------------
+# Se guardan suma y conteo para todos los campos: así el promedio se puede
+# recombinar exactamente cuando llegan más lecturas de una hora ya agregada.
+# En ON DUPLICATE KEY UPDATE las asignaciones se evalúan de izquierda a derecha:
+# valor_avg ya ve la suma y el conteo actualizados. Las filas antiguas sin
+# valor_sum (campos que no eran 'Movimiento') la reconstruyen desde el promedio.
+SQL_FUSIONAR_RANGO_IDS = """
+INSERT INTO valores_agregados
+    (campo_id, fecha, hora, valor_min, valor_max, valor_avg, valor_sum, total_registros)
+SELECT
+    v.campo_id,
+    DATE(v.fecha_hora_lectura) AS fecha,
+    HOUR(v.fecha_hora_lectura) AS hora,
+    MIN(v.valor), MAX(v.valor), AVG(v.valor), SUM(v.valor), COUNT(*)
+FROM valores v
+WHERE v.id > %s AND v.id <= %s
+GROUP BY v.campo_id, fecha, hora
+ON DUPLICATE KEY UPDATE
+    valor_min = LEAST(COALESCE(valores_agregados.valor_min, VALUES(valor_min)), VALUES(valor_min)),
+    valor_max = GREATEST(COALESCE(valores_agregados.valor_max, VALUES(valor_max)), VALUES(valor_max)),
+    valor_sum = COALESCE(valores_agregados.valor_sum, valores_agregados.valor_avg * valores_agregados.total_registros, 0)
+                + VALUES(valor_sum),
+    total_registros = COALESCE(valores_agregados.total_registros, 0) + VALUES(total_registros),
+    valor_avg = valores_agregados.valor_sum / valores_agregados.total_registros
+"""
+
+# Reconstrucción: las horas del rango se recalculan y se SOBRESCRIBEN.
+# Solo con filas ya cubiertas por la marca (id <= %s); las posteriores las
+# fusionará la pasada incremental, así nada se cuenta dos veces.
+SQL_RECONSTRUIR_RANGO_FECHAS = """
+INSERT INTO valores_agregados
+    (campo_id, fecha, hora, valor_min, valor_max, valor_avg, valor_sum, total_registros)
+SELECT
+    v.campo_id,
+    DATE(v.fecha_hora_lectura) AS fecha,
+    HOUR(v.fecha_hora_lectura) AS hora,
+    MIN(v.valor), MAX(v.valor), AVG(v.valor), SUM(v.valor), COUNT(*)
+FROM valores v
+WHERE v.fecha_hora_lectura >= %s AND v.fecha_hora_lectura < %s
+  AND v.id <= %s
+GROUP BY v.campo_id, fecha, hora
+ON DUPLICATE KEY UPDATE
+    valor_min = VALUES(valor_min),
+    valor_max = VALUES(valor_max),
+    valor_sum = VALUES(valor_sum),
+    total_registros = VALUES(total_registros),
+    valor_avg = VALUES(valor_avg)
+"""
+
+
+# -----------------------------------------------------------------------------
+# 1. MARCA DE AGUA
+# -----------------------------------------------------------------------------
+def _bloquear_marca(cursor, proceso: str) -> Tuple[Optional[int], Optional[datetime]]:
+    """
+    Lee (ultimo_id, cubierto_hasta) con FOR UPDATE: dos ejecuciones a la vez
+    (scheduler y endpoint manual) se serializan y la segunda ve la marca ya
+    avanzada. (None, None) si el proceso nunca corrió.
+    """
+    cursor.execute(
+        "SELECT ultimo_id, cubierto_hasta FROM agregacion_marcas WHERE proceso = %s FOR UPDATE",
+        (proceso,)
+    )
+    fila = cursor.fetchone()
+    if not fila:
+        return None, None
+    return int(fila['ultimo_id']), fila['cubierto_hasta']
+
+
+def _guardar_marca(cursor, proceso: str, ultimo_id: int, cubierto_hasta: datetime):
+    cursor.execute(
+        """
+        INSERT INTO agregacion_marcas (proceso, ultimo_id, cubierto_hasta, actualizado_en)
+        VALUES (%s, %s, %s, NOW())
+        ON DUPLICATE KEY UPDATE
+            ultimo_id = VALUES(ultimo_id),
+            cubierto_hasta = VALUES(cubierto_hasta),
+            actualizado_en = NOW()
+        """,
+        (proceso, ultimo_id, cubierto_hasta)
+    )
+
+
+def _tope_asentado(cursor, desde_id: int, corte_registro: datetime) -> Optional[int]:
+    """
+    Último id con fecha_hora_registro anterior al corte. El margen evita saltar
+    filas de una transacción de ingesta que obtuvo ids menores pero aún no
+    confirmó (los AUTO_INCREMENT no se confirman en orden).
     """
-    Agregación horaria que puede procesar datos históricos o recientes
-    
+    cursor.execute(
+        "SELECT MAX(id) AS tope FROM valores WHERE id > %s AND fecha_hora_registro < %s",
+        (desde_id, corte_registro)
+    )
+    fila = cursor.fetchone()
+    return int(fila['tope']) if fila and fila['tope'] is not None else None
+
+
+# -----------------------------------------------------------------------------
+# 2. AGREGACIÓN INCREMENTAL
+# -----------------------------------------------------------------------------
+def _agregar_incremental(conn, cursor) -> Dict[str, Any]:
+    margen = timedelta(seconds=configuracion.AGREGACION_MARGEN_S)
+    # La ingesta sella fecha_hora_registro con utcnow(): el corte va en el mismo reloj.
+    # cubierto_hasta lo comparan particiones, archivo y resolución con fechas de
+    # lectura, así que se sigue guardando en hora local
+    corte_registro = datetime.utcnow() - margen
+    cubierto_hasta = datetime.now() - margen
+    tamano_tramo = max(1000, configuracion.AGREGACION_TRAMO_IDS)
+    filas_afectadas = 0
+    tramos = 0
+
+    marca, _ = _bloquear_marca(cursor, PROCESO_HORARIO)
+    if marca is None:
+        # Primera vez: la marca arranca en lo ya insertado y los últimos días se
+        # recalculan una única vez (lo que antes se hacía en cada arranque)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS tope FROM valores WHERE fecha_hora_registro < %s", (corte_registro,))
+        marca = int(cursor.fetchone()['tope'])
+        _guardar_marca(cursor, PROCESO_HORARIO, marca, cubierto_hasta)
+        conn.commit()
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 🏁 Marca de agregación inicializada en id {marca}")
+        resultado = _reconstruir_dias(conn, cursor, configuracion.AGREGACION_DIAS_INICIALES)
+        return {"affected_rows": resultado['affected_rows'], "tramos": 0, "ultimo_id": marca}
+
+    tope = _tope_asentado(cursor, marca, corte_registro)
+    if tope is None:
+        _guardar_marca(cursor, PROCESO_HORARIO, marca, cubierto_hasta)
+        conn.commit()
+        return {"affected_rows": 0, "tramos": 0, "ultimo_id": marca}
+
+    # Un tramo por transacción: la marca avanza junto con los agregados que cubre
+    # (la hora y todos los niveles de servicio_rollups, así nunca divergen)
+    while marca < tope:
+        hasta = min(marca + tamano_tramo, tope)
+        filas_afectadas += cursor.execute(SQL_FUSIONAR_RANGO_IDS, (marca, hasta))
+        filas_afectadas += servicio_rollups.fusionar_rango_ids(cursor, marca, hasta)
+        _guardar_marca(cursor, PROCESO_HORARIO, hasta, cubierto_hasta)
+        conn.commit()
+        marca = hasta
+        tramos += 1
+        if marca < tope:
+            _bloquear_marca(cursor, PROCESO_HORARIO)
+
+    return {"affected_rows": filas_afectadas, "tramos": tramos, "ultimo_id": marca}
+
+
+# -----------------------------------------------------------------------------
+# 3. RECONSTRUCCIÓN DE DÍAS (manual)
+# -----------------------------------------------------------------------------
+def _reconstruir_dias(conn, cursor, dias_historia: int) -> Dict[str, Any]:
+    marca, _ = _bloquear_marca(cursor, PROCESO_HORARIO)
+    if marca is None:
+        conn.rollback()
+        # Sin marca todavía: se crea primero para saber qué filas están cubiertas
+        _agregar_incremental(conn, cursor)
+        marca, _ = _bloquear_marca(cursor, PROCESO_HORARIO)
+
+    hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    dia = hoy - timedelta(days=dias_historia)
+    filas_afectadas = 0
+    # Un día por sentencia (rango sargable sobre fecha_hora_lectura); la marca
+    # queda bloqueada hasta el commit final para que la incremental espere
+    while dia <= hoy:
+        filas_afectadas += cursor.execute(SQL_RECONSTRUIR_RANGO_FECHAS, (dia, dia + timedelta(days=1), marca))
+        dia += timedelta(days=1)
+    # Resto de niveles en cascada (minuto desde 'valores', cada uno desde el anterior)
+    filas_afectadas += servicio_rollups.reconstruir(cursor, hoy - timedelta(days=dias_historia), dia, marca)
+    conn.commit()
+    return {"affected_rows": filas_afectadas, "ultimo_id": marca}
+
+
+@en_hilo_db(timeout=None)
+def ejecutar_agregacion_horaria(procesar_historico=False, dias_historia=30):
+    """
+    Agregación horaria incremental sobre una marca de agua (último id de
+    'valores' ya agregado, tabla agregacion_marcas).
+
+    Modo normal: toma solo las filas nuevas por rango de PK y las FUSIONA en
+    valores_agregados y en los niveles de servicio_rollups (1 min, 15 min,
+    día, mes), así que las lecturas que llegan tarde a una cubeta ya agregada
+    también cuentan. Después aplica la retención de cada nivel.
+
     Args:
-        procesar_historico: Si es True, procesa datos históricos
-        dias_historia: Número de días hacia atrás para procesar (solo si procesar_historico=True)
+        procesar_historico: Si es True, recalcula por completo los últimos N días
+        dias_historia: Número de días hacia atrás para recalcular (solo si procesar_historico=True)
     """
     conn = None
     try:
@@ -18,95 +204,29 @@ async def ejecutar_agregacion_horaria(procesar_historico=False, dias_historia=30
             
             current_time = datetime.now()
             print(f"\n[{current_time.strftime('%Y-%m-%d %H:%M:%S')}] 🔄 INICIANDO AGREGACIÓN HORARIA")
-            
-            # 🚨 CONFIGURAR FILTRO DE TIEMPO SEGÚN MODO
+            start_time = time.time()
+
             if procesar_historico:
-                # Modo histórico: procesar datos de los últimos N días
-                fecha_limite = f"NOW() - INTERVAL {dias_historia} DAY"
-                print(f"[{current_time.strftime('%H:%M:%S')}] 📅 MODO HISTÓRICO: Procesando últimos {dias_historia} días")
+                print(f"[{current_time.strftime('%H:%M:%S')}] 📅 MODO HISTÓRICO: Recalculando últimos {dias_historia} días")
+                resultado = _reconstruir_dias(conn, cursor, dias_historia)
             else:
-                # Modo normal: solo últimas 2 horas
-                fecha_limite = "NOW() - INTERVAL 2 HOUR"
-                print(f"[{current_time.strftime('%H:%M:%S')}] ⏰ MODO NORMAL: Procesando últimas 2 horas")
-            
-            # 🚨 DIAGNÓSTICO MEJORADO
-            cursor.execute(f"""
-                SELECT 
-                    COUNT(*) as total_valores,
-                    COUNT(DISTINCT campo_id) as campos_distintos,
-                    COUNT(DISTINCT DATE(fecha_hora_lectura)) as dias_distintos,
-                    MIN(fecha_hora_lectura) as fecha_min,
-                    MAX(fecha_hora_lectura) as fecha_max
-                FROM valores 
-                WHERE fecha_hora_lectura >= {fecha_limite}
-            """)
-            stats_valores = cursor.fetchone()
-            print(f"[{current_time.strftime('%H:%M:%S')}] 📊 VALORES: {stats_valores['total_valores']} registros")
-            print(f"[{current_time.strftime('%H:%M:%S')}] 📊 RANGO: {stats_valores['fecha_min']} a {stats_valores['fecha_max']}")
-            
-            if stats_valores['total_valores'] == 0:
-                print(f"[{current_time.strftime('%H:%M:%S')}] ⚠️  No hay datos para procesar en el rango seleccionado")
-                return {
-                    "status": "success", 
-                    "message": "No hay datos nuevos para procesar",
-                    "affected_rows": 0
-                }
-            
-            # 🚨 CONSULTA PRINCIPAL MEJORADA
-            sql_aggregate = f"""
-            INSERT INTO valores_agregados 
-                (campo_id, fecha, hora, valor_min, valor_max, valor_avg, valor_sum, total_registros)
-            SELECT
-                v.campo_id,
-                DATE(v.fecha_hora_lectura) AS fecha,
-                HOUR(v.fecha_hora_lectura) AS hora,
-                
-                MIN(v.valor) AS valor_min,
-                MAX(v.valor) AS valor_max,
-                
-                CASE 
-                    WHEN cs.nombre = 'Movimiento' THEN NULL
-                    ELSE AVG(v.valor)
-                END AS valor_avg,
-                
-                CASE
-                    WHEN cs.nombre = 'Movimiento' THEN SUM(v.valor)
-                    ELSE NULL
-                END AS valor_sum,
-                
-                COUNT(*) AS total_registros
-            FROM
-                valores v
-            JOIN 
-                campos_sensores cs ON v.campo_id = cs.id
-            WHERE
-                v.fecha_hora_lectura >= {fecha_limite}
-                AND NOT EXISTS (
-                    SELECT 1 
-                    FROM valores_agregados va 
-                    WHERE va.campo_id = v.campo_id 
-                    AND va.fecha = DATE(v.fecha_hora_lectura)
-                    AND va.hora = HOUR(v.fecha_hora_lectura)
-                )
-            GROUP BY
-                v.campo_id, cs.nombre, fecha, hora;
-            """
-            
-            # Ejecutar agregación
-            start_time = time.time()
-            affected_rows = cursor.execute(sql_aggregate)
-            conn.commit()
+                print(f"[{current_time.strftime('%H:%M:%S')}] ⏰ MODO INCREMENTAL: Filas nuevas desde la marca")
+                resultado = _agregar_incremental(conn, cursor)
+                borradas = servicio_rollups.purgar(conn, cursor)
+                if borradas:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🧹 Retención de agregados: {borradas}")
+
             end_time = time.time()
-            
             print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ AGREGACIÓN COMPLETADA")
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] 📊 Registros INSERTADOS: {affected_rows}")
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 📊 Filas afectadas: {resultado['affected_rows']} (marca en id {resultado['ultimo_id']})")
             print(f"[{datetime.now().strftime('%H:%M:%S')}] ⏱️  Duración: {end_time - start_time:.2f} segundos")
             
             return {
                 "status": "success",
-                "affected_rows": affected_rows,
+                "affected_rows": resultado['affected_rows'],
                 "duration_seconds": end_time - start_time,
-                "mode": "historical" if procesar_historico else "recent"
+                "mode": "historical" if procesar_historico else "incremental",
+                "ultimo_id": resultado['ultimo_id']
             }
 
     except Exception as e:
@@ -114,7 +234,7 @@ async def ejecutar_agregacion_horaria(procesar_historico=False, dias_historia=30
         print(f"[{datetime.now().strftime('%H:%M:%S')}] {error_msg}")
         if conn:
             conn.rollback()
-        return {"status": "error", "message": str(e)}
+        return {"status": "error", "message": str(e), "affected_rows": 0}
     finally:
         if conn:
             conn.close()
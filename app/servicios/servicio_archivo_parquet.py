@@ -0,0 +1,240 @@
+# app/servicios/servicio_archivo_parquet.py
+
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import pymysql
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import en_hilo_db
+from app.configuracion import configuracion
+from app.servicios.servicio_agregacion import PROCESO_HORARIO
+
+# Un fichero por campo y día: <dir>/proyecto=P/campo=C/dia=AAAA-MM-DD.v<marca>.parquet
+# La tabla valores_archivados es el índice: un día está archivado si y solo si
+# tiene fila ahí (se inserta en la misma transacción que borra sus filas de
+# 'valores'), así un fichero a medio escribir nunca se lee. Cada archivado
+# escribe una versión nueva y el cambio de ruta va en esa transacción: el
+# fichero vigente no se toca hasta después del commit.
+# Marca de tiempo en ms: Parquet no tiene unidad de segundos y la relee como ms
+ESQUEMA = pa.schema([
+    ("id", pa.int64()),
+    ("fecha_hora_lectura", pa.timestamp("ms")),
+    ("valor", pa.float64()),
+])
+
+
+# -----------------------------------------------------------------------------
+# 1. FICHEROS
+# -----------------------------------------------------------------------------
+def ruta_relativa(proyecto_id: int, campo_id: int, dia: date, version: str) -> str:
+    return os.path.join(f"proyecto={proyecto_id}", f"campo={campo_id}", f"dia={dia:%Y-%m-%d}.v{version}.parquet")
+
+
+def _ruta_absoluta(relativa: str) -> str:
+    return os.path.join(configuracion.ARCHIVO_PARQUET_DIR, relativa)
+
+
+def _leer_fichero(relativa: str, columnas: Optional[List[str]] = None) -> pa.Table:
+    # memory_map: las páginas se leen del fichero bajo demanda, sin copiarlo entero a memoria
+    return pq.read_table(_ruta_absoluta(relativa), columns=columnas, memory_map=True)
+
+
+def _escribir_fichero(relativa: str, tabla: pa.Table):
+    ruta = _ruta_absoluta(relativa)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = ruta + ".tmp"
+    pq.write_table(tabla, temporal, compression="zstd")
+    os.replace(temporal, ruta)
+
+
+def _borrar_fichero(relativa: str):
+    try:
+        os.remove(_ruta_absoluta(relativa))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"⚠️ [Archivo] No se pudo borrar {relativa}: {e}")
+
+
+# -----------------------------------------------------------------------------
+# 2. LECTURA TRANSPARENTE (histórico)
+# -----------------------------------------------------------------------------
+def leer_archivado(cursor, campo_id: int, fecha_inicio: datetime, fecha_fin: datetime) -> List[Dict[str, Any]]:
+    """
+    Lecturas archivadas del campo en [fecha_inicio, fecha_fin], ordenadas por
+    fecha ({valor, fecha_hora_lectura}). Los días archivados ya no tienen
+    filas en 'valores', así que basta con unir ambos resultados.
+    """
+    cursor.execute(
+        "SELECT ruta FROM valores_archivados WHERE campo_id = %s AND dia BETWEEN %s AND %s ORDER BY dia",
+        (campo_id, fecha_inicio.date(), fecha_fin.date())
+    )
+    rutas = [fila['ruta'] for fila in cursor.fetchall()]
+    if not rutas:
+        return []
+
+    tablas = []
+    for ruta in rutas:
+        try:
+            tablas.append(_leer_fichero(ruta, ["fecha_hora_lectura", "valor"]))
+        except (OSError, pa.ArrowInvalid) as e:
+            print(f"⚠️ [Archivo] No se pudo leer {ruta}: {e}")
+    if not tablas:
+        return []
+
+    tabla = pa.concat_tables(tablas)
+    fechas = tabla.column("fecha_hora_lectura")
+    mascara = pc.and_(
+        pc.greater_equal(fechas, pa.scalar(fecha_inicio, pa.timestamp("ms"))),
+        pc.less_equal(fechas, pa.scalar(fecha_fin, pa.timestamp("ms")))
+    )
+    tabla = tabla.filter(mascara).sort_by("fecha_hora_lectura")
+    return tabla.to_pylist()
+
+
+# -----------------------------------------------------------------------------
+# 3. ARCHIVADO (scheduler diario / endpoint manual)
+# -----------------------------------------------------------------------------
+def _archivar_dia(conn, cursor, proyecto_id: int, campo_id: int, dia: date, marca_id: int) -> int:
+    siguiente = dia + timedelta(days=1)
+    cursor.execute(
+        """
+        SELECT id, fecha_hora_lectura, valor FROM valores
+        WHERE campo_id = %s AND fecha_hora_lectura >= %s AND fecha_hora_lectura < %s AND id <= %s
+        ORDER BY fecha_hora_lectura, id
+        """,
+        (campo_id, dia, siguiente, marca_id)
+    )
+    filas = cursor.fetchall()
+    if not filas:
+        return 0
+
+    nuevas = pa.table({
+        "id": [f['id'] for f in filas],
+        "fecha_hora_lectura": [f['fecha_hora_lectura'] for f in filas],
+        "valor": [float(f['valor']) for f in filas],
+    }, schema=ESQUEMA)
+
+    # Lecturas tardías de un día ya archivado: versión nueva = fichero vigente + nuevas.
+    # Las que ya estaban en el fichero (archivado previo cuyo DELETE no llegó a
+    # confirmarse) se descartan por id.
+    cursor.execute("SELECT ruta FROM valores_archivados WHERE campo_id = %s AND dia = %s", (campo_id, dia))
+    existente = cursor.fetchone()
+    anterior = existente['ruta'] if existente else None
+    relativa = ruta_relativa(proyecto_id, campo_id, dia, str(marca_id))
+    if relativa == anterior:
+        relativa = ruta_relativa(proyecto_id, campo_id, dia, f"{marca_id}-{time.time_ns()}")
+    tabla = nuevas
+    if anterior:
+        vigente = _leer_fichero(anterior)
+        nuevas = nuevas.filter(pc.invert(pc.is_in(nuevas.column("id"), value_set=vigente.column("id"))))
+        tabla = pa.concat_tables([vigente, nuevas]).sort_by([("fecha_hora_lectura", "ascending"), ("id", "ascending")])
+    _escribir_fichero(relativa, tabla)
+
+    try:
+        cursor.execute(
+            """
+            INSERT INTO valores_archivados (campo_id, dia, ruta, filas, archivado_en)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON DUPLICATE KEY UPDATE ruta = VALUES(ruta), filas = VALUES(filas), archivado_en = NOW()
+            """,
+            (campo_id, dia, relativa, tabla.num_rows)
+        )
+        cursor.execute(
+            "DELETE FROM valores WHERE campo_id = %s AND fecha_hora_lectura >= %s AND fecha_hora_lectura < %s AND id <= %s",
+            (campo_id, dia, siguiente, marca_id)
+        )
+        conn.commit()
+    except Exception:
+        # Sin commit el índice sigue apuntando a la versión anterior: la nueva sobra
+        conn.rollback()
+        _borrar_fichero(relativa)
+        raise
+
+    if anterior:
+        _borrar_fichero(anterior)
+    return len(filas)
+
+
+@en_hilo_db(timeout=None)
+def archivar_valores_frios() -> Dict[str, Any]:
+    """
+    Mueve a Parquet las lecturas crudas de días más antiguos que
+    ARCHIVO_PARQUET_DIAS. Solo días que la agregación ya cubrió (los
+    agregados siguen en MySQL) y filas con id bajo la marca de agua.
+    Un commit por campo y día.
+    """
+    if configuracion.ARCHIVO_PARQUET_DIAS <= 0:
+        return {"status": "skipped", "message": "archivo Parquet desactivado (ARCHIVO_PARQUET_DIAS=0)"}
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            start_time = time.time()
+            cursor.execute("SELECT ultimo_id, cubierto_hasta FROM agregacion_marcas WHERE proceso = %s", (PROCESO_HORARIO,))
+            marca = cursor.fetchone()
+            if not marca:
+                return {"status": "skipped", "message": "sin agregación todavía"}
+
+            hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            tope = min(hoy - timedelta(days=configuracion.ARCHIVO_PARQUET_DIAS),
+                       marca['cubierto_hasta'].replace(hour=0, minute=0, second=0, microsecond=0))
+
+            cursor.execute(
+                """
+                SELECT cs.id AS campo_id, d.proyecto_id
+                FROM campos_sensores cs
+                JOIN sensores s ON cs.sensor_id = s.id
+                JOIN dispositivos d ON s.dispositivo_id = d.id
+                """
+            )
+            campos = cursor.fetchall()
+
+            dias_archivados = 0
+            filas_archivadas = 0
+            for campo in campos:
+                desde = datetime(1970, 1, 1)
+                while True:
+                    # Salta directamente al siguiente día con datos (índice campo_id, fecha)
+                    cursor.execute(
+                        """
+                        SELECT MIN(fecha_hora_lectura) AS siguiente FROM valores
+                        WHERE campo_id = %s AND fecha_hora_lectura >= %s AND fecha_hora_lectura < %s
+                        """,
+                        (campo['campo_id'], desde, tope)
+                    )
+                    siguiente = (cursor.fetchone() or {}).get('siguiente')
+                    if siguiente is None:
+                        break
+                    dia = siguiente.date()
+                    filas = _archivar_dia(conn, cursor, campo['proyecto_id'], campo['campo_id'], dia, int(marca['ultimo_id']))
+                    if filas:
+                        dias_archivados += 1
+                        filas_archivadas += filas
+                    desde = datetime.combine(dia + timedelta(days=1), datetime.min.time())
+
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 🧊 Archivo Parquet: "
+                  f"{filas_archivadas} lecturas en {dias_archivados} ficheros (hasta {tope:%Y-%m-%d})")
+            return {
+                "status": "success",
+                "dias_archivados": dias_archivados,
+                "filas_archivadas": filas_archivadas,
+                "hasta": tope.date().isoformat(),
+                "duration_seconds": time.time() - start_time,
+            }
+
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ Error archivando valores: {e}")
+        if conn:
+            conn.rollback()
+        return {"status": "error", "message": str(e)}
+    finally:
+        if conn:
+            conn.close()
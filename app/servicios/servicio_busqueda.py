@@ -0,0 +1,161 @@
+# app/servicios/servicio_busqueda.py
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pymysql
+
+from app.db.pool_conexiones import conexion_db
+from app.db.ejecutor_db import en_hilo_db
+
+# ngram_token_size por defecto de MySQL: términos más cortos no están en el índice
+LONGITUD_MINIMA_NGRAM = 2
+
+# Operadores del modo booleano; se quitan para que la entrada del usuario sea literal
+_OPERADORES_BOOLEANOS = re.compile(r'[+\-<>()~*"@]')
+
+
+# -----------------------------------------------------------------------------
+# 1. CONSTRUCCIÓN DE LA CONDICIÓN (FULLTEXT con respaldo LIKE)
+# -----------------------------------------------------------------------------
+def expresion_booleana(texto: str) -> Optional[str]:
+    """
+    '  sensor temp ' -> '+"sensor" +"temp"'. Con el parser ngram cada frase
+    se busca como secuencia de bigramas, es decir, como fragmento en cualquier
+    posición (lo mismo que hacía LIKE '%temp%'). Todas las palabras son
+    obligatorias. None si no queda ninguna palabra indexable.
+    """
+    palabras = _OPERADORES_BOOLEANOS.sub(" ", texto or "").split()
+    palabras = [p for p in palabras if len(p) >= LONGITUD_MINIMA_NGRAM]
+    if not palabras:
+        return None
+    return " ".join(f'+"{p}"' for p in palabras)
+
+
+def condicion_busqueda(
+    texto: str,
+    grupos_fulltext: Sequence[Sequence[str]],
+    columnas_like: Sequence[str]
+) -> Tuple[str, List[Any]]:
+    """
+    Fragmento 'AND (...)' y sus parámetros para filtrar un listado.
+    Cada grupo de `grupos_fulltext` debe coincidir exactamente con las columnas
+    de un índice FULLTEXT (Paso 10.5). Búsqueda vacía = sin filtro; búsqueda
+    de un solo carácter (no cabe en un bigrama) = LIKE sobre `columnas_like`.
+    """
+    texto = (texto or "").strip()
+    if not texto:
+        return "", []
+
+    expresion = expresion_booleana(texto)
+    if expresion:
+        partes = [f"MATCH({', '.join(grupo)}) AGAINST (%s IN BOOLEAN MODE)" for grupo in grupos_fulltext]
+        return f"AND ({' OR '.join(partes)})", [expresion] * len(partes)
+
+    patron = f"%{texto}%"
+    partes = [f"{columna} LIKE %s" for columna in columnas_like]
+    return f"AND ({' OR '.join(partes)})", [patron] * len(partes)
+
+
+# -----------------------------------------------------------------------------
+# 2. BÚSQUEDA GLOBAL CON RELEVANCIA
+# -----------------------------------------------------------------------------
+# tipo -> columnas devueltas, tablas (siempre con 'p' para el filtro de permisos),
+# columnas del índice FULLTEXT y columna del nombre
+_ENTIDADES: Dict[str, Dict[str, Any]] = {
+    "proyecto": {
+        "select": "p.id, p.nombre, p.id AS proyecto_id, p.nombre AS nombre_proyecto, NULL AS padre_id",
+        "from": "proyectos p",
+        "fulltext": ("p.nombre", "p.descripcion"),
+        "nombre": "p.nombre",
+    },
+    "dispositivo": {
+        "select": "d.id, d.nombre, d.proyecto_id, p.nombre AS nombre_proyecto, d.proyecto_id AS padre_id",
+        "from": "dispositivos d JOIN proyectos p ON d.proyecto_id = p.id",
+        "fulltext": ("d.nombre", "d.tipo"),
+        "nombre": "d.nombre",
+    },
+    "sensor": {
+        "select": "s.id, s.nombre, d.proyecto_id, p.nombre AS nombre_proyecto, s.dispositivo_id AS padre_id",
+        "from": """sensores s
+            JOIN dispositivos d ON s.dispositivo_id = d.id
+            JOIN proyectos p ON d.proyecto_id = p.id""",
+        "fulltext": ("s.nombre", "s.tipo"),
+        "nombre": "s.nombre",
+    },
+    "campo": {
+        "select": "cs.id, cs.nombre, d.proyecto_id, p.nombre AS nombre_proyecto, cs.sensor_id AS padre_id",
+        "from": """campos_sensores cs
+            JOIN sensores s ON cs.sensor_id = s.id
+            JOIN dispositivos d ON s.dispositivo_id = d.id
+            JOIN proyectos p ON d.proyecto_id = p.id""",
+        "fulltext": ("cs.nombre",),
+        "nombre": "cs.nombre",
+    },
+}
+
+TIPOS_BUSQUEDA = tuple(_ENTIDADES)
+
+
+def _orden_relevancia(texto: str):
+    """Nombre exacto, luego prefijo, luego la puntuación FULLTEXT."""
+    texto = texto.lower()
+
+    def clave(fila: Dict[str, Any]):
+        nombre = (fila.get('nombre') or '').lower()
+        return (nombre != texto, not nombre.startswith(texto), -float(fila.get('relevancia') or 0))
+    return clave
+
+
+@en_hilo_db
+def buscar_global_db(
+    usuario_id: int,
+    texto: str,
+    limit: int = 20,
+    tipos: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """
+    Busca por nombre en proyectos, dispositivos, sensores y campos a los que
+    el usuario tiene acceso (dueño o invitado) y devuelve los `limit` más
+    relevantes mezclados. Cada tipo aporta como mucho `limit` candidatos.
+    """
+    texto = (texto or "").strip()
+    tipos = [t for t in (tipos or TIPOS_BUSQUEDA) if t in _ENTIDADES]
+    if not texto or not tipos:
+        return {"query": texto, "data": [], "total": 0}
+
+    expresion = expresion_booleana(texto)
+
+    resultados: List[Dict[str, Any]] = []
+    # conexion_db() devuelve la conexión al pool aunque una consulta falle
+    with conexion_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        for tipo in tipos:
+            entidad = _ENTIDADES[tipo]
+            if expresion:
+                match = f"MATCH({', '.join(entidad['fulltext'])}) AGAINST (%s IN BOOLEAN MODE)"
+                relevancia, condicion, orden = match, match, "relevancia DESC"
+                params_relevancia, params_condicion = [expresion], [expresion]
+            else:
+                # Un solo carácter: prefijo del nombre, sin puntuación
+                relevancia, condicion, orden = "0", f"{entidad['nombre']} LIKE %s", f"{entidad['nombre']} ASC"
+                params_relevancia, params_condicion = [], [f"{texto}%"]
+
+            cursor.execute(
+                f"""
+                SELECT {entidad['select']}, {relevancia} AS relevancia
+                FROM {entidad['from']}
+                LEFT JOIN proyecto_usuarios pu ON p.id = pu.proyecto_id AND pu.usuario_id = %s
+                WHERE (p.usuario_id = %s OR pu.usuario_id = %s)
+                  AND {condicion}
+                ORDER BY {orden}
+                LIMIT %s
+                """,
+                params_relevancia + [usuario_id, usuario_id, usuario_id] + params_condicion + [limit]
+            )
+            for fila in cursor.fetchall():
+                fila['tipo'] = tipo
+                fila['relevancia'] = float(fila['relevancia'] or 0)
+                resultados.append(fila)
+
+    resultados.sort(key=_orden_relevancia(texto))
+    return {"query": texto, "data": resultados[:limit], "total": min(len(resultados), limit)}
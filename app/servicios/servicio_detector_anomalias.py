@@ -0,0 +1,255 @@
+# app/servicios/servicio_detector_anomalias.py
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.configuracion import configuracion
+
+# Mismas ventanas que usaba la consulta de 300 filas de detectar_anomalia_individual
+HISTORIA_MAX = 300      # ~25 minutos a 5s/dato
+MINIMO_HISTORIA = 20    # Con menos datos no se evalúa
+VENTANA_MINUTO = 12     # Registros por "minuto" en movimiento
+VENTANA_Z = 60          # Registros usados para el Z-Score (5 minutos)
+VENTANA_SUAVIZADO = 3   # Los 3 más recientes forman el valor suavizado
+RECALCULO_CADA = 1000   # Actualizaciones entre recálculos exactos (evita deriva numérica)
+
+
+# -----------------------------------------------------------------------------
+# 1. REGLAS (compartidas por el camino incremental y la siembra desde BD)
+# -----------------------------------------------------------------------------
+def evaluar_movimiento(actividad_actual: float, factor_normal: float) -> Tuple[bool, Optional[str]]:
+    """Compara la actividad del último minuto contra el promedio del lugar."""
+    es_pico = False
+    mensaje = ""
+
+    # Escenario 1: Lugar Tranquilo (Factor < 2). Aquí cualquier ráfaga es sospechosa.
+    if factor_normal < 2:
+        if actividad_actual >= 5: # Si de repente hay 5 eventos o más
+            es_pico = True
+            mensaje = f"Actividad Inusual ({int(actividad_actual)}/min vs normal bajo)"
+
+    # Escenario 2: Lugar Concurrido (Factor > 10). Se necesita MUCHA actividad para que sea "pico".
+    elif factor_normal > 10:
+        if actividad_actual > (factor_normal * 2.5): # 2.5 veces lo normal
+            es_pico = True
+            mensaje = f"Pico de Tráfico ({int(actividad_actual)} vs media {int(factor_normal)})"
+
+        # Detección de "Muerte Súbita" (Caída a 0 en lugar concurrido)
+        if actividad_actual == 0:
+            es_pico = True
+            mensaje = "Caída de Actividad (0 eventos)"
+
+    # Escenario 3: Lugar Promedio
+    else:
+        if actividad_actual > (max(factor_normal, 2) * 3): # Regla general 3x
+            es_pico = True
+            mensaje = f"Alta Actividad ({int(actividad_actual)} eventos)"
+
+    if es_pico:
+        return True, mensaje
+    return False, None
+
+
+def evaluar_zscore(valor_suavizado: float, media_base: float, desviacion: float) -> Tuple[bool, Optional[str]]:
+    if desviacion < 0.1: desviacion = 0.1
+
+    z_score = (valor_suavizado - media_base) / desviacion
+    UMBRAL = 3.0
+
+    if abs(z_score) > UMBRAL:
+        tipo_pico = "ALTO" if z_score > 0 else "BAJO"
+        return True, f"Pico {tipo_pico} anómalo ({valor_suavizado:.1f})"
+    return False, None
+
+
+# -----------------------------------------------------------------------------
+# 2. ESTADO POR CAMPO (buffer circular + estadísticos acumulados)
+# -----------------------------------------------------------------------------
+class EstadoCampo:
+    """
+    Últimos HISTORIA_MAX valores de un campo, del más viejo al más reciente,
+    más los acumulados que necesitan las reglas, actualizados en O(1):
+    - suma total y suma del último "minuto" (movimiento)
+    - media/M2 de Welford sobre la línea base del Z-Score (edades 3..59)
+    """
+
+    __slots__ = (
+        "es_movimiento", "valores", "suma_total", "suma_reciente",
+        "n_base", "media_base", "m2_base", "actualizaciones",
+        "sembrado_en", "ultima_ingesta"
+    )
+
+    def __init__(self, es_movimiento: bool, historial: Iterable[float]):
+        self.es_movimiento = es_movimiento
+        self.valores: deque = deque(historial, maxlen=HISTORIA_MAX)
+        self.sembrado_en = time.monotonic()
+        self.ultima_ingesta: Optional[float] = None
+        self._recalcular()
+
+    def _recalcular(self):
+        valores = list(self.valores)
+        self.suma_total = sum(valores)
+        self.suma_reciente = sum(valores[-VENTANA_MINUTO:])
+        base = valores[-VENTANA_Z:-VENTANA_SUAVIZADO] if len(valores) > VENTANA_SUAVIZADO else []
+        self.n_base = len(base)
+        self.media_base = sum(base) / len(base) if base else 0.0
+        self.m2_base = sum((x - self.media_base) ** 2 for x in base)
+        self.actualizaciones = 0
+
+    # Welford con ventana deslizante: alta y baja de un elemento
+    def _base_agregar(self, x: float):
+        self.n_base += 1
+        delta = x - self.media_base
+        self.media_base += delta / self.n_base
+        self.m2_base += delta * (x - self.media_base)
+
+    def _base_quitar(self, x: float):
+        if self.n_base <= 1:
+            self.n_base, self.media_base, self.m2_base = 0, 0.0, 0.0
+            return
+        delta = x - self.media_base
+        self.n_base -= 1
+        self.media_base -= delta / self.n_base
+        self.m2_base -= delta * (x - self.media_base)
+
+    def agregar(self, x: float):
+        valores = self.valores
+        if len(valores) == HISTORIA_MAX:
+            self.suma_total -= valores[0]
+        valores.append(x)
+        self.suma_total += x
+
+        # Ventana del último minuto: entra x, sale el que ahora tiene edad 12
+        self.suma_reciente += x
+        if len(valores) > VENTANA_MINUTO:
+            self.suma_reciente -= valores[-VENTANA_MINUTO - 1]
+
+        # Línea base del Z-Score: entra el que pasa a edad 3, sale el que pasa a edad 60
+        if len(valores) > VENTANA_SUAVIZADO:
+            self._base_agregar(valores[-VENTANA_SUAVIZADO - 1])
+        if len(valores) > VENTANA_Z:
+            self._base_quitar(valores[-VENTANA_Z - 1])
+
+        self.actualizaciones += 1
+        if self.actualizaciones >= RECALCULO_CADA:
+            self._recalcular()
+
+    def evaluar(self) -> Tuple[bool, Optional[str]]:
+        n = len(self.valores)
+        if n < MINIMO_HISTORIA:
+            return False, None
+
+        if self.es_movimiento:
+            # Promedio de eventos por bloque de 12 en la historia previa al último minuto
+            bloques = math.ceil((n - VENTANA_MINUTO) / VENTANA_MINUTO)
+            suma_base = self.suma_total - self.suma_reciente
+            factor_normal = suma_base / bloques if bloques else 0
+            return evaluar_movimiento(self.suma_reciente, factor_normal)
+
+        v = self.valores
+        valor_suavizado = (v[-1] + v[-2] + v[-3]) / VENTANA_SUAVIZADO
+        desviacion = math.sqrt(max(self.m2_base, 0.0) / self.n_base)
+        return evaluar_zscore(valor_suavizado, self.media_base, desviacion)
+
+
+# -----------------------------------------------------------------------------
+# 3. DETECTOR (registro acotado de estados)
+# -----------------------------------------------------------------------------
+class DetectorAnomalias:
+    """
+    Mantiene el estado de los campos que alguien está consultando.
+    La ingesta alimenta solo campos ya sembrados, así la memoria queda
+    acotada a lo que se está mirando (LRU de `max_campos`).
+
+    Un estado se vuelve a sembrar desde BD si este proceso no vio ingesta
+    del campo en `ttl_sin_ingesta` (otro worker recibe los datos, o llegaron
+    por simulación) y, en todo caso, cada `ttl_max` segundos.
+    """
+
+    def __init__(self, max_campos: int = 5000, ttl_sin_ingesta: float = 30.0, ttl_max: float = 600.0):
+        self.max_campos = max(1, max_campos)
+        self.ttl_sin_ingesta = ttl_sin_ingesta
+        self.ttl_max = ttl_max
+        self._estados: "OrderedDict[int, EstadoCampo]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._evaluaciones = 0
+        self._siembras = 0
+        self._observados = 0
+
+    def _vigente(self, estado: EstadoCampo, ahora: float) -> bool:
+        if ahora - estado.sembrado_en > self.ttl_max:
+            return False
+        ultima_novedad = max(estado.sembrado_en, estado.ultima_ingesta or 0.0)
+        return ahora - ultima_novedad <= self.ttl_sin_ingesta
+
+    def evaluar(self, campo_id: int) -> Optional[Tuple[bool, Optional[str]]]:
+        """Evalúa en O(1). Devuelve None si el campo necesita (re)siembra desde BD."""
+        ahora = time.monotonic()
+        with self._lock:
+            estado = self._estados.get(campo_id)
+            if estado is None or not self._vigente(estado, ahora):
+                return None
+            self._estados.move_to_end(campo_id)
+            self._evaluaciones += 1
+            return estado.evaluar()
+
+    def sembrar(self, campo_id: int, es_movimiento: bool, historial: List[float]) -> Tuple[bool, Optional[str]]:
+        """Instala el estado a partir de la historia (del más viejo al más reciente) y lo evalúa."""
+        estado = EstadoCampo(es_movimiento, historial)
+        with self._lock:
+            self._estados[campo_id] = estado
+            self._estados.move_to_end(campo_id)
+            while len(self._estados) > self.max_campos:
+                self._estados.popitem(last=False)
+            self._siembras += 1
+            self._evaluaciones += 1
+            return estado.evaluar()
+
+    def observar_filas(self, filas: Iterable[Tuple]):
+        """
+        Alimenta el detector con filas recién confirmadas en 'valores'
+        (tuplas (valor, fecha_lectura, fecha_registro, campo_id) de la ingesta).
+        Un lote puede traer paquetes desordenados: se aplican por fecha de lectura,
+        el mismo orden que usa la consulta de siembra.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            if not self._estados:
+                return
+            for valor, _, _, campo_id in sorted(filas, key=lambda fila: fila[1]):
+                estado = self._estados.get(campo_id)
+                if estado is None:
+                    continue
+                try:
+                    x = float(valor)
+                except (TypeError, ValueError):
+                    continue
+                estado.agregar(x)
+                estado.ultima_ingesta = ahora
+                self._observados += 1
+
+    def invalidar(self, campo_id: Optional[int]):
+        if campo_id is None:
+            return
+        with self._lock:
+            self._estados.pop(int(campo_id), None)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "campos_en_memoria": len(self._estados),
+                "evaluaciones": self._evaluaciones,
+                "siembras_desde_bd": self._siembras,
+                "valores_observados": self._observados,
+            }
+
+
+# Instancia global: la alimenta la ingesta y la consulta detectar_anomalia_individual
+detector_anomalias = DetectorAnomalias(
+    max_campos=configuracion.DETECTOR_MAX_CAMPOS,
+    ttl_sin_ingesta=configuracion.DETECTOR_TTL_SIN_INGESTA,
+    ttl_max=configuracion.DETECTOR_TTL_MAX
+)
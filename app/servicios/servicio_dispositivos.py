@@ -1,19 +1,29 @@
 import pymysql
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime
 from fastapi import HTTPException
 from app.servicios.servicio_simulacion import get_db_connection, simular_datos_json
+from app.db.ejecutor_db import en_hilo_db
+from app.servicios.servicio_paginacion import cache_conteos, filtro_after_id, recortar_pagina_cursor
+from app.servicios.servicio_busqueda import condicion_busqueda
 
 
 # -----------------------------------------------------------------------------
 # 1. OBTENER DISPOSITIVOS GLOBALES
 # -----------------------------------------------------------------------------
-async def obtener_dispositivos_globales_paginado_db(
-    current_user_id: int, page: int = 1, limit: int = 10, search: str = ""
+@en_hilo_db
+def obtener_dispositivos_globales_paginado_db(
+    current_user_id: int, page: int = 1, limit: int = 10, search: str = "", after_id: Optional[int] = None
 ) -> Dict[str, Any]:
+    """
+    Con after_id (modo cursor; 0 = primera página) no hay OFFSET: se sigue
+    el índice de d.id hacia atrás, y el total sale de la caché de conteos.
+    """
     
     offset = (page - 1) * limit
-    search_pattern = f"%{search}%"
+    filtro_busqueda, params_busqueda = condicion_busqueda(
+        search, [("d.nombre", "d.tipo"), ("p.nombre",)], ["d.nombre", "d.tipo", "p.nombre"]
+    )
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
     
     conn = None
@@ -21,27 +31,42 @@ async def obtener_dispositivos_globales_paginado_db(
         conn = get_db_connection()
         cursor = conn.cursor(pymysql.cursors.DictCursor)
         
-        sql_base = """
+        # pu se une solo con la fila del usuario (única por proyecto): no hay duplicados que quitar
+        sql_base = f"""
         FROM dispositivos d
         JOIN proyectos p ON d.proyecto_id = p.id
         LEFT JOIN proyecto_usuarios pu ON p.id = pu.proyecto_id AND pu.usuario_id = %s
         WHERE (p.usuario_id = %s OR pu.usuario_id = %s)
-          AND (d.nombre LIKE %s OR d.tipo LIKE %s OR p.nombre LIKE %s)
+          {filtro_busqueda}
         """
-        params_count = [current_user_id, current_user_id, current_user_id, search_pattern, search_pattern, search_pattern]
+        params_count = [current_user_id, current_user_id, current_user_id] + params_busqueda
+        sql_count = f"SELECT COUNT(DISTINCT d.id) as total {sql_base}"
         
-        cursor.execute(f"SELECT COUNT(DISTINCT d.id) as total {sql_base}", params_count)
-        result_total = cursor.fetchone()
-        total_records = result_total['total'] if result_total else 0
-        
-        sql_final = f"""
-        SELECT DISTINCT d.id, d.nombre, d.descripcion, d.tipo, d.latitud, d.longitud, d.habilitado, d.fecha_creacion, d.proyecto_id, 
-            p.nombre AS nombre_proyecto, p.usuario_id AS propietario_id
-        {sql_base}
-        ORDER BY d.id DESC LIMIT %s OFFSET %s
-        """
-        cursor.execute(sql_final, params_count + [limit, offset])
-        dispositivos = cursor.fetchall()
+        if after_id is not None:
+            total_records = cache_conteos.obtener(cursor, ("dispositivos", current_user_id, search), sql_count, params_count)
+            filtro_cursor, params_cursor = filtro_after_id("d.id", after_id)
+            sql_final = f"""
+            SELECT d.id, d.nombre, d.descripcion, d.tipo, d.latitud, d.longitud, d.habilitado, d.fecha_creacion, d.proyecto_id, 
+                p.nombre AS nombre_proyecto, p.usuario_id AS propietario_id
+            {sql_base}
+            {filtro_cursor}
+            ORDER BY d.id DESC LIMIT %s
+            """
+            cursor.execute(sql_final, params_count + params_cursor + [limit + 1])
+            dispositivos, next_after_id, has_more = recortar_pagina_cursor(cursor.fetchall(), limit)
+        else:
+            cursor.execute(sql_count, params_count)
+            result_total = cursor.fetchone()
+            total_records = result_total['total'] if result_total else 0
+            
+            sql_final = f"""
+            SELECT DISTINCT d.id, d.nombre, d.descripcion, d.tipo, d.latitud, d.longitud, d.habilitado, d.fecha_creacion, d.proyecto_id, 
+                p.nombre AS nombre_proyecto, p.usuario_id AS propietario_id
+            {sql_base}
+            ORDER BY d.id DESC LIMIT %s OFFSET %s
+            """
+            cursor.execute(sql_final, params_count + [limit, offset])
+            dispositivos = cursor.fetchall()
         
         for disp in dispositivos:
             if 'habilitado' in disp: disp['habilitado'] = bool(disp['habilitado'])
@@ -50,7 +75,10 @@ async def obtener_dispositivos_globales_paginado_db(
             if disp.get('latitud') is not None: disp['latitud'] = float(disp['latitud'])
             if disp.get('longitud') is not None: disp['longitud'] = float(disp['longitud'])
             
-        return {"data": dispositivos, "total": total_records, "page": page, "limit": limit}
+        resultado = {"data": dispositivos, "total": total_records, "page": page, "limit": limit}
+        if after_id is not None:
+            resultado.update({"after_id": after_id, "next_after_id": next_after_id, "has_more": has_more})
+        return resultado
     except Exception as e:
         print(f"Error DB globales: {e}")
         raise e
@@ -60,7 +88,8 @@ async def obtener_dispositivos_globales_paginado_db(
 # -----------------------------------------------------------------------------
 # 2. OBTENER DISPOSITIVOS POR PROYECTO (VERSIÓN LIMPIA)
 # -----------------------------------------------------------------------------
-async def obtener_dispositivos_por_proyecto_paginado_db(
+@en_hilo_db
+def obtener_dispositivos_por_proyecto_paginado_db(
     proyecto_id: int, 
     # usuario_id REMOVIDO: Ya no calculamos seguridad aquí
     page: int = 1, 
@@ -69,7 +98,7 @@ async def obtener_dispositivos_por_proyecto_paginado_db(
 ) -> Dict[str, Any]:
     
     offset = (page - 1) * limit
-    search_pattern = f"%{search}%"
+    filtro_busqueda, params_busqueda = condicion_busqueda(search, [("d.nombre", "d.tipo")], ["d.nombre", "d.tipo"])
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
     
     conn = None
@@ -78,8 +107,8 @@ async def obtener_dispositivos_por_proyecto_paginado_db(
         cursor = conn.cursor(pymysql.cursors.DictCursor)
         
         # 1. Filtros simples (Solo Proyecto y Búsqueda)
-        where_clause = "WHERE d.proyecto_id = %s AND (d.nombre LIKE %s OR d.tipo LIKE %s)"
-        params_base = [proyecto_id, search_pattern, search_pattern]
+        where_clause = f"WHERE d.proyecto_id = %s {filtro_busqueda}"
+        params_base = [proyecto_id] + params_busqueda
         
         # 2. Total
         sql_count = f"SELECT COUNT(*) as total FROM dispositivos d {where_clause}"
@@ -128,7 +157,8 @@ async def obtener_dispositivos_por_proyecto_paginado_db(
 # -----------------------------------------------------------------------------
 # 3. RESUMEN DE DISPOSITIVO
 # -----------------------------------------------------------------------------
-async def get_resumen_dispositivo_db(dispositivo_id: int) -> Dict[str, Any]:
+@en_hilo_db
+def get_resumen_dispositivo_db(dispositivo_id: int) -> Dict[str, Any]:
     conn = None
     try:
         conn = get_db_connection()
@@ -182,7 +212,8 @@ async def get_resumen_dispositivo_db(dispositivo_id: int) -> Dict[str, Any]:
 # -----------------------------------------------------------------------------
 # 4. OBTENER UN DISPOSITIVO POR ID
 # -----------------------------------------------------------------------------
-async def obtener_dispositivo_por_id_db(dispositivo_id: int) -> Dict[str, Any]:
+@en_hilo_db
+def obtener_dispositivo_por_id_db(dispositivo_id: int) -> Dict[str, Any]:
     conn = None
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
     try:
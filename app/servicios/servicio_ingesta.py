@@ -0,0 +1,298 @@
+# app/servicios/servicio_ingesta.py
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pymysql
+
+from app.api.modelos.recepcion_datos import PayloadDispositivo
+from app.configuracion import configuracion
+
+# Columnas en el mismo orden que la tupla que arma resolver_valores_paquete()
+SQL_INSERT_VALORES = """
+    INSERT INTO valores (valor, fecha_hora_lectura, fecha_hora_registro, campo_id)
+    VALUES (%s, %s, %s, %s)
+"""
+
+SQL_INSERT_PAQUETES = """
+    INSERT INTO paquetes_recibidos (dispositivo_id, id_paquete, fecha_hora_lectura, fecha_hora_registro)
+    VALUES (%s, %s, %s, %s)
+"""
+
+# Código MySQL de clave duplicada (otro proceso registró el mismo paquete a la vez)
+ERROR_CLAVE_DUPLICADA = 1062
+# Códigos MySQL/cliente que se resuelven reintentando: espera de bloqueo, deadlock,
+# demasiadas conexiones, servidor apagándose o conexión perdida
+ERRORES_TRANSITORIOS = {1205, 1213, 1040, 1053, 2002, 2003, 2006, 2013}
+
+# Identidad de un paquete: (dispositivo_id, id_paquete, fecha_hora_lectura)
+ClavePaquete = Tuple[int, int, datetime]
+
+
+# -----------------------------------------------------------------------------
+# 1. ÍNDICE EN MEMORIA: (dispositivo, sensor, campo) -> campo_id
+# -----------------------------------------------------------------------------
+class IndiceCampos:
+    """
+    Cache por dispositivo de {sensor_nombre: {campo_nombre: campo_id}}.
+    Se carga con UNA consulta por dispositivo y se invalida cuando se crean,
+    renombran o eliminan sensores/campos. El TTL cubre los cambios hechos
+    desde otro proceso (otro worker de uvicorn, scripts SQL, etc.).
+    """
+
+    def __init__(self, ttl_segundos: float = 300.0):
+        self.ttl_segundos = ttl_segundos
+        self._por_dispositivo: Dict[int, Tuple[float, Dict[str, Dict[str, int]]]] = {}
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+
+    @staticmethod
+    def normalizar(nombre: Any) -> str:
+        # MySQL compara nombres sin distinguir mayúsculas; replicamos ese criterio
+        return str(nombre).strip().casefold()
+
+    def obtener_mapa(self, cursor, dispositivo_id: int) -> Dict[str, Dict[str, int]]:
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._por_dispositivo.get(dispositivo_id)
+            if entrada and (ahora - entrada[0]) < self.ttl_segundos:
+                self._aciertos += 1
+                return entrada[1]
+            self._fallos += 1
+
+        mapa = self._cargar(cursor, dispositivo_id)
+        with self._lock:
+            self._por_dispositivo[dispositivo_id] = (ahora, mapa)
+        return mapa
+
+    def _cargar(self, cursor, dispositivo_id: int) -> Dict[str, Dict[str, int]]:
+        # LEFT JOIN para distinguir "sensor sin campos" de "sensor inexistente"
+        cursor.execute(
+            """
+            SELECT s.nombre AS sensor_nombre, cs.nombre AS campo_nombre, cs.id AS campo_id
+            FROM sensores s
+            LEFT JOIN campos_sensores cs ON cs.sensor_id = s.id
+            WHERE s.dispositivo_id = %s
+            ORDER BY s.id ASC, cs.id ASC
+            """,
+            (dispositivo_id,)
+        )
+        mapa: Dict[str, Dict[str, int]] = {}
+        for row in cursor.fetchall():
+            campos = mapa.setdefault(self.normalizar(row['sensor_nombre']), {})
+            if row['campo_id'] is not None:
+                # setdefault: ante nombres repetidos gana el primero, igual que el fetchone() anterior
+                campos.setdefault(self.normalizar(row['campo_nombre']), row['campo_id'])
+        return mapa
+
+    def invalidar_dispositivo(self, dispositivo_id: Optional[int]):
+        if dispositivo_id is None:
+            return
+        with self._lock:
+            self._por_dispositivo.pop(int(dispositivo_id), None)
+
+    def invalidar_todo(self):
+        with self._lock:
+            self._por_dispositivo.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "dispositivos_cacheados": len(self._por_dispositivo),
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+            }
+
+
+# Instancia global compartida por la ingesta y por las rutas de sensores/campos
+indice_campos = IndiceCampos()
+
+
+# -----------------------------------------------------------------------------
+# 2. PREPARACIÓN DE FILAS
+# -----------------------------------------------------------------------------
+def parsear_fecha_paquete(datos: PayloadDispositivo) -> datetime:
+    """Fecha/hora que reporta el dispositivo (fecha_hora_lectura)."""
+    return datetime.strptime(f"{datos.fecha} {datos.hora}", "%Y-%m-%d %H:%M:%S")
+
+
+def resolver_valores_paquete(
+    datos: PayloadDispositivo,
+    mapa: Dict[str, Dict[str, int]],
+    fecha_hora_lectura: datetime,
+    fecha_hora_registro: datetime
+) -> Tuple[List[Tuple[str, datetime, datetime, int]], int]:
+    """
+    Traduce los nombres del paquete a campo_id usando el mapa del dispositivo.
+    Devuelve (filas_para_insertar, registros_con_error).
+    """
+    filas = []
+    errores = 0
+    for sensor in datos.sensores:
+        campos = mapa.get(IndiceCampos.normalizar(sensor.nombre))
+        if campos is None:
+            errores += len(sensor.datos)
+            print(f"Error: Sensor '{sensor.nombre.strip()}' no encontrado en Dispositivo ID {datos.dispositivo}.")
+            continue
+
+        for campo_nombre, valor in sensor.datos.items():
+            campo_id = campos.get(IndiceCampos.normalizar(campo_nombre))
+            if campo_id is None:
+                errores += 1
+                print(f"Error: Campo '{campo_nombre}' no encontrado en Sensor '{sensor.nombre.strip()}'.")
+                continue
+            filas.append((str(valor), fecha_hora_lectura, fecha_hora_registro, campo_id))
+
+    return filas, errores
+
+
+# -----------------------------------------------------------------------------
+# 3. ESCRITURA EN LOTE
+# -----------------------------------------------------------------------------
+def campos_inexistentes(cursor, campo_ids: Iterable[int]) -> Set[int]:
+    """
+    Devuelve los campo_id que ya no están en campos_sensores. 'valores' no tiene
+    FOREIGN KEY (está particionada), así que un índice desactualizado insertaría
+    filas huérfanas sin error. Se llama dentro de la transacción de escritura:
+    FOR SHARE bloquea los campos encontrados y un DELETE concurrente espera al commit.
+    """
+    pendientes = sorted(set(campo_ids))
+    if not pendientes:
+        return set()
+
+    existentes = set()
+    for inicio in range(0, len(pendientes), 500):
+        bloque = pendientes[inicio:inicio + 500]
+        marcadores = ", ".join(["%s"] * len(bloque))
+        cursor.execute(f"SELECT id FROM campos_sensores WHERE id IN ({marcadores}) FOR SHARE", bloque)
+        existentes.update(row['id'] for row in cursor.fetchall())
+    return set(pendientes) - existentes
+
+
+def insertar_valores_lote(cursor, filas: List[Tuple]) -> int:
+    """
+    Inserta todas las filas con un solo executemany: PyMySQL lo reescribe como
+    un INSERT multi-fila (VALUES (...), (...), ...), es decir, un solo viaje.
+    """
+    if not filas:
+        return 0
+    cursor.executemany(SQL_INSERT_VALORES, filas)
+    return len(filas)
+
+
+def es_error_clave_duplicada(error: Exception) -> bool:
+    return isinstance(error, pymysql.err.IntegrityError) and bool(error.args) and error.args[0] == ERROR_CLAVE_DUPLICADA
+
+
+def es_error_transitorio(error: Exception) -> bool:
+    """True si reintentar la misma escritura puede salir bien (BD caída, bloqueo, timeout)."""
+    if isinstance(error, (TimeoutError, ConnectionError, pymysql.err.InterfaceError)):
+        return True
+    return isinstance(error, pymysql.err.OperationalError) and bool(error.args) and error.args[0] in ERRORES_TRANSITORIOS
+
+
+# -----------------------------------------------------------------------------
+# 4. DEDUPLICACIÓN DE PAQUETES (reintentos del dispositivo)
+# -----------------------------------------------------------------------------
+def clave_paquete(datos: PayloadDispositivo, dispositivo_id: int, fecha_hora_lectura: datetime) -> ClavePaquete:
+    """
+    Un reintento reenvía el mismo id_paquete con la misma fecha/hora de lectura.
+    Incluir la fecha evita descartar datos nuevos cuando el contador del
+    dispositivo se reinicia (reinicio del ESP32, simulador relanzado, etc.).
+    """
+    return (dispositivo_id, datos.id_paquete, fecha_hora_lectura)
+
+
+class CachePaquetesRecientes:
+    """
+    Conjunto acotado (LRU + TTL) de paquetes ya guardados. Rechaza los
+    reintentos sin tocar MySQL; lo que no está aquí se verifica contra la
+    tabla paquetes_recibidos, que es la fuente de verdad.
+    """
+
+    def __init__(self, capacidad: int = 100000, ttl_segundos: float = 3600.0):
+        self.capacidad = max(1, capacidad)
+        self.ttl_segundos = ttl_segundos
+        self._claves: "OrderedDict[ClavePaquete, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+
+    def contiene(self, clave: ClavePaquete) -> bool:
+        ahora = time.monotonic()
+        with self._lock:
+            registrado_en = self._claves.get(clave)
+            if registrado_en is not None and (ahora - registrado_en) < self.ttl_segundos:
+                self._aciertos += 1
+                return True
+            if registrado_en is not None:
+                del self._claves[clave]
+            self._fallos += 1
+            return False
+
+    def registrar(self, claves):
+        ahora = time.monotonic()
+        with self._lock:
+            for clave in claves:
+                self._claves[clave] = ahora
+                self._claves.move_to_end(clave)
+            while len(self._claves) > self.capacidad:
+                self._claves.popitem(last=False)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "paquetes_cacheados": len(self._claves),
+                "capacidad": self.capacidad,
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+            }
+
+
+# Instancia global: la comparten la ruta directa, el lote y la cola de ingesta
+paquetes_recientes = CachePaquetesRecientes(
+    capacidad=configuracion.INGESTA_DEDUP_CACHE_MAX,
+    ttl_segundos=configuracion.INGESTA_DEDUP_TTL
+)
+
+
+def filtrar_paquetes_nuevos(cursor, claves: List[ClavePaquete]) -> List[ClavePaquete]:
+    """
+    Devuelve las claves que todavía no están en paquetes_recibidos (sin repetir).
+    No las registra: eso lo hace registrar_paquetes() con las que sí guardaron filas.
+    """
+    unicas = list(dict.fromkeys(claves))
+    if not unicas:
+        return []
+
+    existentes = set()
+    for inicio in range(0, len(unicas), 500):
+        bloque = unicas[inicio:inicio + 500]
+        condiciones = " OR ".join(["(dispositivo_id = %s AND id_paquete = %s AND fecha_hora_lectura = %s)"] * len(bloque))
+        parametros = [valor for clave in bloque for valor in clave]
+        cursor.execute(
+            f"SELECT dispositivo_id, id_paquete, fecha_hora_lectura FROM paquetes_recibidos WHERE {condiciones}",
+            parametros
+        )
+        for row in cursor.fetchall():
+            existentes.add((row['dispositivo_id'], row['id_paquete'], row['fecha_hora_lectura']))
+
+    return [clave for clave in unicas if clave not in existentes]
+
+
+def registrar_paquetes(cursor, claves: List[ClavePaquete]) -> int:
+    """
+    Registra las claves en paquetes_recibidos dentro de la transacción en curso.
+    Si otro proceso registró la misma clave al mismo tiempo, el INSERT falla con
+    1062 y el llamador debe hacer rollback y reintentar.
+    """
+    unicas = list(dict.fromkeys(claves))
+    if not unicas:
+        return 0
+    fecha_hora_registro = datetime.utcnow()
+    cursor.executemany(SQL_INSERT_PAQUETES, [clave + (fecha_hora_registro,) for clave in unicas])
+    return len(unicas)
@@ -0,0 +1,81 @@
+# app/servicios/servicio_paginacion.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.configuracion import configuracion
+
+
+# -----------------------------------------------------------------------------
+# 1. CONTEOS CACHEADOS (el COUNT DISTINCT es lo más caro de cada página)
+# -----------------------------------------------------------------------------
+class CacheConteos:
+    """
+    Totales por (listado, usuario, búsqueda) con TTL corto. En modo cursor
+    el total es informativo (la navegación usa next_after_id), así que un
+    valor con unos segundos de antigüedad es aceptable.
+    """
+
+    def __init__(self, ttl_segundos: float = 30.0, max_entradas: int = 10000):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max(1, max_entradas)
+        self._conteos: "OrderedDict[Tuple, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+
+    def obtener(self, cursor, clave: Tuple, sql: str, params: List[Any]) -> int:
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._conteos.get(clave)
+            if entrada and (ahora - entrada[0]) < self.ttl_segundos:
+                self._conteos.move_to_end(clave)
+                self._aciertos += 1
+                return entrada[1]
+            self._fallos += 1
+
+        cursor.execute(sql, params)
+        fila = cursor.fetchone()
+        total = int(fila['total']) if fila and fila['total'] is not None else 0
+
+        with self._lock:
+            self._conteos[clave] = (ahora, total)
+            self._conteos.move_to_end(clave)
+            while len(self._conteos) > self.max_entradas:
+                self._conteos.popitem(last=False)
+        return total
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "conteos_cacheados": len(self._conteos),
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+            }
+
+
+# Instancia global compartida por los listados paginados
+cache_conteos = CacheConteos(ttl_segundos=configuracion.PAGINACION_CONTEO_TTL)
+
+
+# -----------------------------------------------------------------------------
+# 2. PAGINACIÓN POR CURSOR (keyset sobre id DESC)
+# -----------------------------------------------------------------------------
+def filtro_after_id(columna_id: str, after_id: int) -> Tuple[str, List[Any]]:
+    """Condición keyset; after_id = 0 es la primera página (sin condición)."""
+    if after_id and after_id > 0:
+        return f"AND {columna_id} < %s", [after_id]
+    return "", []
+
+
+def recortar_pagina_cursor(filas: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[int], bool]:
+    """
+    La consulta pide limit + 1 filas: si llega la extra, hay más páginas.
+    Devuelve (filas_de_la_pagina, next_after_id, has_more).
+    """
+    hay_mas = len(filas) > limit
+    pagina = filas[:limit]
+    siguiente = pagina[-1]['id'] if hay_mas and pagina else None
+    return pagina, siguiente, hay_mas
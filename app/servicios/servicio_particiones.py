@@ -0,0 +1,180 @@
+# app/servicios/servicio_particiones.py
+
+import pymysql
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import en_hilo_db
+from app.configuracion import configuracion
+from app.servicios.servicio_agregacion import PROCESO_HORARIO
+
+# 'valores' se particiona por mes: pAAAAMM guarda las lecturas de ese mes
+# (RANGE COLUMNS sobre fecha_hora_lectura) y p_futuro recoge el resto. Las
+# particiones se crean por adelantado partiendo p_futuro mientras está vacía,
+# así la reorganización no mueve filas.
+PARTICION_FUTURO = "p_futuro"
+
+
+# -----------------------------------------------------------------------------
+# 1. UTILIDADES
+# -----------------------------------------------------------------------------
+def _sumar_meses(mes: date, n: int) -> date:
+    indice = mes.year * 12 + (mes.month - 1) + n
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def _nombre_particion(mes: date) -> str:
+    return f"p{mes:%Y%m}"
+
+
+def _mes_de_particion(nombre: str) -> Optional[date]:
+    """pAAAAMM -> primer día del mes; None para p_futuro u otros nombres."""
+    if len(nombre) != 7 or not nombre.startswith("p") or not nombre[1:].isdigit():
+        return None
+    return date(int(nombre[1:5]), int(nombre[5:7]), 1)
+
+
+def _listar_particiones(cursor) -> List[Dict[str, Any]]:
+    cursor.execute(
+        """
+        SELECT PARTITION_NAME AS nombre, TABLE_ROWS AS filas_aprox
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'valores'
+          AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+        """
+    )
+    return cursor.fetchall()
+
+
+# -----------------------------------------------------------------------------
+# 2. PARTICIONES FUTURAS
+# -----------------------------------------------------------------------------
+def _crear_particiones_futuras(cursor, particiones: List[Dict[str, Any]]) -> List[str]:
+    meses = sorted(m for m in (_mes_de_particion(p['nombre']) for p in particiones) if m)
+    if meses:
+        desde = _sumar_meses(meses[-1], 1)
+    else:
+        # Recién migrada (solo p_futuro): se parte desde el mes más antiguo que tenga.
+        # Es la única vez que la reorganización copia filas.
+        cursor.execute(f"SELECT MIN(fecha_hora_lectura) AS minima FROM valores PARTITION ({PARTICION_FUTURO})")
+        minima = (cursor.fetchone() or {}).get('minima') or datetime.now()
+        desde = minima.date().replace(day=1)
+
+    hasta = _sumar_meses(date.today().replace(day=1), max(0, configuracion.VALORES_PARTICIONES_ADELANTE))
+    nuevos = []
+    mes = desde
+    while mes <= hasta:
+        nuevos.append(mes)
+        mes = _sumar_meses(mes, 1)
+    if not nuevos:
+        return []
+
+    definiciones = ",\n".join(
+        f"PARTITION {_nombre_particion(m)} VALUES LESS THAN ('{_sumar_meses(m, 1):%Y-%m-%d}')" for m in nuevos
+    )
+    cursor.execute(
+        f"""
+        ALTER TABLE valores REORGANIZE PARTITION {PARTICION_FUTURO} INTO (
+            {definiciones},
+            PARTITION {PARTICION_FUTURO} VALUES LESS THAN (MAXVALUE)
+        )
+        """
+    )
+    return [_nombre_particion(m) for m in nuevos]
+
+
+# -----------------------------------------------------------------------------
+# 3. RETENCIÓN (solo particiones ya agregadas)
+# -----------------------------------------------------------------------------
+def _archivar_particion(cursor, nombre: str, mes: date) -> str:
+    """
+    Mueve la partición a una tabla normal valores_archivo_AAAAMM con EXCHANGE
+    PARTITION (intercambio de tablespaces, sin copiar filas). Si la tabla ya
+    existe falla: nunca se mezcla con un archivo anterior.
+    """
+    tabla = f"valores_archivo_{mes:%Y%m}"
+    cursor.execute(f"CREATE TABLE {tabla} LIKE valores")
+    cursor.execute(f"ALTER TABLE {tabla} REMOVE PARTITIONING")
+    cursor.execute(f"ALTER TABLE valores EXCHANGE PARTITION {nombre} WITH TABLE {tabla}")
+    return tabla
+
+
+def _retirar_particiones_antiguas(cursor, particiones: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    meses_retencion = configuracion.VALORES_RETENCION_MESES
+    if meses_retencion <= 0:
+        return []
+    limite = _sumar_meses(date.today().replace(day=1), -meses_retencion)
+
+    cursor.execute("SELECT ultimo_id, cubierto_hasta FROM agregacion_marcas WHERE proceso = %s", (PROCESO_HORARIO,))
+    marca = cursor.fetchone()
+    if not marca:
+        # Sin agregación no hay resumen de esos meses: no se borra nada
+        return []
+
+    retiradas = []
+    for particion in particiones:
+        mes = _mes_de_particion(particion['nombre'])
+        if mes is None:
+            continue
+        fin = _sumar_meses(mes, 1)
+        if fin > limite:
+            break
+        # Agregada = el mes entero quedó por debajo de la marca de agua
+        if datetime.combine(fin, datetime.min.time()) > marca['cubierto_hasta']:
+            break
+        cursor.execute(f"SELECT MAX(id) AS tope FROM valores PARTITION ({particion['nombre']})")
+        tope = (cursor.fetchone() or {}).get('tope')
+        if tope is not None and int(tope) > int(marca['ultimo_id']):
+            print(f"⚠️ [Particiones] {particion['nombre']} tiene filas sin agregar (id {tope}); se conserva")
+            continue
+
+        destino = None
+        if configuracion.VALORES_RETENCION_MODO == "archivar" and tope is not None:
+            destino = _archivar_particion(cursor, particion['nombre'], mes)
+        cursor.execute(f"ALTER TABLE valores DROP PARTITION {particion['nombre']}")
+        retiradas.append({"particion": particion['nombre'], "archivo": destino})
+    return retiradas
+
+
+# -----------------------------------------------------------------------------
+# 4. MANTENIMIENTO (scheduler diario / endpoint manual)
+# -----------------------------------------------------------------------------
+@en_hilo_db(timeout=None)
+def mantener_particiones_valores() -> Dict[str, Any]:
+    """
+    Crea las particiones mensuales de los próximos VALORES_PARTICIONES_ADELANTE
+    meses y retira (borra o archiva, VALORES_RETENCION_MODO) las de meses más
+    antiguos que VALORES_RETENCION_MESES que la agregación ya cubrió.
+    Las sentencias son DDL: cada una se confirma sola.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            start_time = time.time()
+            particiones = _listar_particiones(cursor)
+            if not particiones:
+                print("⚠️ [Particiones] 'valores' no está particionada (ver Paso 5 de BaseDatosMysql.sql)")
+                return {"status": "skipped", "message": "tabla valores sin particionar"}
+
+            creadas = _crear_particiones_futuras(cursor, particiones)
+            retiradas = _retirar_particiones_antiguas(cursor, _listar_particiones(cursor))
+
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 🗂️ Particiones de valores: "
+                  f"{len(creadas)} creadas, {len(retiradas)} retiradas")
+            return {
+                "status": "success",
+                "creadas": creadas,
+                "retiradas": retiradas,
+                "duration_seconds": time.time() - start_time,
+            }
+
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ Error en mantenimiento de particiones: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        if conn:
+            conn.close()
@@ -1,6 +1,167 @@
 import pymysql
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, NamedTuple, Optional, Tuple
 from fastapi import HTTPException, status
-from app.servicios.servicio_simulacion import get_db_connection
+from app.configuracion import configuracion
+from app.db.ejecutor_db import en_hilo_db
+from app.db.pool_conexiones import conexion_db
+
+# Permiso que da acceso total a cualquier proyecto
+PERMISO_ADMIN_SISTEMA = 'GESTION_USUARIOS_SISTEMA'
+
+
+# ---------------------------------------------------------
+# 0. CACHÉ DE DECISIONES Y DE ANCESTROS
+# ---------------------------------------------------------
+class ContextoPermisos(NamedTuple):
+    """Lo que un usuario es dentro de un proyecto (una sola consulta lo trae todo)."""
+    existe: bool
+    es_propietario: bool
+    rol_nombre: Optional[str]
+    permisos: FrozenSet[str]
+
+    def permite(self, permiso: str) -> bool:
+        return self.es_propietario or permiso in self.permisos or PERMISO_ADMIN_SISTEMA in self.permisos
+
+
+class CachePermisos:
+    """
+    (usuario, proyecto) -> ContextoPermisos  y  (tipo, id) -> proyecto_id.
+    Se invalida al cambiar membresías o proyectos (proyectos.py) y al borrar
+    dispositivos/sensores/campos. El TTL cubre lo que cambia fuera de la API
+    (roles y rol_permisos se editan por SQL, otros workers de uvicorn).
+    """
+
+    def __init__(self, ttl_segundos: float = 60.0, max_entradas: int = 50000):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max(1, max_entradas)
+        self._contextos: "OrderedDict[Tuple[int, int], Tuple[float, ContextoPermisos]]" = OrderedDict()
+        self._ancestros: "OrderedDict[Tuple[str, int], Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+
+    def _leer(self, tabla: OrderedDict, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = tabla.get(clave)
+            if entrada and (ahora - entrada[0]) < self.ttl_segundos:
+                tabla.move_to_end(clave)
+                self._aciertos += 1
+                return entrada[1]
+            if entrada:
+                del tabla[clave]
+            self._fallos += 1
+            return None
+
+    def _guardar(self, tabla: OrderedDict, clave, valor):
+        with self._lock:
+            tabla[clave] = (time.monotonic(), valor)
+            tabla.move_to_end(clave)
+            while len(tabla) > self.max_entradas:
+                tabla.popitem(last=False)
+
+    def contexto(self, usuario_id: int, proyecto_id: int) -> Optional[ContextoPermisos]:
+        return self._leer(self._contextos, (int(usuario_id), int(proyecto_id)))
+
+    def guardar_contexto(self, usuario_id: int, proyecto_id: int, contexto: ContextoPermisos):
+        self._guardar(self._contextos, (int(usuario_id), int(proyecto_id)), contexto)
+
+    def proyecto_de(self, tipo: str, id: int) -> Optional[int]:
+        return self._leer(self._ancestros, (tipo, int(id)))
+
+    def guardar_proyecto_de(self, tipo: str, id: int, proyecto_id: int):
+        self._guardar(self._ancestros, (tipo, int(id)), proyecto_id)
+
+    # --- Invalidación ---
+    def invalidar_miembro(self, proyecto_id: Optional[int], usuario_id: Optional[int]):
+        if proyecto_id is None or usuario_id is None:
+            return
+        with self._lock:
+            self._contextos.pop((int(usuario_id), int(proyecto_id)), None)
+
+    def invalidar_proyecto(self, proyecto_id: Optional[int]):
+        """Membresías o dueño cambiaron, o el proyecto se creó/eliminó."""
+        if proyecto_id is None:
+            return
+        proyecto_id = int(proyecto_id)
+        with self._lock:
+            for clave in [c for c in self._contextos if c[1] == proyecto_id]:
+                del self._contextos[clave]
+            for clave in [c for c, (_, p) in self._ancestros.items() if p == proyecto_id]:
+                del self._ancestros[clave]
+
+    def invalidar_ancestro(self, tipo: str, id: Optional[int]):
+        if id is None:
+            return
+        with self._lock:
+            self._ancestros.pop((tipo, int(id)), None)
+
+    def invalidar_todo(self):
+        with self._lock:
+            self._contextos.clear()
+            self._ancestros.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "contextos_cacheados": len(self._contextos),
+                "ancestros_cacheados": len(self._ancestros),
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+            }
+
+
+# Instancia global compartida por todas las rutas protegidas
+cache_permisos = CachePermisos(
+    ttl_segundos=configuracion.PERMISOS_CACHE_TTL,
+    max_entradas=configuracion.PERMISOS_CACHE_MAX
+)
+
+
+@en_hilo_db
+def _cargar_contexto_db(usuario_id: int, proyecto_id: int) -> ContextoPermisos:
+    """Dueño, rol y TODOS los permisos del usuario en el proyecto, en una consulta."""
+    with conexion_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute(
+            """
+            SELECT
+                p.usuario_id AS propietario_id,
+                r.nombre_rol AS rol_nombre,
+                per.nombre_permiso
+            FROM proyectos p
+            -- Unimos con la tabla de asignación de usuarios
+            LEFT JOIN proyecto_usuarios pu ON p.id = pu.proyecto_id AND pu.usuario_id = %s
+            -- Unimos con roles y permisos para ver qué puede hacer ese rol
+            LEFT JOIN roles r ON pu.rol_id = r.id
+            LEFT JOIN rol_permisos rp ON r.id = rp.rol_id
+            LEFT JOIN permisos per ON rp.permiso_id = per.id
+            WHERE p.id = %s
+            """,
+            (usuario_id, proyecto_id)
+        )
+        rows = cursor.fetchall()
+
+    if not rows:
+        return ContextoPermisos(False, False, None, frozenset())
+
+    return ContextoPermisos(
+        existe=True,
+        es_propietario=rows[0]['propietario_id'] == usuario_id,
+        rol_nombre=rows[0]['rol_nombre'],
+        permisos=frozenset(row['nombre_permiso'] for row in rows if row['nombre_permiso'])
+    )
+
+
+async def obtener_contexto_permisos(usuario_id: int, proyecto_id: int) -> ContextoPermisos:
+    contexto = cache_permisos.contexto(usuario_id, proyecto_id)
+    if contexto is None:
+        contexto = await _cargar_contexto_db(usuario_id, proyecto_id)
+        cache_permisos.guardar_contexto(usuario_id, proyecto_id, contexto)
+    return contexto
+
 
 # ---------------------------------------------------------
 # 1. EL VERIFICADOR MAESTRO
@@ -9,50 +170,23 @@ async def verificar_permiso_proyecto(usuario_id: int, proyecto_id: int, permiso_
     """
     Verifica si el usuario tiene el 'permiso_requerido' dentro del 'proyecto_id'.
     Revisa si es el Dueño O si tiene un Rol asignado con ese permiso.
+    Con la caché caliente es una búsqueda en memoria, sin ir a MySQL.
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        
-        sql = """
-        SELECT 1
-        FROM proyectos p
-        -- Unimos con la tabla de asignación de usuarios
-        LEFT JOIN proyecto_usuarios pu ON p.id = pu.proyecto_id AND pu.usuario_id = %s
-        -- Unimos con roles y permisos para ver qué puede hacer ese rol
-        LEFT JOIN roles r ON pu.rol_id = r.id
-        LEFT JOIN rol_permisos rp ON r.id = rp.rol_id
-        LEFT JOIN permisos per ON rp.permiso_id = per.id
-        WHERE p.id = %s
-          AND (
-            p.usuario_id = %s       
-            OR
-            per.nombre_permiso = %s     
-            OR 
-            per.nombre_permiso = 'GESTION_USUARIOS_SISTEMA' 
-          )
-        LIMIT 1;
-        """
-        
-        cursor.execute(sql, (usuario_id, proyecto_id, usuario_id, permiso_requerido))
-        resultado = cursor.fetchone()
-        
-        if not resultado:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Acceso denegado. Se requiere el permiso: '{permiso_requerido}' en este proyecto."
-            )
-            
-        return True # Pase concedido
-
+        contexto = await obtener_contexto_permisos(usuario_id, proyecto_id)
     except HTTPException as he:
         raise he
     except Exception as e:
         print(f"Error verificando permisos: {e}")
         raise HTTPException(status_code=500, detail="Error interno validando permisos.")
-    finally:
-        if conn: conn.close()
+
+    if not contexto.permite(permiso_requerido):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Acceso denegado. Se requiere el permiso: '{permiso_requerido}' en este proyecto."
+        )
+
+    return True # Pase concedido
 
 
 async def obtener_rol_usuario_en_proyecto(usuario_id: int, proyecto_id: int):
@@ -62,51 +196,30 @@ async def obtener_rol_usuario_en_proyecto(usuario_id: int, proyecto_id: int):
     - COLABORADOR / OBSERVADOR según proyecto_usuarios
     - None si no tiene rol (pero sí podría ser PROPIETARIO)
     """
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-
-        sql = """
-        SELECT 
-            p.usuario_id AS propietario_id,
-            r.nombre_rol AS rol_nombre
-        FROM proyectos p
-        LEFT JOIN proyecto_usuarios pu ON p.id = pu.proyecto_id AND pu.usuario_id = %s
-        LEFT JOIN roles r ON pu.rol_id = r.id
-        WHERE p.id = %s
-        """
-
-
-        cursor.execute(sql, (usuario_id, proyecto_id))
-        data = cursor.fetchone()
-
-        if not data:
-            return None
+    contexto = await obtener_contexto_permisos(usuario_id, proyecto_id)
 
-        # Dueño del proyecto
-        if data["propietario_id"] == usuario_id:
-            return "PROPIETARIO"
+    if not contexto.existe:
+        return None
 
-        # Si es colaborador / observador
-        return data["rol_nombre"]
+    # Dueño del proyecto
+    if contexto.es_propietario:
+        return "PROPIETARIO"
 
-    finally:
-        if conn:
-            conn.close()
+    # Si es colaborador / observador
+    return contexto.rol_nombre
 
 # ---------------------------------------------------------
 # 2. AYUDANTES PARA RESOLVER PROYECTO_ID
 # (Necesarios para endpoints de eliminar/editar sensor o dispositivo)
+# El ancestro de un dispositivo/sensor/campo no cambia: se cachea hasta que se borra.
 # ---------------------------------------------------------
 
-async def obtener_proyecto_id_desde_dispositivo(dispositivo_id: int) -> int:
-    conn = get_db_connection()
-    #  Aseguramos que usamos DictCursor para consistencia
-    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+@en_hilo_db
+def _proyecto_id_desde_dispositivo_db(dispositivo_id: int) -> int:
+    #  conexion_db() devuelve la conexión al pool aunque la consulta falle
+    with conexion_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
         cursor.execute("SELECT proyecto_id FROM dispositivos WHERE id = %s", (dispositivo_id,))
         row = cursor.fetchone()
-    conn.close()
     
     if not row: 
         raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
@@ -114,9 +227,9 @@ async def obtener_proyecto_id_desde_dispositivo(dispositivo_id: int) -> int:
     #  ACCESO POR CLAVE (Correcto para DictCursor)
     return row['proyecto_id']
 
-async def obtener_proyecto_id_desde_sensor(sensor_id: int) -> int:
-    conn = get_db_connection()
-    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+@en_hilo_db
+def _proyecto_id_desde_sensor_db(sensor_id: int) -> int:
+    with conexion_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
         cursor.execute("""
             SELECT d.proyecto_id 
             FROM sensores s 
@@ -124,7 +237,6 @@ async def obtener_proyecto_id_desde_sensor(sensor_id: int) -> int:
             WHERE s.id = %s
         """, (sensor_id,))
         row = cursor.fetchone()
-    conn.close()
     
     if not row: 
         raise HTTPException(status_code=404, detail="Sensor no encontrado")
@@ -132,9 +244,9 @@ async def obtener_proyecto_id_desde_sensor(sensor_id: int) -> int:
     return row['proyecto_id']
 
 #  Corrección 3: Campos
-async def obtener_proyecto_id_desde_campo(campo_id: int) -> int:
-    conn = get_db_connection()
-    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+@en_hilo_db
+def _proyecto_id_desde_campo_db(campo_id: int) -> int:
+    with conexion_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
         cursor.execute("""
             SELECT d.proyecto_id 
             FROM campos_sensores cs
@@ -143,9 +255,27 @@ async def obtener_proyecto_id_desde_campo(campo_id: int) -> int:
             WHERE cs.id = %s
         """, (campo_id,))
         row = cursor.fetchone()
-    conn.close()
     
     if not row: 
         raise HTTPException(status_code=404, detail="Campo no encontrado")
     
-    return row['proyecto_id']
\ No newline at end of file
+    return row['proyecto_id']
+
+
+async def _proyecto_id_cacheado(tipo: str, id: int, cargar) -> int:
+    proyecto_id = cache_permisos.proyecto_de(tipo, id)
+    if proyecto_id is None:
+        # El 404 no se cachea: el recurso puede crearse después
+        proyecto_id = await cargar(id)
+        cache_permisos.guardar_proyecto_de(tipo, id, proyecto_id)
+    return proyecto_id
+
+
+async def obtener_proyecto_id_desde_dispositivo(dispositivo_id: int) -> int:
+    return await _proyecto_id_cacheado("dispositivo", dispositivo_id, _proyecto_id_desde_dispositivo_db)
+
+async def obtener_proyecto_id_desde_sensor(sensor_id: int) -> int:
+    return await _proyecto_id_cacheado("sensor", sensor_id, _proyecto_id_desde_sensor_db)
+
+async def obtener_proyecto_id_desde_campo(campo_id: int) -> int:
+    return await _proyecto_id_cacheado("campo", campo_id, _proyecto_id_desde_campo_db)
@@ -4,104 +4,255 @@
 from fastapi import HTTPException
 from datetime import datetime
 import pymysql
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
 # Importa los modelos y la conexión
 from app.api.modelos.recepcion_datos import PayloadDispositivo
 from app.servicios.servicio_simulacion import get_db_connection
+from app.db.ejecutor_db import ejecutar_db
+from app.configuracion import configuracion
+from app.servicios.servicio_ingesta import (
+    indice_campos,
+    parsear_fecha_paquete,
+    resolver_valores_paquete,
+    insertar_valores_lote,
+    campos_inexistentes,
+    es_error_clave_duplicada,
+    clave_paquete,
+    paquetes_recientes,
+    filtrar_paquetes_nuevos,
+    registrar_paquetes
+)
+from app.servicios.servicio_detector_anomalias import detector_anomalias
+from app.servicios.servicio_ultimos_valores import cache_ultimos_valores
+from app.servicios.servicio_tiempo_real import central_tiempo_real
 
 async def procesar_datos_dispositivo_db(datos: PayloadDispositivo) -> Dict[str, Any]:
     """
-    Procesa un payload de datos de dispositivo, busca los IDs de campo
-    y guarda los valores en la base de datos de forma transaccional.
+    Procesa un payload de datos de dispositivo, resuelve los IDs de campo
+    desde el índice en memoria y guarda todos los valores del paquete
+    con un solo INSERT multi-fila dentro de una transacción.
+    Los reintentos de un paquete ya guardado se responden sin insertar nada.
     """
+    # 1. Validar IDs principales (convertir de string a int)
+    try:
+        dispositivo_id, fecha_hora_lectura = validar_paquete(datos)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Proyecto ID o Dispositivo ID inválidos.")
+
+    # 2. Reintento reciente: se contesta sin tocar MySQL
+    if configuracion.INGESTA_DEDUP and paquetes_recientes.contiene(clave_paquete(datos, dispositivo_id, fecha_hora_lectura)):
+        return _respuesta_duplicado(datos)
+
+    # 3. Guardar (fecha_hora_registro = momento en que el servidor recibe el dato)
+    try:
+        _, procesados_count, errores_count, duplicado = (await ejecutar_db(
+            guardar_paquetes_validados,
+            [(datos, dispositivo_id, fecha_hora_lectura, datetime.utcnow())]
+        ))[0]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno procesando datos: {str(e)}")
+
+    if duplicado:
+        return _respuesta_duplicado(datos)
+
+    return {
+        "status": "success", 
+        "paquete_id": datos.id_paquete, 
+        "registros_procesados": procesados_count, 
+        "registros_con_error": errores_count
+    }
+
+
+def _respuesta_duplicado(datos: PayloadDispositivo) -> Dict[str, Any]:
+    # 200 y no error: el dispositivo debe dar el paquete por entregado y dejar de reintentar
+    return {
+        "status": "duplicate",
+        "paquete_id": datos.id_paquete,
+        "registros_procesados": 0,
+        "registros_con_error": 0
+    }
+
+
+# -----------------------------------------------------------------------------
+# INGESTA EN LOTE (/guardar_json/lote/)
+# -----------------------------------------------------------------------------
+def _total_valores(datos: PayloadDispositivo) -> int:
+    return sum(len(sensor.datos) for sensor in datos.sensores)
+
+
+def validar_paquete(datos: PayloadDispositivo) -> Tuple[int, datetime]:
+    """Valida IDs y fecha del paquete. Lanza ValueError si algo no es convertible."""
+    int(datos.proyecto)
+    dispositivo_id = int(datos.dispositivo)
+    return dispositivo_id, parsear_fecha_paquete(datos)
+
+
+def guardar_paquetes_validados(
+    validos: List[Tuple[PayloadDispositivo, int, datetime, datetime]]
+) -> List[Tuple[PayloadDispositivo, int, int, bool]]:
+    """
+    Escritura síncrona compartida por la ruta directa, el endpoint de lote y la cola.
+    Recibe tuplas (datos, dispositivo_id, fecha_hora_lectura, fecha_hora_registro),
+    descarta los paquetes ya recibidos, inserta en bloques de
+    INGESTA_LOTE_TAMANO_CHUNK filas y hace UN solo commit.
+    Devuelve (datos, aceptados, con_error, duplicado) por paquete.
+    """
+    if not validos:
+        return []
+
+    deduplicar = configuracion.INGESTA_DEDUP
+    claves = [clave_paquete(datos, dispositivo_id, fecha_hora_lectura) for datos, dispositivo_id, fecha_hora_lectura, _ in validos]
+
     conn = None
-    procesados_count = 0
-    errores_count = 0
-    
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor) 
-
-        # 1. Validar IDs principales (convertir de string a int)
-        try:
-            proyecto_id = int(datos.proyecto)
-            dispositivo_id = int(datos.dispositivo)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Proyecto ID o Dispositivo ID inválidos.")
-
-        # 2. Preparar las fechas
-        # Esta es la fecha/hora en que el servidor recibe el dato
-        fecha_hora_registro = datetime.utcnow()  # ✅ CORREGIDO: fecha_hora_registro
-        
-        # Esta es la fecha/hora que el dispositivo reporta (fecha_hora_lectura)
-        fecha_hora_dispositivo_str = f"{datos.fecha} {datos.hora}"
-        fecha_hora_lectura = datetime.strptime(fecha_hora_dispositivo_str, "%Y-%m-%d %H:%M:%S")  # ✅ CORREGIDO: fecha_hora_lectura
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        tamano_chunk = max(1, configuracion.INGESTA_LOTE_TAMANO_CHUNK)
 
-        # 3. Iterar sobre Sensores y Campos
-        for sensor in datos.sensores:
-            sensor_nombre = sensor.nombre.strip()
-            
-            # 3a. Encontrar el Sensor ID (basado en el nombre y el dispositivo padre)
-            cursor.execute(
-                "SELECT id FROM sensores WHERE nombre = %s AND dispositivo_id = %s",
-                (sensor_nombre, dispositivo_id)
-            )
-            sensor_row = cursor.fetchone()
-            
-            if not sensor_row:
-                errores_count += len(sensor.datos)
-                print(f"Error: Sensor '{sensor_nombre}' no encontrado en Dispositivo ID {dispositivo_id}.")
-                continue
+        for intento in (1, 2):
+            # El registro en paquetes_recibidos va en el mismo try que los valores:
+            # un 1062 ahí también hace rollback y reintento
+            try:
+                # 1. Separar reintentos: primero la caché, luego la tabla paquetes_recibidos
+                if deduplicar:
+                    candidatas = [clave for clave in claves if not paquetes_recientes.contiene(clave)]
+                    nuevas = set(filtrar_paquetes_nuevos(cursor, candidatas))
+                else:
+                    nuevas = set(claves)
+                pendientes = set(nuevas)
 
-            sensor_id = sensor_row['id']
+                # 2. Resolver campos de los paquetes nuevos (una consulta por dispositivo no cacheado)
+                filas_por_paquete = []
+                conteos = []
+                for (datos, dispositivo_id, fecha_hora_lectura, fecha_hora_registro), clave in zip(validos, claves):
+                    if deduplicar:
+                        if clave not in pendientes:
+                            conteos.append((datos, 0, 0, True))
+                            continue
+                        # Un mismo paquete repetido dentro del lote solo se guarda una vez
+                        pendientes.discard(clave)
+                    mapa = indice_campos.obtener_mapa(cursor, dispositivo_id)
+                    filas, errores = resolver_valores_paquete(datos, mapa, fecha_hora_lectura, fecha_hora_registro)
+                    filas_por_paquete.append((len(conteos), filas))
+                    conteos.append((datos, len(filas), errores, False))
 
-            # 3b. Iterar sobre los datos (ej: "Temperatura": 26.3)
-            for campo_nombre, valor in sensor.datos.items():
-                
-                # 3c. Encontrar el Campo ID (basado en el nombre y el sensor padre)
-                cursor.execute(
-                    "SELECT id FROM campos_sensores WHERE nombre = %s AND sensor_id = %s",
-                    (campo_nombre, sensor_id)
-                )
-                campo_row = cursor.fetchone()
-                
-                if not campo_row:
-                    errores_count += 1
-                    print(f"Error: Campo '{campo_nombre}' no encontrado en Sensor ID {sensor_id}.")
+                # 3. 'valores' no tiene FOREIGN KEY: los campos se comprueban aquí, dentro de la transacción
+                faltantes = campos_inexistentes(cursor, {fila[3] for _, filas in filas_por_paquete for fila in filas})
+                if faltantes and intento == 1:
+                    # El índice tenía un campo que ya fue borrado: recargamos y reintentamos una vez
+                    conn.rollback()
+                    for dispositivo_id in {v[1] for v in validos}:
+                        indice_campos.invalidar_dispositivo(dispositivo_id)
                     continue
-                
-                campo_id = campo_row['id']
-                
-                # 3d. Insertar el valor en la tabla 'valores' (✅ COLUMNAS CORREGIDAS)
-                cursor.execute(
-                    """
-                    INSERT INTO valores (valor, fecha_hora_lectura, fecha_hora_registro, campo_id) 
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (str(valor), fecha_hora_lectura, fecha_hora_registro, campo_id)  # ✅ CORREGIDO
-                )
-                procesados_count += 1
-        
-        # 4. Confirmar la transacción
-        conn.commit() 
-        
-        return {
-            "status": "success", 
-            "paquete_id": datos.id_paquete, 
-            "registros_procesados": procesados_count, 
-            "registros_con_error": errores_count
-        }
 
-    except Exception as e:
-        if conn: 
+                filas_totales = []
+                for posicion, filas in filas_por_paquete:
+                    if faltantes:
+                        # Con el índice recargado no debería quedar ninguno; si queda, cuenta como error
+                        validas = [fila for fila in filas if fila[3] not in faltantes]
+                        datos, _, errores, duplicado = conteos[posicion]
+                        conteos[posicion] = (datos, len(validas), errores + len(filas) - len(validas), duplicado)
+                        filas = validas
+                    filas_totales.extend(filas)
+
+                # 4. Solo cuenta como recibido un paquete con alguna fila guardada: uno rechazado
+                #    entero (p. ej. campos aún no creados) se acepta si el dispositivo lo reenvía
+                guardadas = {clave for clave, (_, aceptados, _, duplicado) in zip(claves, conteos) if aceptados and not duplicado}
+                if deduplicar:
+                    registrar_paquetes(cursor, [clave for clave in claves if clave in guardadas])
+
+                # 5. Insertar en bloques dentro de la MISMA transacción
+                for inicio in range(0, len(filas_totales), tamano_chunk):
+                    insertar_valores_lote(cursor, filas_totales[inicio:inicio + tamano_chunk])
+                conn.commit()
+            except pymysql.err.IntegrityError as e:
+                conn.rollback()
+                # 1062 (en paquetes_recibidos o en valores): otro proceso registró el mismo
+                # paquete a la vez; al reintentar sale como duplicado
+                if intento == 2 or not es_error_clave_duplicada(e):
+                    raise
+                continue
+
+            if deduplicar:
+                paquetes_recientes.registrar([clave for clave in claves if clave in guardadas or clave not in nuevas])
+            # Los valores ya confirmados actualizan el estado del detector en memoria
+            detector_anomalias.observar_filas(filas_totales)
+            cache_ultimos_valores.observar_filas(filas_totales)
+            # Después del detector: los eventos salen con sus flags de anomalía
+            central_tiempo_real.publicar_filas(filas_totales)
+            return conteos
+        return []
+
+    except Exception:
+        if conn:
             conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Error interno procesando datos: {str(e)}")
+        raise
     finally:
-        if conn: 
+        if conn:
             conn.close()
 
 
+async def procesar_lote_dispositivos_db(
+    paquetes: List[PayloadDispositivo],
+    rechazados_previos: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Guarda muchos paquetes en una sola transacción.
+    Los valores se insertan en INSERT multi-fila de INGESTA_LOTE_TAMANO_CHUNK filas.
+    Devuelve los conteos aceptados/rechazados por id_paquete.
+    """
+    resultados: Dict[str, Dict[str, Any]] = {}
+
+    def registrar(clave: str, dispositivo: Any, aceptados: int, rechazados: int, error: Optional[str] = None):
+        # Si dos paquetes comparten id_paquete se acumulan sus conteos
+        entrada = resultados.setdefault(clave, {"dispositivo": dispositivo, "aceptados": 0, "rechazados": 0})
+        entrada["aceptados"] += aceptados
+        entrada["rechazados"] += rechazados
+        if error:
+            entrada["error"] = error
+        return entrada
+
+    # Paquetes que ya fallaron la validación Pydantic en la ruta
+    for rechazado in rechazados_previos or []:
+        registrar(rechazado["clave"], rechazado.get("dispositivo"), 0, rechazado.get("valores", 0), rechazado["error"])
+
+    # 1. Validación de IDs y fechas en una sola pasada
+    fecha_hora_registro = datetime.utcnow()
+    validos = []
+    for datos in paquetes:
+        try:
+            dispositivo_id, fecha_hora_lectura = validar_paquete(datos)
+        except ValueError as e:
+            registrar(str(datos.id_paquete), datos.dispositivo, 0, _total_valores(datos), f"Paquete inválido: {e}")
+            continue
+        validos.append((datos, dispositivo_id, fecha_hora_lectura, fecha_hora_registro))
+
+    # 2. Escritura transaccional
+    try:
+        conteos = await ejecutar_db(guardar_paquetes_validados, validos)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno procesando lote: {str(e)}")
+
+    duplicados = 0
+    for datos, aceptados, errores, duplicado in conteos:
+        entrada = registrar(str(datos.id_paquete), datos.dispositivo, aceptados, errores)
+        if duplicado:
+            entrada["duplicado"] = True
+            duplicados += 1
+
+    total_aceptados = sum(r["aceptados"] for r in resultados.values())
+    total_rechazados = sum(r["rechazados"] for r in resultados.values())
+    return {
+        "status": "success",
+        "paquetes_recibidos": len(paquetes) + len(rechazados_previos or []),
+        "paquetes_con_error": sum(1 for r in resultados.values() if r["rechazados"] > 0),
+        "paquetes_duplicados": duplicados,
+        "registros_procesados": total_aceptados,
+        "registros_con_error": total_rechazados,
+        "resultados": resultados
+    }
+
 
 
 # from fastapi import HTTPException
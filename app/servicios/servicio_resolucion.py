@@ -0,0 +1,298 @@
+# app/servicios/servicio_resolucion.py
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.configuracion import configuracion
+from app.servicios.servicio_agregacion import PROCESO_HORARIO
+from app.servicios.servicio_archivo_parquet import leer_archivado
+from app.servicios.servicio_rollups import (
+    TABLAS_ROLLUP, expresion_cubeta, piso_cubeta, techo_cubeta, limite_retencion
+)
+
+# -----------------------------------------------------------------------------
+# 1. NIVELES DE RESOLUCIÓN
+# -----------------------------------------------------------------------------
+# nombre -> (segundos por cubeta, tabla pre-agregada que lo sirve o None)
+# "crudo" son las lecturas tal cual. Del más fino al más grueso; cada cubeta
+# contiene un número entero de cubetas del nivel anterior (el mes se aproxima
+# a 30 días solo para elegir nivel).
+NIVELES: Dict[str, Tuple[int, Optional[str]]] = {
+    "crudo": (0, None),
+    "minuto": (60, TABLAS_ROLLUP["minuto"][0]),
+    "15min": (900, TABLAS_ROLLUP["15min"][0]),
+    "hora": (3600, "valores_agregados"),
+    "dia": (86400, TABLAS_ROLLUP["dia"][0]),
+    "mes": (30 * 86400, TABLAS_ROLLUP["mes"][0]),
+}
+
+# Momento de cada fila horaria de valores_agregados
+_MOMENTO_AGREGADOS = "TIMESTAMP(va.fecha, MAKETIME(va.hora, 0, 0))"
+
+
+def es_campo_movimiento(nombre: Optional[str]) -> bool:
+    # Mismo criterio que el modo 'puro': estos campos se grafican como conteo de eventos
+    nombre = (nombre or '').lower()
+    return 'movimiento' in nombre or 'estado' in nombre or 'puerta' in nombre
+
+
+def elegir_nivel(segundos_rango: float, registros_estimados: int, presupuesto: int, es_movimiento: bool) -> str:
+    """El nivel más fino cuyo número de puntos cabe en el presupuesto."""
+    for nivel, (segundos, _) in NIVELES.items():
+        if nivel == "crudo":
+            # Los campos de movimiento nunca se devuelven crudos (0/1 no se leen en una gráfica)
+            if not es_movimiento and registros_estimados <= presupuesto:
+                return nivel
+            continue
+        if min(registros_estimados, segundos_rango / segundos) <= presupuesto:
+            return nivel
+    return list(NIVELES)[-1]
+
+
+# -----------------------------------------------------------------------------
+# 2. PLAN (nivel + tramos con su fuente)
+# -----------------------------------------------------------------------------
+def planificar(cursor, campo_id: int, fecha_inicio: datetime, fecha_fin: datetime, presupuesto: int) -> Dict[str, Any]:
+    """
+    Decide el nivel y de qué tabla sale cada tramo del rango.
+    Cada tabla pre-agregada cubre hasta la última cubeta cerrada que la marca
+    de agua del agregador ya cubre; lo que queda (la cubeta en curso, lo que
+    la retención ya borró o lo anterior a que existiera el nivel) se completa
+    con el nivel más fino siguiente y, en último término, desde 'valores'.
+    """
+    cursor.execute(
+        """
+        SELECT MAX(TIMESTAMP(fecha, MAKETIME(hora, 0, 0))) AS ultima_hora,
+               SUM(total_registros) AS registros
+        FROM valores_agregados
+        WHERE campo_id = %s AND fecha BETWEEN %s AND %s
+        """,
+        (campo_id, fecha_inicio.date(), fecha_fin.date())
+    )
+    cobertura = cursor.fetchone() or {}
+
+    # Ninguna cubeta en curso se toma de agregados: su fila (si existe) está incompleta.
+    # Tampoco las que la agregación incremental aún no cubrió por completo.
+    cursor.execute("SELECT cubierto_hasta FROM agregacion_marcas WHERE proceso = %s", (PROCESO_HORARIO,))
+    marca = cursor.fetchone()
+    limite = min(datetime.now(), marca['cubierto_hasta']) if marca else datetime.now()
+    hora_actual = limite.replace(minute=0, second=0, microsecond=0)
+    corte = fecha_inicio
+    if cobertura.get('ultima_hora'):
+        corte = min(cobertura['ultima_hora'] + timedelta(hours=1), hora_actual, fecha_fin)
+        corte = max(corte, fecha_inicio)
+
+    # Registros crudos (solo para elegir nivel): lo que dicen los agregados
+    # horarios + lo no agregado a ritmo nominal
+    intervalo = max(configuracion.HISTORICO_INTERVALO_NOMINAL_S, 0.001)
+    registros = int(cobertura.get('registros') or 0) if corte > fecha_inicio else 0
+    registros += int((fecha_fin - corte).total_seconds() / intervalo)
+
+    info = _info_campo(cursor, campo_id)
+    es_movimiento = es_campo_movimiento(info.get('nombre_campo'))
+    nivel = elegir_nivel((fecha_fin - fecha_inicio).total_seconds(), registros, presupuesto, es_movimiento)
+
+    tramos = _cubrir(cursor, campo_id, _cadena_niveles(nivel), fecha_inicio, fecha_fin, limite) \
+        if nivel != "crudo" else [{"fuente": "valores", "desde": fecha_inicio, "hasta": fecha_fin}]
+
+    return {
+        "nivel": nivel,
+        "es_movimiento": es_movimiento,
+        "info": info,
+        "registros_estimados": registros,
+        "tramos": tramos,
+    }
+
+
+def _cadena_niveles(nivel: str) -> List[str]:
+    """El nivel y los más finos con tabla, del más grueso al más fino."""
+    nombres = [n for n, (_, tabla) in NIVELES.items() if tabla]
+    return list(reversed(nombres[:nombres.index(nivel) + 1]))
+
+
+def _primera_cubeta(cursor, tabla: str, campo_id: int) -> Optional[datetime]:
+    if tabla == "valores_agregados":
+        cursor.execute(
+            f"SELECT {_MOMENTO_AGREGADOS} AS cubeta FROM valores_agregados va "
+            "WHERE va.campo_id = %s ORDER BY va.fecha, va.hora LIMIT 1",
+            (campo_id,)
+        )
+    else:
+        cursor.execute(f"SELECT MIN(cubeta) AS cubeta FROM {tabla} WHERE campo_id = %s", (campo_id,))
+    fila = cursor.fetchone()
+    return fila['cubeta'] if fila else None
+
+
+def _cubrir(cursor, campo_id: int, cadena: List[str], desde: datetime, hasta: datetime, limite: datetime) -> List[Dict[str, Any]]:
+    """
+    Tramos para [desde, hasta): el nivel más grueso de la cadena sirve lo que
+    tiene completo (cubetas enteras entre su primera fila o su retención y el
+    límite de la marca) y los extremos se delegan al siguiente nivel.
+    """
+    if desde >= hasta:
+        return []
+    if not cadena:
+        return [{"fuente": "valores", "desde": desde, "hasta": hasta}]
+
+    nivel, resto = cadena[0], cadena[1:]
+    tabla = NIVELES[nivel][1]
+    primera = _primera_cubeta(cursor, tabla, campo_id)
+    if primera is None:
+        return _cubrir(cursor, campo_id, resto, desde, hasta, limite)
+    retencion = TABLAS_ROLLUP[nivel][1] if nivel in TABLAS_ROLLUP else configuracion.AGREGADOS_RETENCION_HORA_DIAS
+    inicio_tabla = max(primera, techo_cubeta(nivel, limite_retencion(retencion) or primera))
+
+    a = max(desde, inicio_tabla)
+    b = min(hasta, piso_cubeta(nivel, limite))
+    if a >= b:
+        return _cubrir(cursor, campo_id, resto, desde, hasta, limite)
+    return (
+        _cubrir(cursor, campo_id, resto, desde, a, limite)
+        + [{"fuente": tabla, "nivel_fuente": nivel, "desde": a, "hasta": b}]
+        + _cubrir(cursor, campo_id, resto, b, hasta, limite)
+    )
+
+
+def describir_plan(plan: Dict[str, Any]) -> str:
+    """Resumen para la cabecera de respuesta, p.ej. 'dia:valores_rollup_1d,dia:valores_agregados,dia:valores'."""
+    return ",".join(f"{plan['nivel']}:{tramo['fuente']}" for tramo in plan['tramos'])
+
+
+# -----------------------------------------------------------------------------
+# 3. EJECUCIÓN
+# -----------------------------------------------------------------------------
+def _info_campo(cursor, campo_id: int) -> Dict[str, Any]:
+    cursor.execute(
+        """
+        SELECT cs.nombre AS nombre_campo, um.magnitud_tipo, um.simbolo AS simbolo_unidad
+        FROM campos_sensores cs
+        LEFT JOIN unidades_medida um ON cs.unidad_medida_id = um.id
+        WHERE cs.id = %s
+        """,
+        (campo_id,)
+    )
+    return cursor.fetchone() or {}
+
+
+def _cubetas_valores(cursor, campo_id: int, nivel: str, desde: datetime, hasta: datetime, incluir_fin: bool) -> List[Dict[str, Any]]:
+    operador_fin = "<=" if incluir_fin else "<"
+    cursor.execute(
+        f"""
+        SELECT {expresion_cubeta(nivel, "v.fecha_hora_lectura")} AS cubeta,
+               SUM(v.valor) AS suma, COUNT(*) AS conteo
+        FROM valores v
+        WHERE v.campo_id = %s
+          AND v.fecha_hora_lectura >= %s AND v.fecha_hora_lectura {operador_fin} %s
+        GROUP BY cubeta
+        ORDER BY cubeta ASC
+        """,
+        (campo_id, desde, hasta)
+    )
+    filas = cursor.fetchall()
+
+    # Los bordes pueden caer en días ya archivados en Parquet (fuera de 'valores')
+    archivadas = leer_archivado(cursor, campo_id, desde, hasta)
+    if not incluir_fin:
+        archivadas = [fila for fila in archivadas if fila['fecha_hora_lectura'] < hasta]
+    if not archivadas:
+        return filas
+    cubetas: Dict[datetime, Dict[str, Any]] = {fila['cubeta']: dict(fila) for fila in filas if fila['cubeta'] is not None}
+    for fila in archivadas:
+        cubeta = piso_cubeta(nivel, fila['fecha_hora_lectura'])
+        acumulada = cubetas.setdefault(cubeta, {"cubeta": cubeta, "suma": 0.0, "conteo": 0})
+        acumulada['suma'] = float(acumulada['suma'] or 0) + fila['valor']
+        acumulada['conteo'] = int(acumulada['conteo'] or 0) + 1
+    return [cubetas[cubeta] for cubeta in sorted(cubetas)]
+
+
+def _cubetas_agregados(cursor, campo_id: int, nivel: str, desde: datetime, hasta: datetime) -> List[Dict[str, Any]]:
+    # Filas antiguas de valores_agregados pueden no tener valor_sum: se reconstruye desde el promedio
+    hora_desde = piso_cubeta("hora", desde)
+    cursor.execute(
+        f"""
+        SELECT {expresion_cubeta(nivel, _MOMENTO_AGREGADOS)} AS cubeta,
+               SUM(COALESCE(va.valor_sum, va.valor_avg * va.total_registros)) AS suma,
+               SUM(va.total_registros) AS conteo
+        FROM valores_agregados va
+        WHERE va.campo_id = %s
+          AND va.fecha BETWEEN %s AND %s
+          AND {_MOMENTO_AGREGADOS} >= %s
+          AND {_MOMENTO_AGREGADOS} < %s
+        GROUP BY cubeta
+        ORDER BY cubeta ASC
+        """,
+        (campo_id, hora_desde.date(), hasta.date(), hora_desde, hasta)
+    )
+    return cursor.fetchall()
+
+
+def _cubetas_rollup(cursor, campo_id: int, nivel: str, tramo: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Rango sobre la PK (campo_id, cubeta); la primera cubeta del tramo se incluye entera.
+    # GROUP BY por expresión: ahí 'cubeta' sería la columna de la tabla, no el alias
+    expresion = expresion_cubeta(nivel, "r.cubeta")
+    cursor.execute(
+        f"""
+        SELECT {expresion} AS cubeta,
+               SUM(r.valor_sum) AS suma, SUM(r.total_registros) AS conteo
+        FROM {tramo['fuente']} r
+        WHERE r.campo_id = %s AND r.cubeta >= %s AND r.cubeta < %s
+        GROUP BY {expresion}
+        ORDER BY cubeta ASC
+        """,
+        (campo_id, piso_cubeta(tramo['nivel_fuente'], tramo['desde']), tramo['hasta'])
+    )
+    return cursor.fetchall()
+
+
+def ejecutar_plan(cursor, campo_id: int, plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    info = plan['info']
+    nivel = plan['nivel']
+    tramos = plan['tramos']
+
+    if nivel == "crudo":
+        tramo = tramos[0]
+        cursor.execute(
+            """
+            SELECT v.valor, v.fecha_hora_lectura
+            FROM valores v
+            WHERE v.campo_id = %s AND v.fecha_hora_lectura BETWEEN %s AND %s
+            ORDER BY v.fecha_hora_lectura ASC
+            """,
+            (campo_id, tramo['desde'], tramo['hasta'])
+        )
+        filas = cursor.fetchall()
+        archivadas = leer_archivado(cursor, campo_id, tramo['desde'], tramo['hasta'])
+        if archivadas:
+            filas = sorted(list(filas) + archivadas, key=lambda fila: fila['fecha_hora_lectura'])
+        return [dict(row, **info) for row in filas]
+
+    # Cubetas de varios tramos con la misma fecha (p.ej. el día de hoy en nivel 'dia') se suman
+    cubetas: Dict[datetime, List[float]] = {}
+    for i, tramo in enumerate(tramos):
+        if tramo['fuente'] == "valores":
+            filas = _cubetas_valores(cursor, campo_id, nivel, tramo['desde'], tramo['hasta'], incluir_fin=(i == len(tramos) - 1))
+        elif tramo['fuente'] == "valores_agregados":
+            filas = _cubetas_agregados(cursor, campo_id, nivel, tramo['desde'], tramo['hasta'])
+        else:
+            filas = _cubetas_rollup(cursor, campo_id, nivel, tramo)
+        for fila in filas:
+            if fila['cubeta'] is None or not fila['conteo']:
+                continue
+            acumulado = cubetas.setdefault(fila['cubeta'], [0.0, 0])
+            acumulado[0] += float(fila['suma'] or 0)
+            acumulado[1] += int(fila['conteo'])
+
+    # 'valores' y los agregados horarios se cortan justo en los bordes del rango: la cubeta
+    # que empieza antes de 'desde' o termina después de 'hasta' sale incompleta y se marca
+    # (una suma parcial no es comparable con las completas). Los rollups sirven cubetas enteras.
+    corta_inicio = tramos[0]['desde'] if tramos[0]['fuente'] in ("valores", "valores_agregados") else None
+    corta_fin = tramos[-1]['hasta'] if tramos[-1]['fuente'] in ("valores", "valores_agregados") else None
+
+    resultado = []
+    for cubeta in sorted(cubetas):
+        suma, conteo = cubetas[cubeta]
+        valor = suma if plan['es_movimiento'] else suma / conteo
+        parcial = (corta_inicio is not None and cubeta < corta_inicio) or \
+            (corta_fin is not None and techo_cubeta(nivel, cubeta + timedelta(seconds=1)) > corta_fin)
+        resultado.append(dict(info, valor=valor, fecha_hora_lectura=cubeta, parcial=parcial))
+    return resultado
@@ -0,0 +1,242 @@
+# app/servicios/servicio_rollups.py
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from app.configuracion import configuracion
+
+# -----------------------------------------------------------------------------
+# 1. NIVELES PRE-AGREGADOS
+# -----------------------------------------------------------------------------
+# nivel -> (tabla, días de retención; 0 = sin límite). Del más fino al más grueso.
+# La hora vive en valores_agregados (fecha + hora) y la mantiene servicio_agregacion;
+# el resto son tablas valores_rollup_* con la misma forma (campo_id, cubeta).
+TABLAS_ROLLUP: Dict[str, Tuple[str, int]] = {
+    "minuto": ("valores_rollup_1m", configuracion.ROLLUP_RETENCION_1M_DIAS),
+    "15min": ("valores_rollup_15m", configuracion.ROLLUP_RETENCION_15M_DIAS),
+    "dia": ("valores_rollup_1d", configuracion.ROLLUP_RETENCION_1D_DIAS),
+    "mes": ("valores_rollup_1mes", configuracion.ROLLUP_RETENCION_1MES_DIAS),
+}
+
+# Fuente de cada nivel al reconstruir en cascada (el nivel inmediatamente más fino
+# que guarda primero/último; la hora no los tiene, así que el día sale de 15 minutos)
+_FUENTE_CASCADA = {"15min": "minuto", "dia": "15min", "mes": "dia"}
+
+
+def expresion_cubeta(nivel: str, columna: str) -> str:
+    """Inicio de la cubeta del nivel para una columna DATETIME (apta para cursor.execute: % escapado)."""
+    if nivel == "minuto":
+        return f"DATE_SUB({columna}, INTERVAL SECOND({columna}) SECOND)"
+    if nivel == "15min":
+        return f"DATE_SUB({columna}, INTERVAL MOD(MINUTE({columna}), 15) * 60 + SECOND({columna}) SECOND)"
+    if nivel == "hora":
+        return f"DATE_SUB({columna}, INTERVAL MINUTE({columna}) * 60 + SECOND({columna}) SECOND)"
+    if nivel == "dia":
+        return f"CAST(DATE({columna}) AS DATETIME)"
+    if nivel == "mes":
+        return f"CAST(DATE_FORMAT({columna}, '%%Y-%%m-01') AS DATETIME)"
+    raise ValueError(f"Nivel desconocido: {nivel}")
+
+
+def piso_cubeta(nivel: str, momento: datetime) -> datetime:
+    """Lo mismo que expresion_cubeta, en Python."""
+    momento = momento.replace(second=0, microsecond=0)
+    if nivel == "minuto":
+        return momento
+    if nivel == "15min":
+        return momento.replace(minute=momento.minute - momento.minute % 15)
+    if nivel == "hora":
+        return momento.replace(minute=0)
+    if nivel == "dia":
+        return momento.replace(hour=0, minute=0)
+    if nivel == "mes":
+        return momento.replace(day=1, hour=0, minute=0)
+    raise ValueError(f"Nivel desconocido: {nivel}")
+
+
+def techo_cubeta(nivel: str, momento: datetime) -> datetime:
+    piso = piso_cubeta(nivel, momento)
+    if piso == momento:
+        return piso
+    if nivel == "mes":
+        return (piso + timedelta(days=32)).replace(day=1)
+    duracion = {"minuto": 60, "15min": 900, "hora": 3600, "dia": 86400}[nivel]
+    return piso + timedelta(seconds=duracion)
+
+
+def limite_retencion(dias: int, ahora: Optional[datetime] = None) -> Optional[datetime]:
+    """Fecha antes de la cual un nivel ya no tiene datos (None = sin límite)."""
+    if not dias or dias <= 0:
+        return None
+    return (ahora or datetime.now()) - timedelta(days=dias)
+
+
+# -----------------------------------------------------------------------------
+# 2. SQL (todas las tablas rollup comparten columnas)
+# -----------------------------------------------------------------------------
+_COLUMNAS = """(campo_id, cubeta, valor_min, valor_max, valor_avg, valor_sum, total_registros,
+     valor_primero, valor_ultimo, fecha_primero, fecha_ultimo)"""
+
+# Primero/último del grupo con FIRST_VALUE sobre la cubeta (en ambos sentidos
+# para no depender del marco por defecto de LAST_VALUE). Es constante dentro
+# del grupo, así que MIN() solo lo recoge. La cubeta se calcula en la tabla
+# derivada y se agrupa por s.cubeta, sin ambigüedad con columnas de la fuente.
+_SELECT_DESDE_VALORES = """
+SELECT
+    s.campo_id,
+    s.cubeta,
+    MIN(s.valor), MAX(s.valor), AVG(s.valor), SUM(s.valor), COUNT(*),
+    MIN(s.primero), MIN(s.ultimo),
+    MIN(s.fecha_hora_lectura), MAX(s.fecha_hora_lectura)
+FROM (
+    SELECT
+        v.campo_id, {cubeta} AS cubeta, v.valor, v.fecha_hora_lectura,
+        FIRST_VALUE(v.valor) OVER (PARTITION BY v.campo_id, {cubeta}
+                                   ORDER BY v.fecha_hora_lectura ASC, v.id ASC) AS primero,
+        FIRST_VALUE(v.valor) OVER (PARTITION BY v.campo_id, {cubeta}
+                                   ORDER BY v.fecha_hora_lectura DESC, v.id DESC) AS ultimo
+    FROM valores v
+    WHERE {filtro}
+) s
+GROUP BY s.campo_id, s.cubeta
+"""
+
+_SELECT_DESDE_ROLLUP = """
+SELECT
+    s.campo_id,
+    s.cubeta,
+    MIN(s.valor_min), MAX(s.valor_max), SUM(s.valor_sum) / SUM(s.total_registros),
+    SUM(s.valor_sum), SUM(s.total_registros),
+    MIN(s.primero), MIN(s.ultimo),
+    MIN(s.fecha_primero), MAX(s.fecha_ultimo)
+FROM (
+    SELECT
+        r.campo_id, {cubeta} AS cubeta, r.valor_min, r.valor_max, r.valor_sum, r.total_registros,
+        r.fecha_primero, r.fecha_ultimo,
+        FIRST_VALUE(r.valor_primero) OVER (PARTITION BY r.campo_id, {cubeta}
+                                           ORDER BY r.fecha_primero ASC) AS primero,
+        FIRST_VALUE(r.valor_ultimo) OVER (PARTITION BY r.campo_id, {cubeta}
+                                          ORDER BY r.fecha_ultimo DESC) AS ultimo
+    FROM {fuente} r
+    WHERE r.cubeta >= %s AND r.cubeta < %s
+) s
+GROUP BY s.campo_id, s.cubeta
+"""
+
+# Fusión de un delta: acumulados corridos. Las asignaciones se evalúan de
+# izquierda a derecha, así que cada valor_* se decide antes de mover su fecha
+# y valor_avg ya ve la suma y el conteo nuevos.
+_FUSIONAR = """
+ON DUPLICATE KEY UPDATE
+    valor_primero = IF(VALUES(fecha_primero) < {t}.fecha_primero, VALUES(valor_primero), {t}.valor_primero),
+    fecha_primero = LEAST({t}.fecha_primero, VALUES(fecha_primero)),
+    valor_ultimo = IF(VALUES(fecha_ultimo) >= {t}.fecha_ultimo, VALUES(valor_ultimo), {t}.valor_ultimo),
+    fecha_ultimo = GREATEST({t}.fecha_ultimo, VALUES(fecha_ultimo)),
+    valor_min = LEAST({t}.valor_min, VALUES(valor_min)),
+    valor_max = GREATEST({t}.valor_max, VALUES(valor_max)),
+    valor_sum = {t}.valor_sum + VALUES(valor_sum),
+    total_registros = {t}.total_registros + VALUES(total_registros),
+    valor_avg = {t}.valor_sum / {t}.total_registros
+"""
+
+# Reconstrucción: la cubeta se sobrescribe entera
+_SOBRESCRIBIR = """
+ON DUPLICATE KEY UPDATE
+    valor_min = VALUES(valor_min), valor_max = VALUES(valor_max), valor_avg = VALUES(valor_avg),
+    valor_sum = VALUES(valor_sum), total_registros = VALUES(total_registros),
+    valor_primero = VALUES(valor_primero), valor_ultimo = VALUES(valor_ultimo),
+    fecha_primero = VALUES(fecha_primero), fecha_ultimo = VALUES(fecha_ultimo)
+"""
+
+
+# -----------------------------------------------------------------------------
+# 3. MANTENIMIENTO (lo llama servicio_agregacion)
+# -----------------------------------------------------------------------------
+def fusionar_rango_ids(cursor, desde_id: int, hasta_id: int) -> int:
+    """
+    Fusiona las filas nuevas de 'valores' (id en (desde_id, hasta_id]) en
+    todos los niveles. Cada nivel recibe el delta crudo directamente: así un
+    dato tardío cuenta aunque la retención ya haya borrado el nivel fino de
+    ese periodo (una cascada desde ahí reconstruiría la cubeta incompleta).
+    """
+    afectadas = 0
+    for nivel, (tabla, _) in TABLAS_ROLLUP.items():
+        select = _SELECT_DESDE_VALORES.format(
+            cubeta=expresion_cubeta(nivel, "v.fecha_hora_lectura"),
+            filtro="v.id > %s AND v.id <= %s"
+        )
+        afectadas += cursor.execute(
+            f"INSERT INTO {tabla} {_COLUMNAS} {select} {_FUSIONAR.format(t=tabla)}",
+            (desde_id, hasta_id)
+        )
+    return afectadas
+
+
+def reconstruir(cursor, inicio: datetime, fin: datetime, marca_id: int) -> int:
+    """
+    Recalcula [inicio, fin) en cascada: el minuto desde 'valores' (solo filas
+    ya cubiertas por la marca) y cada nivel siguiente desde el anterior, por
+    días para acotar cada sentencia. Un nivel se reconstruye solo en cubetas
+    que su fuente cubre enteras (por retención y por la historia que guarda);
+    una primera cubeta parcial se deja como estaba.
+    """
+    afectadas = 0
+    ahora = datetime.now()
+    for nivel, (tabla, retencion) in TABLAS_ROLLUP.items():
+        fuente = _FUENTE_CASCADA.get(nivel)
+        if fuente is None:
+            desde = max(inicio, limite_retencion(retencion, ahora) or inicio)
+            desde = piso_cubeta(nivel, desde)
+        else:
+            # La fuente puede empezar después de 'inicio' (nivel nuevo, historia
+            # reconstruida solo en parte): la cubeta de 'inicio' solo si la cubre entera
+            cursor.execute(f"SELECT MIN(cubeta) AS primera FROM {TABLAS_ROLLUP[fuente][0]}")
+            cubierto = (cursor.fetchone() or {}).get('primera') or inicio
+            limite_fuente = limite_retencion(TABLAS_ROLLUP[fuente][1], ahora)
+            if limite_fuente is not None:
+                cubierto = max(cubierto, limite_fuente)
+            piso = piso_cubeta(nivel, inicio)
+            desde = piso if cubierto <= piso else techo_cubeta(nivel, max(inicio, cubierto))
+        hasta = techo_cubeta(nivel, fin)
+
+        tramo = desde
+        while tramo < hasta:
+            siguiente = min(hasta, tramo + timedelta(days=1)) if nivel != "mes" else hasta
+            if fuente is None:
+                select = _SELECT_DESDE_VALORES.format(
+                    cubeta=expresion_cubeta(nivel, "v.fecha_hora_lectura"),
+                    filtro="v.fecha_hora_lectura >= %s AND v.fecha_hora_lectura < %s AND v.id <= %s"
+                )
+                params = (tramo, siguiente, marca_id)
+            else:
+                select = _SELECT_DESDE_ROLLUP.format(
+                    cubeta=expresion_cubeta(nivel, "r.cubeta"),
+                    fuente=TABLAS_ROLLUP[fuente][0]
+                )
+                params = (tramo, siguiente)
+            afectadas += cursor.execute(f"INSERT INTO {tabla} {_COLUMNAS} {select} {_SOBRESCRIBIR}", params)
+            tramo = siguiente
+    return afectadas
+
+
+def purgar(conn, cursor, lote: int = 10000) -> Dict[str, int]:
+    """Borra lo que excede la retención de cada nivel (incluida la hora), un commit por lote."""
+    borradas: Dict[str, int] = {}
+    ahora = datetime.now()
+    objetivos = [(tabla, "cubeta", limite_retencion(dias, ahora)) for tabla, dias in TABLAS_ROLLUP.values()]
+    limite_hora = limite_retencion(configuracion.AGREGADOS_RETENCION_HORA_DIAS, ahora)
+    objetivos.append(("valores_agregados", "fecha", limite_hora.date() if limite_hora else None))
+
+    for tabla, columna, limite in objetivos:
+        if limite is None:
+            continue
+        total = 0
+        while True:
+            n = cursor.execute(f"DELETE FROM {tabla} WHERE {columna} < %s LIMIT %s", (limite, lote))
+            conn.commit()
+            total += n
+            if n < lote:
+                break
+        if total:
+            borradas[tabla] = total
+    return borradas
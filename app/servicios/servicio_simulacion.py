@@ -4,7 +4,7 @@ import csv
 from datetime import datetime
 from http.client import HTTPException
 import io
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from app.configuracion import configuracion
 import pymysql # type: ignore
@@ -15,18 +15,17 @@ from app.api.modelos.simulacionJson import DatosSimulacionJson, DatoSensor  # mo
 
 # --- Importa la configuración (pero no la función de conexión) ---
 from app.configuracion import configuracion # Solo necesitamos la instancia de configuración
-
-# --- Función de conexión a la base de datos (INTERNA a este módulo) ---
+from app.db.pool_conexiones import obtener_pool
+from app.db.ejecutor_db import en_hilo_db
+from app.servicios.servicio_paginacion import cache_conteos, filtro_after_id, recortar_pagina_cursor
+from app.servicios.servicio_busqueda import condicion_busqueda
+
+# --- Función de conexión a la base de datos ---
+# Presta una conexión del pool compartido (app/db/pool_conexiones.py).
+# conn.close() la devuelve al pool en lugar de cerrar el socket.
 def get_db_connection():
     try:
-        return pymysql.connect(
-           host=configuracion.DB_HOST,
-            user=configuracion.DB_USER,
-            password=configuracion.DB_PASSWORD,
-            database=configuracion.DB_NAME,
-            port=configuracion.DB_PORT,
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        return obtener_pool().obtener()
     except pymysql.Error as e:
         print(f"Error al conectar a la base de datos: {e}")
         raise ConnectionError(f"No se pudo conectar a la base de datos: {e}")
@@ -82,7 +81,8 @@ def get_db_connection():
 
 # --- Funcion para la consulta GET para proyectos por usuario_id
 # --- Funcion para la consulta GET para proyectos por usuario_id
-async def obtener_proyectos_por_usuario(usuario_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_proyectos_por_usuario(usuario_id: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection() 
@@ -124,15 +124,19 @@ async def obtener_proyectos_por_usuario(usuario_id: int) -> List[Dict[str, Any]]
 # -----------------------------------------------------------------------------
 # 1. OBTENER PROYECTOS PAGINADOS (Sin cálculo de rol)
 # -----------------------------------------------------------------------------
-async def obtener_proyectos_paginados_db(
+@en_hilo_db
+def obtener_proyectos_paginados_db(
     usuario_id: int, 
     page: int = 1, 
     limit: int = 10, 
-    search: str = ""
+    search: str = "",
+    after_id: Optional[int] = None
 ) -> Dict[str, Any]:
     
     offset = (page - 1) * limit
-    search_pattern = f"%{search}%"
+    filtro_busqueda, params_busqueda = condicion_busqueda(
+        search, [("p.nombre", "p.descripcion")], ["p.nombre", "p.descripcion"]
+    )
     
     conn = None
     try:
@@ -141,18 +145,50 @@ async def obtener_proyectos_paginados_db(
         
         # Consulta Base: Obtener proyectos donde soy Dueño O Invitado
         # Usamos DISTINCT p.id para evitar duplicados si hubiera multiples roles (aunque la lógica lo evita)
-        sql_base = """
+        sql_base = f"""
         FROM proyectos p
         LEFT JOIN proyecto_usuarios pu ON p.id = pu.proyecto_id
         WHERE (p.usuario_id = %s OR pu.usuario_id = %s)
-          AND (p.nombre LIKE %s OR p.descripcion LIKE %s)
+          {filtro_busqueda}
         """
         
-        # Params: [user, user, search, search]
-        params_count = [usuario_id, usuario_id, search_pattern, search_pattern]
+        # Params: [user, user] + búsqueda (vacía si no hay texto)
+        params_count = [usuario_id, usuario_id] + params_busqueda
+        sql_count = f"SELECT COUNT(DISTINCT p.id) as total {sql_base}"
+        
+        if after_id is not None:
+            # Modo cursor: sin OFFSET ni DISTINCT. Uniendo solo la fila del usuario en
+            # proyecto_usuarios (única por proyecto) no hay duplicados, y MySQL puede
+            # recorrer la PK hacia atrás y detenerse en limit + 1.
+            total_records = cache_conteos.obtener(cursor, ("proyectos", usuario_id, search), sql_count, params_count)
+            filtro_cursor, params_cursor = filtro_after_id("p.id", after_id)
+            cursor.execute(
+                f"""
+                SELECT p.id, p.nombre, p.descripcion, p.tipo_industria, p.usuario_id
+                FROM proyectos p
+                LEFT JOIN proyecto_usuarios pu ON p.id = pu.proyecto_id AND pu.usuario_id = %s
+                WHERE (p.usuario_id = %s OR pu.usuario_id = %s)
+                  {filtro_busqueda}
+                  {filtro_cursor}
+                ORDER BY p.id DESC
+                LIMIT %s
+                """,
+                [usuario_id] + params_count + params_cursor + [limit + 1]
+            )
+            proyectos, next_after_id, has_more = recortar_pagina_cursor(cursor.fetchall(), limit)
+            return {
+                "data": proyectos,
+                "total": total_records,
+                "page": page,
+                "limit": limit,
+                "total_pages": (total_records + limit - 1) // limit if limit > 0 else 0,
+                "after_id": after_id,
+                "next_after_id": next_after_id,
+                "has_more": has_more
+            }
         
         # 1. Obtener Total
-        cursor.execute(f"SELECT COUNT(DISTINCT p.id) as total {sql_base}", params_count)
+        cursor.execute(sql_count, params_count)
         total_records = cursor.fetchone()['total']
         
         # 2. Obtener Datos
@@ -186,7 +222,8 @@ async def obtener_proyectos_paginados_db(
 # -----------------------------------------------------------------------------
 # 2. OBTENER UN PROYECTO POR ID (Datos crudos)
 # -----------------------------------------------------------------------------
-async def obtener_proyecto_por_id_db(proyecto_id: int) -> Dict[str, Any]:
+@en_hilo_db
+def obtener_proyecto_por_id_db(proyecto_id: int) -> Dict[str, Any]:
     """
     Obtiene los datos básicos de un proyecto.
     La validación de permisos y rol se hace en el endpoint.
@@ -211,7 +248,8 @@ async def obtener_proyecto_por_id_db(proyecto_id: int) -> Dict[str, Any]:
 # -----------------------------------------------------------------------------
 # 3. OBTENER TODOS (ADMIN - Mantenido igual pero limpio)
 # -----------------------------------------------------------------------------
-async def obtener_proyectos() -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_proyectos() -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection()
@@ -273,7 +311,8 @@ async def obtener_proyectos() -> List[Dict[str, Any]]:
 #     finally:
 #         if conn:
 #             conn.close()
-async def obtener_proyecto_por_id(proyecto_id: int) -> Dict[str, Any] | None:
+@en_hilo_db
+def obtener_proyecto_por_id(proyecto_id: int) -> Dict[str, Any] | None:
     
     conn = None
     try:
@@ -287,7 +326,8 @@ async def obtener_proyecto_por_id(proyecto_id: int) -> Dict[str, Any] | None:
     finally:
         if conn:
             conn.close()
-async def obtener_dispositivo_por_id(dispositivo_id: int) -> Dict[str, Any] | None:
+@en_hilo_db
+def obtener_dispositivo_por_id(dispositivo_id: int) -> Dict[str, Any] | None:
     conn = None
     try:
         conn = get_db_connection()
@@ -301,7 +341,8 @@ async def obtener_dispositivo_por_id(dispositivo_id: int) -> Dict[str, Any] | No
         if conn:
             conn.close()
 
-async def obtener_dispositivos_por_proyecto(proyecto_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_dispositivos_por_proyecto(proyecto_id: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection() # ¡Cambio aquí!
@@ -317,7 +358,8 @@ async def obtener_dispositivos_por_proyecto(proyecto_id: int) -> List[Dict[str,
         if conn:
             conn.close()
 
-async def obtener_sensores_por_dispositivo(dispositivo_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_sensores_por_dispositivo(dispositivo_id: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection() # ¡Cambio aquí!
@@ -333,7 +375,8 @@ async def obtener_sensores_por_dispositivo(dispositivo_id: int) -> List[Dict[str
         if conn:
             conn.close()
 
-async def obtener_campos_por_sensor(sensor_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_campos_por_sensor(sensor_id: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection() # ¡Cambio aquí!
@@ -376,7 +419,8 @@ async def extract_csv_preview(file_content: bytes) -> Dict[str, Any]:
 # ... (resto de importaciones y funciones) ...
 
 
-async def simular_datos_csv(
+@en_hilo_db(timeout=None)
+def simular_datos_csv(
     file_content: bytes,
     sensor_mappings: List[Dict[str, Any]],
     proyecto_id: int,
@@ -489,7 +533,8 @@ async def simular_datos_csv(
     finally:
         if conn:
             conn.close()
-async def simular_datos_json(datos: DatosSimulacionJson) -> List[Dict[str, Any]]:
+@en_hilo_db(timeout=None)
+def simular_datos_json(datos: DatosSimulacionJson) -> List[Dict[str, Any]]:
     procesado = []
     conn = None
 
@@ -0,0 +1,114 @@
+# app/servicios/servicio_submuestreo.py
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Métodos aceptados por el parámetro `submuestreo` de /valores/historico-campo
+METODOS_SUBMUESTREO = ("lttb", "minmax")
+# Parte de max_puntos que pueden ocupar las anomalías (el resto queda para la forma de la serie)
+FRACCION_ANOMALIAS = 0.25
+
+
+# -----------------------------------------------------------------------------
+# 1. ALGORITMOS (trabajan sobre índices, no copian filas)
+# -----------------------------------------------------------------------------
+def indices_lttb(x: np.ndarray, y: np.ndarray, n_salida: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: conserva el primer y último punto y, en
+    cada cubeta intermedia, el punto que forma el triángulo de mayor área con
+    el punto elegido antes y el promedio de la cubeta siguiente. Mantiene la
+    forma visual de la serie (picos incluidos) con pocos puntos.
+    """
+    n = len(y)
+    if n_salida >= n or n_salida < 3:
+        return np.arange(n)
+
+    # n_salida - 2 cubetas sobre los puntos 1..n-2
+    bordes = np.linspace(1, n - 1, n_salida - 1).astype(np.int64)
+    seleccion = np.empty(n_salida, dtype=np.int64)
+    seleccion[0] = 0
+    seleccion[-1] = n - 1
+
+    a = 0
+    for i in range(n_salida - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        # Promedio de la cubeta siguiente (para la última, el punto final)
+        sig_fin = bordes[i + 2] if i + 2 < len(bordes) else n
+        x_c = x[fin:sig_fin].mean()
+        y_c = y[fin:sig_fin].mean()
+
+        areas = np.abs((x[a] - x_c) * (y[inicio:fin] - y[a]) - (x[a] - x[inicio:fin]) * (y_c - y[a]))
+        a = inicio + int(np.argmax(areas))
+        seleccion[i + 1] = a
+
+    return seleccion
+
+
+def indices_minmax(y: np.ndarray, n_salida: int) -> np.ndarray:
+    """
+    Mínimo y máximo por cubeta (más el primer y último punto). Garantiza que
+    ningún extremo desaparezca de la gráfica; útil para picos de un solo punto.
+    """
+    n = len(y)
+    if n_salida >= n:
+        return np.arange(n)
+    if n_salida < 4:
+        # Sin sitio para cubetas: extremos de la serie y el pico que más se aleja
+        # de la recta entre ellos, hasta n_salida puntos
+        referencia = (y[0] + y[-1]) / 2
+        picos = sorted({int(np.argmin(y)), int(np.argmax(y))} - {0, n - 1}, key=lambda i: -abs(y[i] - referencia))
+        return np.unique(([0, n - 1] + picos)[:max(1, n_salida)])
+
+    cubetas = max(1, (n_salida - 2) // 2)
+    cubeta = (np.arange(n) * cubetas) // n
+    # Orden por (cubeta, valor): el primero de cada cubeta es su mínimo y el último su máximo
+    orden = np.lexsort((y, cubeta))
+    inicios = np.searchsorted(cubeta, np.arange(cubetas))
+    fines = np.append(inicios[1:], n) - 1
+
+    return np.unique(np.concatenate((orden[inicios], orden[fines], [0, n - 1])))
+
+
+# -----------------------------------------------------------------------------
+# 2. REDUCCIÓN DE FILAS DEL HISTÓRICO
+# -----------------------------------------------------------------------------
+def reducir_serie(
+    datos: List[Dict[str, Any]],
+    max_puntos: Optional[int],
+    metodo: str = "lttb"
+) -> List[Dict[str, Any]]:
+    """
+    Reduce las filas del histórico (ordenadas por fecha) a como mucho max_puntos.
+    Las filas marcadas como anomalía tienen reservado hasta FRACCION_ANOMALIAS
+    del presupuesto; si hay más, se conservan las más extremas (min/max por
+    cubeta entre las anomalías) y el resto del presupuesto va a la serie.
+    """
+    n = len(datos) if datos else 0
+    if not max_puntos or n <= max_puntos:
+        return datos
+
+    try:
+        y = np.array([float(r['valor']) for r in datos], dtype=np.float64)
+        # Las consultas devuelven datetime o 'YYYY-MM-DD HH:MM:SS' (agrupación por minuto)
+        x = np.array([r['fecha_hora_lectura'] for r in datos], dtype='datetime64[ms]').astype(np.float64)
+    except (TypeError, ValueError, KeyError) as e:
+        print(f"⚠️ [Submuestreo] Serie no numérica, se devuelve completa: {e}")
+        return datos
+
+    anomalias = np.flatnonzero([bool(r.get('anomalia')) for r in datos])
+    cupo_anomalias = int(max_puntos * FRACCION_ANOMALIAS)
+    if len(anomalias) > cupo_anomalias:
+        anomalias = anomalias[indices_minmax(y[anomalias], cupo_anomalias)] if cupo_anomalias else anomalias[:0]
+    presupuesto = max(max_puntos - len(anomalias), 1)
+
+    # LTTB necesita al menos 3 puntos de salida; por debajo, min/max respeta el presupuesto
+    if metodo == "minmax" or presupuesto < 3:
+        seleccion = indices_minmax(y, presupuesto)
+    else:
+        seleccion = indices_lttb(x, y, presupuesto)
+
+    if len(anomalias):
+        seleccion = np.union1d(seleccion, anomalias)
+
+    return [datos[i] for i in seleccion.tolist()]
@@ -0,0 +1,169 @@
+# app/servicios/servicio_tiempo_real.py
+
+import asyncio
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.configuracion import configuracion
+from app.servicios.servicio_detector_anomalias import detector_anomalias
+
+
+# -----------------------------------------------------------------------------
+# 1. SUSCRIPCIÓN (una por conexión SSE)
+# -----------------------------------------------------------------------------
+class Suscripcion:
+    """
+    Cola acotada de eventos de un cliente. Solo se toca desde el event loop
+    que la creó; la ingesta (hilo de BD) entrega con call_soon_threadsafe.
+    Si la cola se llena el cliente no está leyendo: se le corta en lugar de
+    hacer esperar a la ingesta o acumular memoria.
+    """
+
+    __slots__ = ("campo_ids", "cola", "loop", "activa", "motivo_cierre")
+
+    def __init__(self, campo_ids: Set[int], loop: asyncio.AbstractEventLoop, max_pendientes: int):
+        self.campo_ids = campo_ids
+        self.loop = loop
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_pendientes))
+        self.activa = True
+        self.motivo_cierre: Optional[str] = None
+
+    def _entregar(self, eventos: List[Dict[str, Any]], central: "CentralTiempoReal"):
+        if not self.activa:
+            return
+        try:
+            for evento in eventos:
+                self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            central._descartar(self, "consumidor lento")
+
+    def cerrar(self, motivo: str):
+        """Marca la suscripción como cerrada y despierta al consumidor (None = fin)."""
+        self.activa = False
+        self.motivo_cierre = motivo
+        while not self.cola.empty():
+            self.cola.get_nowait()
+        self.cola.put_nowait(None)
+
+
+# -----------------------------------------------------------------------------
+# 2. CENTRAL PUB/SUB (ingesta -> suscriptores)
+# -----------------------------------------------------------------------------
+class CentralTiempoReal:
+    """
+    Índice campo_id -> suscripciones. La ingesta publica las filas recién
+    confirmadas; cada suscripción recibe, en una sola entrega por lote, los
+    eventos de sus campos con los flags del detector de anomalías.
+    Solo reparte lo que ingiere este proceso.
+    """
+
+    def __init__(self, max_suscripciones: int = 1000, max_pendientes: int = 1000):
+        self.max_suscripciones = max(1, max_suscripciones)
+        self.max_pendientes = max_pendientes
+        self._por_campo: Dict[int, Set[Suscripcion]] = {}
+        self._suscripciones: Set[Suscripcion] = set()
+        self._lock = threading.Lock()
+        self._publicados = 0
+        self._descartadas = 0
+
+    def suscribir(self, campo_ids: Iterable[int]) -> Suscripcion:
+        """Llamar desde el event loop que va a consumir la suscripción."""
+        suscripcion = Suscripcion(set(campo_ids), asyncio.get_running_loop(), self.max_pendientes)
+        with self._lock:
+            if len(self._suscripciones) >= self.max_suscripciones:
+                raise OverflowError("Límite de suscripciones en tiempo real alcanzado")
+            self._suscripciones.add(suscripcion)
+            for campo_id in suscripcion.campo_ids:
+                self._por_campo.setdefault(campo_id, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion):
+        with self._lock:
+            self._quitar(suscripcion)
+
+    def _quitar(self, suscripcion: Suscripcion):
+        self._suscripciones.discard(suscripcion)
+        for campo_id in suscripcion.campo_ids:
+            suscriptores = self._por_campo.get(campo_id)
+            if suscriptores is not None:
+                suscriptores.discard(suscripcion)
+                if not suscriptores:
+                    del self._por_campo[campo_id]
+
+    def _descartar(self, suscripcion: Suscripcion, motivo: str):
+        # Se ejecuta en el loop de la suscripción
+        with self._lock:
+            self._quitar(suscripcion)
+            self._descartadas += 1
+        suscripcion.cerrar(motivo)
+        print(f"⚠️ [TiempoReal] Suscripción cerrada: {motivo}")
+
+    def publicar_filas(self, filas: Iterable[Tuple]):
+        """
+        Filas recién confirmadas en 'valores' (valor, fecha_lectura, fecha_registro, campo_id).
+        Se llama desde el hilo de la ingesta y nunca bloquea: cada entrega es
+        un call_soon_threadsafe al loop del suscriptor.
+        """
+        with self._lock:
+            if not self._por_campo:
+                return
+            destinos: Dict[int, Set[Suscripcion]] = {}
+            seleccion = []
+            for fila in filas:
+                suscriptores = self._por_campo.get(fila[3])
+                if suscriptores:
+                    destinos[fila[3]] = set(suscriptores)
+                    seleccion.append(fila)
+        if not seleccion:
+            return
+
+        # Eventos en orden de lectura; los flags del detector (estado tras este lote)
+        # van en el último valor de cada campo
+        seleccion.sort(key=lambda fila: fila[1])
+        ultimo_por_campo: Dict[int, Dict[str, Any]] = {}
+        eventos_por_suscripcion: Dict[Suscripcion, List[Dict[str, Any]]] = {}
+        for valor, fecha_lectura, _, campo_id in seleccion:
+            try:
+                x = float(valor)
+            except (TypeError, ValueError):
+                continue
+            evento = {
+                "campo_id": campo_id,
+                "valor": x,
+                "fecha_hora_lectura": fecha_lectura.isoformat() if hasattr(fecha_lectura, 'isoformat') else str(fecha_lectura),
+                "anomalia": False,
+                "mensaje_alerta": None,
+            }
+            ultimo_por_campo[campo_id] = evento
+            for suscripcion in destinos[campo_id]:
+                eventos_por_suscripcion.setdefault(suscripcion, []).append(evento)
+
+        for campo_id, evento in ultimo_por_campo.items():
+            resultado = detector_anomalias.evaluar(campo_id)
+            if resultado is not None:
+                evento["anomalia"], evento["mensaje_alerta"] = resultado
+
+        for suscripcion, eventos in eventos_por_suscripcion.items():
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion._entregar, eventos, self)
+            except RuntimeError:
+                # El loop ya se cerró (apagado): se olvida la suscripción
+                self.cancelar(suscripcion)
+        with self._lock:
+            self._publicados += sum(len(e) for e in eventos_por_suscripcion.values())
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "suscripciones": len(self._suscripciones),
+                "campos_suscritos": len(self._por_campo),
+                "eventos_publicados": self._publicados,
+                "suscripciones_descartadas": self._descartadas,
+            }
+
+
+# Instancia global: la alimenta la ingesta y la consumen las rutas /valores/stream
+central_tiempo_real = CentralTiempoReal(
+    max_suscripciones=configuracion.TIEMPO_REAL_MAX_SUSCRIPCIONES,
+    max_pendientes=configuracion.TIEMPO_REAL_MAX_PENDIENTES
+)
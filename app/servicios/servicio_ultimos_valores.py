@@ -0,0 +1,170 @@
+# app/servicios/servicio_ultimos_valores.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.configuracion import configuracion
+
+
+# -----------------------------------------------------------------------------
+# 1. CACHÉ DEL ÚLTIMO VALOR POR CAMPO (alimentada por la ingesta)
+# -----------------------------------------------------------------------------
+class _Entrada:
+    __slots__ = ("datos", "cargado_en", "ultima_ingesta")
+
+    def __init__(self, datos: Dict[str, Any], ahora: float):
+        self.datos = datos
+        self.cargado_en = ahora
+        self.ultima_ingesta: Optional[float] = None
+
+
+class CacheUltimosValores:
+    """
+    campo_id -> fila lista para responder (valor, fecha_hora_lectura, nombre y
+    unidad del campo). La primera lectura de un campo la carga desde BD; a
+    partir de ahí la ingesta de este proceso la mantiene al día sin consultas.
+
+    Si este proceso no ve ingesta del campo en `ttl_sin_ingesta` (otro worker
+    recibe sus datos, o llegan por simulación) la entrada deja de servirse y
+    se recarga, así que nunca está más atrasada que ese margen. `ttl_max`
+    fuerza una recarga periódica para recoger cambios de nombre/unidad.
+    """
+
+    def __init__(self, max_campos: int = 20000, ttl_sin_ingesta: float = 5.0, ttl_max: float = 300.0):
+        self.max_campos = max(1, max_campos)
+        self.ttl_sin_ingesta = ttl_sin_ingesta
+        self.ttl_max = ttl_max
+        self._entradas: "OrderedDict[int, _Entrada]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+        self._observados = 0
+
+    @staticmethod
+    def _normalizar(valor: Any) -> float:
+        # Mismo redondeo que la columna DECIMAL(15,6)
+        return round(float(valor), 6)
+
+    def _vigente(self, entrada: _Entrada, ahora: float) -> bool:
+        if ahora - entrada.cargado_en > self.ttl_max:
+            return False
+        ultima_novedad = max(entrada.cargado_en, entrada.ultima_ingesta or 0.0)
+        return ahora - ultima_novedad <= self.ttl_sin_ingesta
+
+    def obtener(self, campo_id: int) -> Optional[Dict[str, Any]]:
+        """Copia de la fila (el llamador le añade los flags de anomalía) o None si hay que ir a BD."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(campo_id)
+            if entrada is None or not self._vigente(entrada, ahora):
+                self._fallos += 1
+                return None
+            self._entradas.move_to_end(campo_id)
+            self._aciertos += 1
+            return dict(entrada.datos)
+
+    def obtener_varios(self, campo_ids: Iterable[int]) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+        """(encontrados por campo_id, ids que hay que leer de BD)."""
+        encontrados: Dict[int, Dict[str, Any]] = {}
+        faltantes: List[int] = []
+        for campo_id in campo_ids:
+            fila = self.obtener(campo_id)
+            if fila is None:
+                faltantes.append(campo_id)
+            else:
+                encontrados[campo_id] = fila
+        return encontrados, faltantes
+
+    def guardar(self, fila: Dict[str, Any]):
+        """Instala una fila leída de BD (obtener_ultimo_valor_db / obtener_ultimos_valores_db)."""
+        if not fila or fila.get('campo_id') is None or fila.get('valor') is None:
+            return
+        datos = {k: v for k, v in fila.items() if k not in ('anomalia', 'mensaje_alerta')}
+        datos['valor'] = self._normalizar(datos['valor'])
+        ahora = time.monotonic()
+        with self._lock:
+            campo_id = int(datos['campo_id'])
+            self._entradas[campo_id] = _Entrada(datos, ahora)
+            self._entradas.move_to_end(campo_id)
+            while len(self._entradas) > self.max_campos:
+                self._entradas.popitem(last=False)
+
+    def observar_filas(self, filas: Iterable[Tuple]):
+        """
+        Filas recién confirmadas en 'valores' (valor, fecha_lectura, fecha_registro, campo_id).
+        Solo se actualizan campos ya cargados; un paquete atrasado no pisa
+        una lectura más reciente.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            if not self._entradas:
+                return
+            for valor, fecha_lectura, _, campo_id in filas:
+                entrada = self._entradas.get(campo_id)
+                if entrada is None:
+                    continue
+                try:
+                    x = self._normalizar(valor)
+                except (TypeError, ValueError):
+                    continue
+                entrada.ultima_ingesta = ahora
+                fecha_actual = entrada.datos.get('fecha_hora_lectura')
+                if fecha_actual is None or fecha_lectura >= fecha_actual:
+                    entrada.datos['valor'] = x
+                    entrada.datos['fecha_hora_lectura'] = fecha_lectura
+                self._observados += 1
+
+    def invalidar(self, campo_id: Optional[int]):
+        if campo_id is None:
+            return
+        with self._lock:
+            self._entradas.pop(int(campo_id), None)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "campos_en_memoria": len(self._entradas),
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+                "valores_observados": self._observados,
+            }
+
+
+# Instancia global: la alimenta la ingesta y la leen /valores/ultimo y /valores/ultimos
+cache_ultimos_valores = CacheUltimosValores(
+    max_campos=configuracion.ULTIMOS_VALORES_MAX_CACHE,
+    ttl_sin_ingesta=configuracion.ULTIMOS_VALORES_TTL_SIN_INGESTA,
+    ttl_max=configuracion.ULTIMOS_VALORES_TTL_MAX
+)
+
+
+# -----------------------------------------------------------------------------
+# 2. ETAG (If-None-Match -> 304)
+# -----------------------------------------------------------------------------
+def calcular_etag(filas: Iterable[Dict[str, Any]], analisis_activo: bool) -> str:
+    """
+    Se deriva del contenido (campo, fecha de lectura, valor), no de un contador
+    del proceso: dos workers con el mismo dato dan la misma etiqueta.
+    Los flags de anomalía solo cambian cuando llega un valor nuevo, así que
+    basta con distinguir si la respuesta los incluye.
+    """
+    huella = hashlib.blake2b(digest_size=12)
+    huella.update(b"a" if analisis_activo else b"n")
+    for fila in sorted(filas, key=lambda f: f['campo_id']):
+        fecha = fila.get('fecha_hora_lectura')
+        marca = fecha.isoformat() if hasattr(fecha, 'isoformat') else str(fecha)
+        huella.update(f"|{fila['campo_id']}:{marca}:{float(fila['valor']):.6f}".encode())
+    return f'"{huella.hexdigest()}"'
+
+
+def coincide_etag(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Acepta listas y etiquetas débiles (W/"...") que añaden algunos proxies
+    candidatos = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return etag in candidatos
@@ -1,14 +1,20 @@
 import pymysql
 import math
-import statistics
-from typing import List, Dict, Any, Optional
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from app.servicios.servicio_simulacion import get_db_connection, simular_datos_json
+from app.db.ejecutor_db import en_hilo_db
+from app.servicios.servicio_detector_anomalias import detector_anomalias
+from app.servicios.servicio_resolucion import planificar, ejecutar_plan, describir_plan
+from app.servicios.servicio_archivo_parquet import leer_archivado
 
 # -----------------------------------------------------------------------------
 # 1. OBTENER ÚLTIMO VALOR (POLLING 5s)
 # -----------------------------------------------------------------------------
-async def obtener_ultimo_valor_db(campo_id: int) -> Optional[Dict[str, Any]]:
+@en_hilo_db
+def obtener_ultimo_valor_db(campo_id: int) -> Optional[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection()
@@ -33,19 +39,25 @@ async def obtener_ultimo_valor_db(campo_id: int) -> Optional[Dict[str, Any]]:
         if resultado:
             return resultado
             
-        return await _fallback_ultimo_valor_maestro(campo_id)
+        # Reutilizamos la misma conexión del pool para el fallback
+        return _fallback_ultimo_valor_maestro(campo_id, cursor)
 
     except Exception as e:
         print(f"❌ [DB Error] obtener_ultimo_valor: {e}")
-        return await _fallback_ultimo_valor_maestro(campo_id)
+        # La conexión pudo quedar inservible: la devolvemos antes de pedir otra
+        if conn:
+            conn.close()
+            conn = None
+        return _fallback_ultimo_valor_maestro(campo_id)
     finally:
         if conn: conn.close()
 
-async def _fallback_ultimo_valor_maestro(campo_id: int):
+def _fallback_ultimo_valor_maestro(campo_id: int, cursor=None):
     conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        if cursor is None:
+            conn = get_db_connection()
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
         sql = """
         SELECT v.campo_id, v.valor, v.fecha_hora_lectura, 
                cs.nombre AS nombre_campo, um.magnitud_tipo, um.simbolo AS simbolo_unidad
@@ -62,6 +74,134 @@ async def _fallback_ultimo_valor_maestro(campo_id: int):
     finally:
         if conn: conn.close()
 
+
+# -----------------------------------------------------------------------------
+# 1.1 ÚLTIMOS VALORES EN LOTE (un viaje para toda la pantalla)
+# -----------------------------------------------------------------------------
+@en_hilo_db
+def obtener_ultimos_valores_db(
+    campo_ids: Optional[List[int]] = None,
+    dispositivo_id: Optional[int] = None,
+    proyecto_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Último valor de varios campos: una lista de ids, todos los de un
+    dispositivo o todos los de un proyecto (se usa el primer filtro dado).
+    Sale de ultimo_valor_campo; solo los campos sin fila ahí (datos previos
+    al trigger) van a 'valores', todos en una misma consulta agrupada.
+    Cada fila lleva proyecto_id para que la ruta verifique permisos.
+    """
+    if campo_ids is not None:
+        if not campo_ids:
+            return []
+        filtro = f"cs.id IN ({', '.join(['%s'] * len(campo_ids))})"
+        params = list(campo_ids)
+    elif dispositivo_id is not None:
+        filtro, params = "s.dispositivo_id = %s", [dispositivo_id]
+    elif proyecto_id is not None:
+        filtro, params = "d.proyecto_id = %s", [proyecto_id]
+    else:
+        return []
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+
+        sql = f"""
+        SELECT
+            cs.id AS campo_id,
+            uv.ultimo_valor AS valor,
+            uv.fecha AS fecha_hora_lectura,
+            cs.nombre AS nombre_campo,
+            um.magnitud_tipo,
+            um.simbolo AS simbolo_unidad,
+            d.proyecto_id
+        FROM campos_sensores cs
+        JOIN sensores s ON cs.sensor_id = s.id
+        JOIN dispositivos d ON s.dispositivo_id = d.id
+        LEFT JOIN ultimo_valor_campo uv ON uv.campo_id = cs.id
+        LEFT JOIN unidades_medida um ON cs.unidad_medida_id = um.id
+        WHERE {filtro}
+        ORDER BY cs.id
+        """
+        cursor.execute(sql, params)
+        filas = cursor.fetchall()
+
+        # Fallback agrupado para los campos que no están en ultimo_valor_campo
+        sin_ultimo = [f['campo_id'] for f in filas if f['valor'] is None]
+        if sin_ultimo:
+            marcadores = ', '.join(['%s'] * len(sin_ultimo))
+            cursor.execute(
+                f"""
+                SELECT v.campo_id, v.valor, v.fecha_hora_lectura
+                FROM valores v
+                JOIN (
+                    SELECT campo_id, MAX(fecha_hora_lectura) AS fecha
+                    FROM valores
+                    WHERE campo_id IN ({marcadores})
+                    GROUP BY campo_id
+                ) ult ON v.campo_id = ult.campo_id AND v.fecha_hora_lectura = ult.fecha
+                """,
+                sin_ultimo
+            )
+            recuperados = {r['campo_id']: r for r in cursor.fetchall()}
+            for fila in filas:
+                r = recuperados.get(fila['campo_id'])
+                if r:
+                    fila['valor'] = r['valor']
+                    fila['fecha_hora_lectura'] = r['fecha_hora_lectura']
+
+        # Campos que nunca recibieron datos no se devuelven (igual que el 404 individual)
+        return [f for f in filas if f['valor'] is not None]
+
+    except Exception as e:
+        print(f"❌ [DB Error] obtener_ultimos_valores: {e}")
+        raise e
+    finally:
+        if conn: conn.close()
+
+
+@en_hilo_db
+def obtener_campos_ambito_db(
+    campo_ids: Optional[List[int]] = None,
+    dispositivo_id: Optional[int] = None,
+    proyecto_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Campos existentes del ámbito (con o sin datos) y su proyecto, para suscripciones."""
+    if campo_ids is not None:
+        if not campo_ids:
+            return []
+        filtro = f"cs.id IN ({', '.join(['%s'] * len(campo_ids))})"
+        params = list(campo_ids)
+    elif dispositivo_id is not None:
+        filtro, params = "s.dispositivo_id = %s", [dispositivo_id]
+    elif proyecto_id is not None:
+        filtro, params = "d.proyecto_id = %s", [proyecto_id]
+    else:
+        return []
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(
+            f"""
+            SELECT cs.id AS campo_id, d.proyecto_id
+            FROM campos_sensores cs
+            JOIN sensores s ON cs.sensor_id = s.id
+            JOIN dispositivos d ON s.dispositivo_id = d.id
+            WHERE {filtro}
+            """,
+            params
+        )
+        return cursor.fetchall()
+    except Exception as e:
+        print(f"❌ [DB Error] obtener_campos_ambito: {e}")
+        raise e
+    finally:
+        if conn: conn.close()
+
 # # -----------------------------------------------------------------------------
 # #  MOTOR DE ANÁLISIS 1: INDIVIDUAL (Tiempo Real / Polling)
 # # -----------------------------------------------------------------------------
@@ -172,108 +312,49 @@ async def detectar_anomalia_individual(campo_id: int, valor_actual: float) -> tu
     """
     Detecta anomalías usando un enfoque adaptativo según el tipo de dato.
     Para Movimiento: Compara la actividad reciente contra el PROMEDIO HISTÓRICO del lugar.
+
+    El estado del campo vive en memoria (detector_anomalias) y lo actualiza la
+    ingesta, así que el polling evalúa en O(1) sin consultar MySQL. Solo se
+    lee la historia de BD la primera vez o cuando el estado caduca.
     """
+    resultado = detector_anomalias.evaluar(campo_id)
+    if resultado is not None:
+        return resultado
+    return await sembrar_detector_campo_db(campo_id)
+
+
+@en_hilo_db
+def sembrar_detector_campo_db(campo_id: int) -> tuple[bool, Optional[str]]:
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(pymysql.cursors.DictCursor)
-        
-        # 1. Contexto histórico ampliado (300 registros ~ 25 minutos)
+
+        cursor.execute("SELECT nombre, tipo_valor FROM campos_sensores WHERE id = %s", (campo_id,))
+        campo = cursor.fetchone()
+        if not campo:
+            return False, None
+
+        # Contexto histórico ampliado (300 registros ~ 25 minutos)
         # Necesitamos suficiente historia para saber "qué es normal" en este lugar.
         sql = """
-        SELECT v.valor, cs.nombre, cs.tipo_valor 
-        FROM valores v 
-        JOIN campos_sensores cs ON v.campo_id = cs.id
-        WHERE v.campo_id = %s 
-        ORDER BY v.fecha_hora_lectura DESC 
+        SELECT v.valor
+        FROM valores v
+        WHERE v.campo_id = %s
+        ORDER BY v.fecha_hora_lectura DESC
         LIMIT 300
         """
         cursor.execute(sql, (campo_id,))
         rows = cursor.fetchall()
-        
-        if not rows or len(rows) < 20:
-            return False, None 
 
         # Detectar Tipo
-        tipo = (rows[0].get('tipo_valor') or '').lower()
-        nombre = (rows[0].get('nombre') or '').lower()
+        tipo = (campo.get('tipo_valor') or '').lower()
+        nombre = (campo.get('nombre') or '').lower()
         es_movimiento = 'bool' in tipo or 'movimiento' in nombre or 'estado' in nombre
 
-        # --- RAMA A: ANÁLISIS DE MOVIMIENTO (FACTOR DINÁMICO) ---
-        if es_movimiento:
-            # Ventana "Ahora" (Último minuto ~ 12 registros si polling=5s)
-            ventana_reciente = rows[:12]
-            actividad_actual = sum(float(r['valor']) for r in ventana_reciente) # Suma de 1s
-            
-            # Ventana "Base" (Los 24 minutos anteriores)
-            historia_base = rows[12:]
-            
-            # Calculamos el "Factor de Movimiento Normal" (Eventos por minuto promedio)
-            # Dividimos la historia en bloques de 1 minuto (12 registros)
-            bloques = [historia_base[i:i + 12] for i in range(0, len(historia_base), 12)]
-            sumas_bloques = [sum(float(r['valor']) for r in b) for b in bloques]
-            
-            # El promedio nos dice si este es un lugar "Quieto" (ej. 0.5) o "Movido" (ej. 20)
-            factor_normal = sum(sumas_bloques) / len(sumas_bloques) if sumas_bloques else 0
-            
-            # --- REGLAS ADAPTATIVAS ---
-            es_pico = False
-            mensaje = ""
-
-            # Escenario 1: Lugar Tranquilo (Factor < 2)
-            # Aquí cualquier ráfaga es sospechosa.
-            if factor_normal < 2:
-                if actividad_actual >= 5: # Si de repente hay 5 eventos o más
-                    es_pico = True
-                    mensaje = f"Actividad Inusual ({int(actividad_actual)}/min vs normal bajo)"
-
-            # Escenario 2: Lugar Concurrido (Factor > 10)
-            # Aquí se necesita MUCHA actividad para que sea "pico".
-            elif factor_normal > 10:
-                if actividad_actual > (factor_normal * 2.5): # 2.5 veces lo normal
-                    es_pico = True
-                    mensaje = f"Pico de Tráfico ({int(actividad_actual)} vs media {int(factor_normal)})"
-                
-                # Detección de "Muerte Súbita" (Caída a 0 en lugar concurrido)
-                if actividad_actual == 0:
-                    es_pico = True
-                    mensaje = "Caída de Actividad (0 eventos)"
-            
-            # Escenario 3: Lugar Promedio
-            else:
-                if actividad_actual > (max(factor_normal, 2) * 3): # Regla general 3x
-                    es_pico = True
-                    mensaje = f"Alta Actividad ({int(actividad_actual)} eventos)"
-
-            if es_pico:
-                return True, mensaje
-            
-            return False, None
-
-        # --- RAMA B: ANÁLISIS NUMÉRICO (Z-SCORE) ---
-        # (Se mantiene igual para temperatura, voltaje, etc.)
-        else:
-            datos_z = rows[:60] # Usamos 5 minutos para Z-Score
-            historial = [float(r['valor']) for r in datos_z]
-            
-            ventana_reciente = historial[:3] 
-            valor_suavizado = sum(ventana_reciente) / len(ventana_reciente)
-            
-            linea_base = historial[3:]
-            media_base = sum(linea_base) / len(linea_base)
-            varianza = sum([((x - media_base) ** 2) for x in linea_base]) / len(linea_base)
-            desviacion = math.sqrt(varianza)
-
-            if desviacion < 0.1: desviacion = 0.1
-
-            z_score = (valor_suavizado - media_base) / desviacion
-            UMBRAL = 3.0 
-
-            if abs(z_score) > UMBRAL:
-                tipo_pico = "ALTO" if z_score > 0 else "BAJO"
-                return True, f"Pico {tipo_pico} anómalo ({valor_suavizado:.1f})"
-            
-            return False, None
+        # El detector guarda la historia del más viejo al más reciente
+        historial = [float(r['valor']) for r in reversed(rows)]
+        return detector_anomalias.sembrar(campo_id, es_movimiento, historial)
 
     except Exception as e:
         print(f"⚠️ Error análisis realtime: {e}")
@@ -389,7 +470,8 @@ def aplicar_analisis_anomalias(datos: List[Dict[str, Any]]) -> List[Dict[str, An
 # -----------------------------------------------------------------------------
 # 2. VENTANA DE TIEMPO (Ancla en último dato)
 # -----------------------------------------------------------------------------
-async def obtener_valores_ventana_db(campo_id: int, minutos: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_valores_ventana_db(campo_id: int, minutos: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection()
@@ -440,6 +522,51 @@ async def obtener_valores_ventana_db(campo_id: int, minutos: int) -> List[Dict[s
 
 
 
+# -----------------------------------------------------------------------------
+# MOTOR DE ANÁLISIS 2: HISTÓRICO (vectorizado con NumPy)
+# -----------------------------------------------------------------------------
+RADIO_CONSUMO = 2  # Vecinos a cada lado para el Z-Score local
+
+
+def _ventanas_vecinos(valores: np.ndarray, radio: int):
+    """
+    Matriz (n, 2*radio+1) con los vecinos de cada punto y su máscara de validez
+    (los bordes de la serie tienen ventanas más cortas, igual que el slicing).
+    """
+    n = len(valores)
+    ancho = 2 * radio + 1
+    relleno = np.concatenate([np.zeros(radio), valores, np.zeros(radio)])
+    ventanas = sliding_window_view(relleno, ancho)
+    indices = np.arange(n)[:, None] + np.arange(-radio, radio + 1)[None, :]
+    validos = (indices >= 0) & (indices < n)
+    return ventanas, validos
+
+
+def _media_std_vecinos(valores: np.ndarray, radio: int):
+    """
+    Media y desviación local excluyendo los vecinos iguales al valor actual
+    (si todos son iguales se usa la ventana completa).
+    Se acumula columna por columna, de izquierda a derecha, para obtener
+    exactamente los mismos flotantes que la suma de Python sobre la lista.
+    """
+    ventanas, validos = _ventanas_vecinos(valores, radio)
+    limpios = validos & (ventanas != valores[:, None])
+    sin_limpios = ~limpios.any(axis=1)
+    limpios[sin_limpios] = validos[sin_limpios]
+
+    conteo = limpios.sum(axis=1)
+    suma = np.zeros(len(valores))
+    for col in range(ventanas.shape[1]):
+        suma = suma + np.where(limpios[:, col], ventanas[:, col], 0.0)
+    media = suma / conteo
+
+    suma_cuadrados = np.zeros(len(valores))
+    for col in range(ventanas.shape[1]):
+        suma_cuadrados = suma_cuadrados + np.where(limpios[:, col], (ventanas[:, col] - media) ** 2, 0.0)
+    std = np.sqrt(suma_cuadrados / conteo)
+    return media, std
+
+
 def aplicar_analisis_historico(
     datos: List[Dict[str, Any]], 
     config: Dict[str, float] = None
@@ -463,8 +590,13 @@ def aplicar_analisis_historico(
                   'iluminacion' in nombre_raw or 'amp' in tipo_raw or 'watt' in tipo_raw or 'kwh' in tipo_raw or 'lux' in tipo_raw)
 
     valores_float = [float(d['valor']) for d in datos]
+    valores = np.array(valores_float)
     n = len(valores_float)
 
+    # Cada caso produce la máscara de anomalías y el mensaje de cada índice marcado
+    anomalia = np.zeros(n, dtype=bool)
+    mensajes: Dict[int, str] = {}
+
     # -------------------------------------------------------------------------
     # CASO A: MOVIMIENTO (Densidad)
     # -------------------------------------------------------------------------
@@ -472,13 +604,9 @@ def aplicar_analisis_historico(
         media_total = sum(valores_float) / n
         umbral = max(5.0, media_total * 3.0) 
 
-        for d in datos:
-            val = float(d['valor'])
-            d['anomalia'] = False
-            d['mensaje_alerta'] = None
-            if val > umbral: 
-                d['anomalia'] = True
-                d['mensaje_alerta'] = f"Ráfaga de Actividad ({int(val)})"
+        anomalia = valores > umbral
+        for i in np.flatnonzero(anomalia).tolist():
+            mensajes[i] = f"Ráfaga de Actividad ({int(valores_float[i])})"
 
     # -------------------------------------------------------------------------
     # CASO B: TEMPERATURA Y HUMEDAD (Límites Fijos)
@@ -493,106 +621,73 @@ def aplicar_analisis_historico(
             MAX_LIMITE = config.get('hum_max', 60.0)
             unidad = "%"
 
-        for d in datos:
-            val = float(d['valor'])
-            d['anomalia'] = False
-            d['mensaje_alerta'] = None
-
-            if val == 0.0:
-                d['anomalia'] = True
-                d['mensaje_alerta'] = "Posible Error (0.0)"
-                continue
+        es_cero = valores == 0.0
+        alto = ~es_cero & (valores > MAX_LIMITE)
+        bajo = ~es_cero & ~alto & (valores < MIN_LIMITE)
+        anomalia = es_cero | alto | bajo
 
-            if val > MAX_LIMITE:
-                d['anomalia'] = True
-                d['mensaje_alerta'] = f"Alto: {val:.1f}{unidad}"
-            elif val < MIN_LIMITE:
-                d['anomalia'] = True
-                d['mensaje_alerta'] = f"Bajo: {val:.1f}{unidad}"
+        for i in np.flatnonzero(es_cero).tolist():
+            mensajes[i] = "Posible Error (0.0)"
+        for i in np.flatnonzero(alto).tolist():
+            mensajes[i] = f"Alto: {valores_float[i]:.1f}{unidad}"
+        for i in np.flatnonzero(bajo).tolist():
+            mensajes[i] = f"Bajo: {valores_float[i]:.1f}{unidad}"
 
     # -------------------------------------------------------------------------
     # CASO C: CONSUMO (Energía, Potencia, Corriente, Luz)
     # ESTRATEGIA: Z-Score LOCAL + Piso de Ruido Aprendido
     # -------------------------------------------------------------------------
     elif es_consumo:
-        try:
-            # 1. Aprender la ESCALA de los datos (no la varianza, solo la magnitud)
-            # Si la mediana es 5000W, un cambio de 1W es ruido. 
-            # Si la mediana es 5W, un cambio de 1W es enorme.
-            mediana_global = statistics.median(valores_float)
-            
-            # Piso de ruido dinámico: 10% de la mediana o un mínimo absoluto técnico
-            if mediana_global == 0: 
-                ruido_minimo = 0.1 # Caso borde: todo está apagado
-            else:
-                ruido_minimo = abs(mediana_global * 0.10) 
-
-        except statistics.StatisticsError:
-            ruido_minimo = 1.0
+        # 1. Aprender la ESCALA de los datos (no la varianza, solo la magnitud)
+        # Si la mediana es 5000W, un cambio de 1W es ruido. 
+        # Si la mediana es 5W, un cambio de 1W es enorme.
+        mediana_global = float(np.median(valores))
+
+        # Piso de ruido dinámico: 10% de la mediana o un mínimo absoluto técnico
+        if mediana_global == 0:
+            ruido_minimo = 0.1 # Caso borde: todo está apagado
+        else:
+            ruido_minimo = abs(mediana_global * 0.10)
 
-        # Ventana pequeña para reaccionar rápido a los picos de "sierra"
-        RADIO = 2 
+        # --- Contexto Local (ventana pequeña para reaccionar rápido a los picos de "sierra") ---
+        media_local, std_local = _media_std_vecinos(valores, RADIO_CONSUMO)
 
-        for i in range(n):
-            d = datos[i]
-            val = valores_float[i]
-            d['anomalia'] = False
-            d['mensaje_alerta'] = None
+        # 🟢 CLAVE DEL ÉXITO: 
+        # Usamos la desviación local, PERO si es muy pequeña (línea plana),
+        # usamos el "Piso de Ruido" que aprendimos de la mediana global.
+        sigma_efectiva = np.maximum(std_local, ruido_minimo)
+        z_score = (valores - media_local) / sigma_efectiva
 
-            # --- Contexto Local (Vecinos) ---
-            start = max(0, i - RADIO)
-            end = min(n, i + RADIO + 1)
-            vecinos = valores_float[start:end]
-            
-            # Quitamos el valor actual para no ensuciar el promedio de los vecinos
-            vecinos_limpios = [v for v in vecinos if v != val]
-            if not vecinos_limpios: vecinos_limpios = vecinos
-
-            media_local = sum(vecinos_limpios) / len(vecinos_limpios)
-            
-            # --- Desviación Local ---
-            varianza = sum([((x - media_local) ** 2) for x in vecinos_limpios]) / len(vecinos_limpios)
-            std_local = math.sqrt(varianza)
-            
-            # 🟢 CLAVE DEL ÉXITO: 
-            # Usamos la desviación local, PERO si es muy pequeña (línea plana),
-            # usamos el "Piso de Ruido" que aprendimos de la mediana global.
-            sigma_efectiva = max(std_local, ruido_minimo)
+        # Umbral 3.0: Detecta anomalías claras
+        fuera = np.abs(z_score) > 3.0
+        pico = fuera & (valores > media_local)
+        # Solo marcamos caídas si realmente bajan mucho
+        caida = fuera & ~pico & (valores < media_local * 0.5)
+        anomalia = pico | caida
 
-            # Cálculo Z-Score Local
-            distancia = val - media_local
-            z_score = distancia / sigma_efectiva
-
-            # Umbral 3.0: Detecta anomalías claras
-            if abs(z_score) > 3.0:
-                d['anomalia'] = True
-                if val > media_local:
-                    d['mensaje_alerta'] = f"Pico: {val:.2f} (Ref: {media_local:.2f})"
-                else:
-                    # Solo marcamos caídas si realmente bajan mucho
-                    if val < (media_local * 0.5): 
-                        d['mensaje_alerta'] = f"Caída: {val:.2f} (Ref: {media_local:.2f})"
-                    else:
-                        d['anomalia'] = False # Falsa alarma (bajada suave)
+        for i in np.flatnonzero(pico).tolist():
+            mensajes[i] = f"Pico: {valores_float[i]:.2f} (Ref: {float(media_local[i]):.2f})"
+        for i in np.flatnonzero(caida).tolist():
+            mensajes[i] = f"Caída: {valores_float[i]:.2f} (Ref: {float(media_local[i]):.2f})"
 
     # -------------------------------------------------------------------------
     # CASO D: RESTO (Fallback Genérico)
     # -------------------------------------------------------------------------
     else:
-        # Z-Score Global Simple
+        # Z-Score Global Simple (sumas con sum() de Python: mismos flotantes que antes)
         media = sum(valores_float) / n
-        varianza = sum([((x - media) ** 2) for x in valores_float]) / n
+        varianza = sum(((valores - media) ** 2).tolist()) / n
         std_dev = math.sqrt(varianza)
         if std_dev < 0.1: std_dev = 0.1
         
-        for d in datos:
-            val = float(d['valor'])
-            z_score = (val - media) / std_dev
-            d['anomalia'] = False
-            d['mensaje_alerta'] = None
-            if abs(z_score) > 3.5:
-                d['anomalia'] = True
-                d['mensaje_alerta'] = f"Valor atípico: {val:.2f}"
+        anomalia = np.abs((valores - media) / std_dev) > 3.5
+        for i in np.flatnonzero(anomalia).tolist():
+            mensajes[i] = f"Valor atípico: {valores_float[i]:.2f}"
+
+    # 3. Volcar resultados (única pasada en Python)
+    for i, (d, es_anomalia) in enumerate(zip(datos, anomalia.tolist())):
+        d['anomalia'] = es_anomalia
+        d['mensaje_alerta'] = mensajes.get(i) if es_anomalia else None
 
     return datos
 
@@ -858,7 +953,32 @@ def aplicar_analisis_historico(
 # -----------------------------------------------------------------------------
 # 3. HISTÓRICO (OPTIMIZADO)
 # -----------------------------------------------------------------------------
-async def obtener_historico_campo_db(
+def _unir_archivadas(
+    filas: List[Dict[str, Any]], archivadas: List[Dict[str, Any]], info_campo: Optional[Dict[str, Any]], por_minuto: bool
+) -> List[Dict[str, Any]]:
+    """Une las lecturas de MySQL con las archivadas en Parquet, con el mismo formato y orden."""
+    if not archivadas:
+        return filas
+    info = {
+        "nombre_campo": (info_campo or {}).get('nombre'),
+        "magnitud_tipo": (info_campo or {}).get('magnitud_tipo'),
+        "simbolo_unidad": (info_campo or {}).get('simbolo'),
+    }
+    if not por_minuto:
+        unidas = filas + [dict(fila, **info) for fila in archivadas]
+        return sorted(unidas, key=lambda fila: fila['fecha_hora_lectura'])
+
+    # Movimiento: suma por minuto, con la misma clave de texto que DATE_FORMAT
+    por_clave: Dict[str, Dict[str, Any]] = {fila['fecha_hora_lectura']: dict(fila) for fila in filas}
+    for fila in archivadas:
+        clave = fila['fecha_hora_lectura'].strftime('%Y-%m-%d %H:%M:00')
+        acumulada = por_clave.setdefault(clave, dict(info, fecha_hora_lectura=clave, valor=0.0))
+        acumulada['valor'] = float(acumulada['valor'] or 0) + fila['valor']
+    return [por_clave[clave] for clave in sorted(por_clave)]
+
+
+@en_hilo_db
+def obtener_historico_campo_db(
     campo_id: int, fecha_inicio: datetime, fecha_fin: datetime, metodo_carga: str = 'optimizado'
 ) -> List[Dict[str, Any]]:
     conn = None
@@ -870,8 +990,18 @@ async def obtener_historico_campo_db(
             print(f" [DB] Modo: PURO (Analizando tipo de dato...)")
             
             # A. Identificar si es Movimiento
-            cursor.execute("SELECT nombre, unidad_medida_id FROM campos_sensores WHERE id = %s", (campo_id,))
+            cursor.execute(
+                """
+                SELECT cs.nombre, cs.unidad_medida_id, um.magnitud_tipo, um.simbolo
+                FROM campos_sensores cs LEFT JOIN unidades_medida um ON cs.unidad_medida_id = um.id
+                WHERE cs.id = %s
+                """,
+                (campo_id,)
+            )
             info_campo = cursor.fetchone()
+
+            # Días archivados en Parquet: ya no están en 'valores', se unen al resultado
+            archivadas = leer_archivado(cursor, campo_id, fecha_inicio, fecha_fin)
             
             # Limpieza preventiva del cursor
             # cursor.fetchall() 
@@ -905,7 +1035,7 @@ async def obtener_historico_campo_db(
                 ORDER BY fecha_hora_lectura ASC;
                 """
                 cursor.execute(sql, (campo_id, fecha_inicio, fecha_fin))
-                return cursor.fetchall()
+                return _unir_archivadas(cursor.fetchall(), archivadas, info_campo, por_minuto=True)
 
             else:
                 # Aquí sí queremos cada milímetro de variación, traemos todo crudo.
@@ -924,7 +1054,7 @@ async def obtener_historico_campo_db(
                 ) AS sub ORDER BY sub.fecha_hora_lectura ASC;
                 """
                 cursor.execute(sql, (campo_id, fecha_inicio, fecha_fin))
-                return cursor.fetchall()
+                return _unir_archivadas(cursor.fetchall(), archivadas, info_campo, por_minuto=False)
 
         else:
             # ---------------------------------------------------------
@@ -1059,10 +1189,35 @@ async def obtener_historico_campo_db(
 #     finally:
 #         if conn: conn.close()
 
+@en_hilo_db
+def obtener_historico_planificado_db(
+    campo_id: int, fecha_inicio: datetime, fecha_fin: datetime, max_puntos: int
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    metodo_carga='auto': el planificador elige la fuente más barata que
+    respeta el presupuesto de puntos (crudo, minuto, hora, día) y une los
+    agregados con los datos crudos aún no agregados. Devuelve (filas, plan).
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+
+        plan = planificar(cursor, campo_id, fecha_inicio, fecha_fin, max_puntos)
+        print(f" [DB] Modo: AUTO -> {describir_plan(plan)} (~{plan['registros_estimados']} registros crudos)")
+        return ejecutar_plan(cursor, campo_id, plan), plan
+
+    except Exception as e:
+        print(f"❌ [DB Error] historico auto: {e}")
+        raise e
+    finally:
+        if conn: conn.close()
+
 # -----------------------------------------------------------------------------
 # 4. RANGO DE FECHAS
 # -----------------------------------------------------------------------------
-async def obtener_rango_fechas_db(dispositivo_id: int) -> Dict[str, Any]:
+@en_hilo_db
+def obtener_rango_fechas_db(dispositivo_id: int) -> Dict[str, Any]:
     conn = None
     try:
         conn = get_db_connection()
@@ -9,6 +9,7 @@ import pymysql.cursors # Y el cursor para diccionarios
 
 # --- Importa la configuración (pero no la función de conexión) ---
 from app.configuracion import configuracion # Solo necesitamos la instancia de configuración
+from app.db.ejecutor_db import en_hilo_db
 
 # --- Función de conexión a la base de datos (INTERNA a este módulo) ---
 def get_db_connection_local():
@@ -28,7 +29,8 @@ def get_db_connection_local():
 
 
 # --- Funciones de consulta de datos (AHORA LLAMAN A get_db_connection_local) ---
-async def obtener_proyectos() -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_proyectos() -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection_local() # O get_db_connection() si volviste a centralizarla
@@ -45,7 +47,8 @@ async def obtener_proyectos() -> List[Dict[str, Any]]:
         if conn:
             conn.close()
 
-async def obtener_dispositivos_por_proyecto(proyecto_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_dispositivos_por_proyecto(proyecto_id: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection_local() # ¡Cambio aquí!
@@ -61,7 +64,8 @@ async def obtener_dispositivos_por_proyecto(proyecto_id: int) -> List[Dict[str,
         if conn:
             conn.close()
 
-async def obtener_sensores_por_dispositivo(dispositivo_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_sensores_por_dispositivo(dispositivo_id: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection_local() # ¡Cambio aquí!
@@ -77,7 +81,8 @@ async def obtener_sensores_por_dispositivo(dispositivo_id: int) -> List[Dict[str
         if conn:
             conn.close()
 
-async def obtener_campos_por_sensor(sensor_id: int) -> List[Dict[str, Any]]:
+@en_hilo_db
+def obtener_campos_por_sensor(sensor_id: int) -> List[Dict[str, Any]]:
     conn = None
     try:
         conn = get_db_connection_local() # ¡Cambio aquí!
@@ -119,7 +124,8 @@ async def extract_csv_preview(file_content: bytes) -> Dict[str, Any]:
 
 # ... (resto de importaciones y funciones) ...
 
-async def simular_datos_csv(
+@en_hilo_db(timeout=None)
+def simular_datos_csv(
     file_content: bytes,
     sensor_mappings: List[Dict[str, Any]],
     proyecto_id: int,